@@ -0,0 +1,338 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import backend_logic as logic
+import item_cache
+import query_stats
+import storage_engine
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+ASYNC_POOL_MAX_SIZE = 20  # 同時に使うPostgreSQL接続の上限（あふれた問い合わせはループの中で空きを待つ）
+ASYNC_TIMEOUT = 5.0  # 読み取り1回の既定のタイムアウト（秒）
+EXECUTOR_WORKERS = logic.POOL_MAX_SIZE  # 同期版を裏で動かすスレッド数（書き込み・SQLite・Windows用）
+
+
+# ==================================================================================
+# 非同期モードの psycopg2 接続
+# ==================================================================================
+def _set_ready(future):
+    # 読み書きできる間は何度も呼ばれるので、最初の1回だけ結果を入れる
+    if not future.done():
+        future.set_result(None)
+
+
+async def _wait_ready(conn):
+    """接続・問い合わせが終わるまで、ソケットが読み書きできるようになるのをループの中で待つ"""
+    extensions = logic.psycopg2.extensions
+    loop = asyncio.get_running_loop()
+    while True:
+        state = conn.poll()
+        if state == extensions.POLL_OK:
+            return
+        fileno = conn.fileno()
+        ready = loop.create_future()
+        if state == extensions.POLL_READ:
+            loop.add_reader(fileno, _set_ready, ready)
+            remove = loop.remove_reader
+        elif state == extensions.POLL_WRITE:
+            loop.add_writer(fileno, _set_ready, ready)
+            remove = loop.remove_writer
+        else:
+            raise logic.psycopg2.OperationalError(f"poll() の戻り値が不正です: {state}")
+        try:
+            await ready
+        finally:
+            remove(fileno)
+
+
+async def _execute(conn, sql, params):
+    """1文実行して (列名のリスト, 行のリスト) を返す"""
+    cursor = conn.cursor()
+    cursor.execute(sql, params)
+    await _wait_ready(conn)
+    columns = [column.name for column in cursor.description]
+    rows = cursor.fetchall()
+    cursor.close()
+    return columns, rows
+
+
+def _cancel_and_close(conn):
+    """サーバーで実行中の問い合わせを取り消してから接続を閉じる（裏のスレッドで呼ぶ）"""
+    try:
+        conn.cancel()
+    except Exception:
+        pass
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class AsyncConnectionPool:
+    """
+    非同期モードの psycopg2 接続を使い回すプール（作ったイベントループの中だけで使う）
+
+    - 同時に使う接続は max_size 本まで。あふれた問い合わせはスレッドを使わずにループの中で待つ
+    - 問い合わせ中にタスクが取り消されたら（タイムアウトを含む）、サーバー側の問い合わせも取り消して接続を捨てる
+    - 待機中の接続が死んでいたら（DB再起動など）、待機中の分をまとめて捨て、新しい接続で1回だけやり直す
+    - 非同期モードの接続は自動コミットなので、読み取りにだけ使う
+    """
+
+    def __init__(
+        self,
+        max_size=ASYNC_POOL_MAX_SIZE,
+        acquire_timeout=logic.POOL_ACQUIRE_TIMEOUT,
+        max_lifetime=logic.POOL_MAX_LIFETIME,
+    ):
+        if max_size < 1:
+            raise ValueError("プールサイズの指定が不正です。")
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.max_lifetime = max_lifetime
+
+        self._slots = asyncio.Semaphore(max_size)
+        self._idle = []  # (接続, 作成時刻)。末尾が最後に返却された接続（LIFO）
+        self._closed = False
+
+    async def fetch(self, sql, params=None):
+        """sql を1文実行して (列名のリスト, 行のリスト) を返す"""
+        with query_stats.phase("acquire"):
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+            except asyncio.TimeoutError:
+                raise logic.PoolTimeoutError(
+                    "データベース接続の空きがありません。しばらくしてから再度お試しください。"
+                ) from None
+        try:
+            for retry in (True, False):
+                with query_stats.phase("acquire"):
+                    entry, reused = await self._take()
+                try:
+                    with query_stats.phase("execute"):
+                        result = await _execute(entry[0], sql, params)
+                except (logic.psycopg2.OperationalError, logic.psycopg2.InterfaceError):
+                    # 通信断など：この接続は二度と使わない
+                    self._discard(entry)
+                    self._discard_idle()
+                    if retry and reused:
+                        continue
+                    raise
+                except logic.psycopg2.Error:
+                    # SQLのエラー（自動コミットなので接続はそのまま使える）
+                    self._put_back(entry)
+                    raise
+                except BaseException:
+                    # 取り消し・タイムアウト：問い合わせがサーバーで続かないようにして捨てる
+                    self._abandon(entry)
+                    raise
+                self._put_back(entry)
+                return result
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """待機中の接続をすべて閉じる（使用中の接続は返却されたときに閉じる）"""
+        self._closed = True
+        self._discard_idle()
+
+    # ---------------------------------------------------------
+    # 内部処理
+    # ---------------------------------------------------------
+    async def _take(self):
+        """(接続, 使い回しか) を返す。寿命切れの接続は捨てる"""
+        if self._closed:
+            raise logic.PoolTimeoutError("コネクションプールは終了しています。")
+        now = time.monotonic()
+        while self._idle:
+            conn, created_at = self._idle.pop()
+            if not conn.closed and now - created_at <= self.max_lifetime:
+                return (conn, created_at), True
+            self._discard((conn, created_at))
+        return (await self._connect(), time.monotonic()), False
+
+    async def _connect(self):
+        logic._import_psycopg2()
+        conn = logic.psycopg2.connect(
+            host=logic.DB_HOST,
+            port=logic.DB_PORT,
+            database=logic.DB_NAME,
+            user=logic.DB_USER,
+            password=logic.DB_PASS,
+            async_=True,
+        )
+        try:
+            await _wait_ready(conn)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def _put_back(self, entry):
+        if self._closed or entry[0].closed:
+            self._discard(entry)
+        else:
+            self._idle.append(entry)
+
+    def _discard(self, entry):
+        try:
+            entry[0].close()
+        except Exception:
+            pass
+
+    def _discard_idle(self):
+        idle, self._idle = self._idle, []
+        for entry in idle:
+            self._discard(entry)
+
+    def _abandon(self, entry):
+        # 取り消し要求は別の接続を開いて送る（ブロックする）ので、ループを止めないよう裏で送る
+        try:
+            asyncio.get_running_loop().run_in_executor(None, _cancel_and_close, entry[0])
+        except RuntimeError:
+            self._discard(entry)
+
+
+# ==================================================================================
+# 非同期版の窓口
+# ==================================================================================
+class AsyncInventory:
+    """
+    backend_logic の読み書きを、イベントループを止めずに await で呼べるようにする窓口
+
+        async with async_logic.AsyncInventory() as inventory:
+            models = await inventory.get_autocomplete_suggestions("型番", "AB")
+
+    - PostgreSQLの読み取りは非同期モードの接続で行うので、何百件同時に待ってもスレッドは増えない
+    - 書き込みと、SQLite・add_reader の無いイベントループ（Windowsの既定）での読み取りは、
+      同期版を裏のスレッドで動かす
+    - timeout 秒を過ぎると asyncio.TimeoutError になる（呼び出したタスクを取り消した場合と同じく、
+      PostgreSQLの読み取りならサーバーで実行中の問い合わせも取り消す）
+    """
+
+    def __init__(
+        self,
+        max_connections=ASYNC_POOL_MAX_SIZE,
+        timeout=ASYNC_TIMEOUT,
+        executor_workers=EXECUTOR_WORKERS,
+    ):
+        """
+        :param max_connections: 読み取りに同時に使うPostgreSQL接続の上限
+        :param timeout: 読み取り1回の既定のタイムアウト（秒。None なら待ち続ける）
+        :param executor_workers: 同期版を動かすスレッド数
+        """
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._pool = None
+        self._executor = ThreadPoolExecutor(
+            max_workers=executor_workers, thread_name_prefix="async-logic"
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """接続を閉じる（書き込み中の分は裏で最後まで続く）"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+        self._executor.shutdown(wait=False)
+
+    # ---------------------------------------------------------
+    # 読み取り
+    # ---------------------------------------------------------
+    async def get_autocomplete_suggestions(
+        self, column_name, search_term, limit=logic.SUGGESTION_LIMIT, timeout=None
+    ):
+        """backend_logic.get_autocomplete_suggestions の非同期版"""
+        if not self._uses_async_connections():
+            return await self._wait(
+                self._run_blocking(
+                    logic.get_autocomplete_suggestions, column_name, search_term, limit
+                ),
+                timeout,
+            )
+        if column_name not in logic.SEARCHABLE_COLUMNS:
+            raise ValueError(f"サジェスト対象外の列です: {column_name}")
+        if not search_term:
+            return []
+        return await self._wait(self._suggestions(column_name, search_term, limit), timeout)
+
+    async def get_item_details_by_model(self, model_number, timeout=None):
+        """backend_logic.get_item_details_by_model の非同期版（型番詳細キャッシュも共有する）"""
+        if not self._uses_async_connections():
+            return await self._wait(
+                self._run_blocking(logic.get_item_details_by_model, model_number), timeout
+            )
+        return await self._wait(self._item_details(model_number), timeout)
+
+    # ---------------------------------------------------------
+    # 書き込み
+    # ---------------------------------------------------------
+    async def run_main_process_from_ui(self, input_data, timeout=None):
+        """
+        backend_logic.run_main_process_from_ui の非同期版（結果も同じ形）
+
+        DBが遅い・つながらないときは同期版と同じくジャーナルに回して返るので、timeout の既定は無し。
+        timeout・取り消しは結果を待つのをやめるだけで、書き込みそのものは裏で最後まで続く
+        """
+        call = self._run_blocking(logic.run_main_process_from_ui, input_data)
+        if timeout is None:
+            return await call
+        return await asyncio.wait_for(call, timeout)
+
+    # ---------------------------------------------------------
+    # 内部処理
+    # ---------------------------------------------------------
+    def _uses_async_connections(self):
+        """PostgreSQLの読み取りを非同期モードの接続で行えるか"""
+        if logic.DB_ENGINE != logic.PostgresEngine.name:
+            return False
+        # ProactorEventLoop（Windowsの既定）はソケットの読み書き待ち（add_reader）ができない
+        proactor = getattr(asyncio, "ProactorEventLoop", None)
+        return proactor is None or not isinstance(asyncio.get_running_loop(), proactor)
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = AsyncConnectionPool(max_size=self.max_connections)
+        return self._pool
+
+    def _run_blocking(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _wait(self, awaitable, timeout):
+        timeout = self.timeout if timeout is None else timeout
+        return await asyncio.wait_for(awaitable, timeout)
+
+    async def _suggestions(self, column_name, search_term, limit):
+        params = {
+            "pattern": storage_engine.escape_like(search_term) + "%",
+            "limit": limit,
+            "scan": storage_engine.POPULARITY_SCAN_LIMIT,
+        }
+        pool = self._get_pool()
+        with logic.get_query_stats().track(f"suggestions:{column_name}"):
+            _, rows = await pool.fetch(logic.SUGGESTIONS_SQL.format(column=column_name), params)
+            popular, alphabetical = rows[0]
+            suggestions = storage_engine.merge_suggestions(popular, alphabetical, limit)
+            query_stats.add_rows(len(suggestions))
+        return suggestions
+
+    async def _item_details(self, model_number):
+        with logic.get_query_stats().track("item_details"):
+            cache = logic.get_item_cache()
+            item, generation = cache.lookup(model_number)
+            if item is not item_cache.MISSING:
+                return item
+            columns, rows = await self._get_pool().fetch(
+                logic.ITEM_DETAILS_SQL, (model_number,)
+            )
+            item = dict(zip(columns, rows[0])) if rows else None
+            query_stats.add_rows(len(rows))
+            cache.store(model_number, item, generation)
+        return dict(item) if item else None
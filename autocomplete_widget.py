@@ -1,5 +1,19 @@
 import tkinter as tk
 from tkinter import ttk
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+# 候補検索を実行するワーカースレッド（全ての入力欄と、型番確定時の詳細の読み込みで共有する）
+_lookup_executor = None
+
+
+def get_lookup_executor():
+    global _lookup_executor
+    if _lookup_executor is None:
+        _lookup_executor = ThreadPoolExecutor(
+            max_workers=2, thread_name_prefix="autocomplete"
+        )
+    return _lookup_executor
 
 
 class AutocompleteEntry(ttk.Entry):
@@ -10,6 +24,8 @@ class AutocompleteEntry(ttk.Entry):
         column_name,
         on_select_callback=None,
         font=None,
+        debounce_ms=150,
+        poll_ms=20,
         **kwargs
     ):
         """
@@ -18,12 +34,24 @@ class AutocompleteEntry(ttk.Entry):
         :param column_name: DBの検索対象カラム名 ("型番" など)
         :param on_select_callback: 確定したときに呼び出す関数 (自動入力用)
         :param font: フォント設定
+        :param debounce_ms: 入力が止まってから検索を始めるまでの待ち時間（ミリ秒）
+        :param poll_ms: 検索結果が出たかを確認する間隔（ミリ秒）
         """
         super().__init__(master, font=font, **kwargs)
         self.get_suggestions_func = get_suggestions_func
         self.column_name = column_name
         self.on_select_callback = on_select_callback
         self.font = font
+        self.debounce_ms = debounce_ms
+        self.poll_ms = poll_ms
+
+        # 非同期検索の状態
+        # 検索を始めるたびに番号を進め、古い番号の結果は捨てる
+        self._debounce_id = None
+        self._poll_id = None
+        self._request_seq = 0
+        self._pending = None  # (番号, 検索語, Future)
+        self._shown_text = None  # 今Listboxに出している候補の検索語
 
         # 候補表示用のListbox（最初は隠しておく）
         # Toplevelではなく、同じフレーム内に配置して最前面に表示する方式
@@ -43,24 +71,89 @@ class AutocompleteEntry(ttk.Entry):
         self.listbox.bind("<<ListboxSelect>>", self._on_listbox_click)
 
     def _on_key_release(self, event):
-        """文字が打たれたら候補を検索して表示"""
+        """文字が打たれたら、入力が落ち着くのを待ってから候補を検索する"""
         # 特殊キー（矢印やエンター）は無視
         if event.keysym in ("Down", "Up", "Return", "Tab"):
             return
 
+        self._cancel_lookup()
+
+        typed_text = self.get()
+        if not typed_text:
+            self._hide_listbox()
+            return
+
+        # 連続で打鍵している間は検索しない（最後のキーから debounce_ms 後に1回だけ）
+        self._debounce_id = self.after(self.debounce_ms, self._start_lookup)
+
+    # ---------------------------------------------------------
+    # 非同期検索（Tkのメインスレッドを止めない）
+    # ---------------------------------------------------------
+    def _start_lookup(self):
+        """ワーカースレッドで候補検索を始め、結果を after() で待つ"""
+        self._debounce_id = None
         typed_text = self.get()
         if not typed_text:
             self._hide_listbox()
             return
+        if self.listbox_open and typed_text == self._shown_text:
+            return  # Shiftキーなど、文字が変わらないキーでは検索し直さない
+
+        self._request_seq += 1
+        future = get_lookup_executor().submit(
+            self.get_suggestions_func, self.column_name, typed_text
+        )
+        self._pending = (self._request_seq, typed_text, future)
+        self._poll_id = self.after(self.poll_ms, self._poll_lookup, self._request_seq)
+
+    def _poll_lookup(self, seq):
+        """検索が終わっていれば結果を表示する（メインスレッドで実行される）"""
+        self._poll_id = None
+        if self._pending is None or self._pending[0] != seq:
+            return  # 新しい検索に置き換わった
+
+        _, typed_text, future = self._pending
+        if not future.done():
+            self._poll_id = self.after(self.poll_ms, self._poll_lookup, seq)
+            return
 
-        # DBから候補を取得
-        suggestions = self.get_suggestions_func(self.column_name, typed_text)
+        self._pending = None
+        if future.cancelled() or typed_text != self.get():
+            return
 
+        error = future.exception()
+        if error is not None:
+            logging.error(
+                "候補の取得に失敗しました",
+                exc_info=(type(error), error, error.__traceback__),
+            )
+            self._hide_listbox()
+            return
+
+        suggestions = future.result()
         if suggestions:
             self._show_listbox(suggestions)
+            self._shown_text = typed_text
         else:
             self._hide_listbox()
 
+    def _cancel_lookup(self):
+        """待機中・実行中の検索を取り消す（実行中のものは結果を無視する）"""
+        if self._debounce_id is not None:
+            self.after_cancel(self._debounce_id)
+            self._debounce_id = None
+        if self._poll_id is not None:
+            self.after_cancel(self._poll_id)
+            self._poll_id = None
+        if self._pending is not None:
+            self._pending[2].cancel()  # まだ始まっていなければ実行されない
+            self._pending = None
+        self._request_seq += 1
+
+    def destroy(self):
+        self._cancel_lookup()
+        super().destroy()
+
     def _show_listbox(self, suggestions):
         """Listboxを表示・更新する"""
         self.listbox.delete(0, tk.END)
@@ -80,6 +173,7 @@ class AutocompleteEntry(ttk.Entry):
         """Listboxを隠す"""
         self.listbox.place_forget()
         self.listbox_open = False
+        self._shown_text = None
 
     def _on_down(self, event):
         """下矢印キー：フォーカスはEntryのまま、Listboxの選択を下げる"""
@@ -131,6 +225,7 @@ class AutocompleteEntry(ttk.Entry):
 
     def _confirm_selection(self, text):
         """確定処理"""
+        self._cancel_lookup()
         self.delete(0, tk.END)
         self.insert(0, text)
         self._hide_listbox()
@@ -141,4 +236,5 @@ class AutocompleteEntry(ttk.Entry):
 
     def _on_focus_out(self, event):
         """フォーカスが外れたらリストを消す（少し遅らせないとクリック判定と競合する）"""
+        self._cancel_lookup()
         self.after(100, self._hide_listbox)
@@ -1,73 +1,1342 @@
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import configparser
+import logging
 import os
-from datetime import datetime
+import atexit
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+# psycopg2 は読み込みに時間がかかる（起動が遅くなる）ので、
+# PostgreSQLに初めて接続するときに _import_psycopg2() で読み込む
+# SQLiteだけで使う場合は psycopg2 が無くても動く
+psycopg2 = None
+RealDictCursor = None
+execute_values = None
+
+import item_cache
+import query_stats
+import storage_engine
+import write_journal
 
 # ==================================================================================
 # 設定読み込み
 # ==================================================================================
-# ※Postgresの場合はconfig.iniを使わず、コード内で接続情報を管理するか、
-# 環境変数を使うのが一般的だが、今回はハードコードで進める
-DB_HOST = "localhost"
-DB_NAME = "postgres"
-DB_USER = "postgres"
-DB_PASS = "password"
+# config.ini はこのファイルと同じフォルダに置く（exeを作り直さずに接続先を変えられる）
+#   [DATABASE]
+#   engine = postgresql  … PostgreSQLサーバーを使う（既定）
+#   engine = sqlite      … path のファイルに直接読み書きする（サーバー不要）
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_FILE = os.path.join(BASE_DIR, "config.ini")
+
+_config = configparser.ConfigParser()
+_config.read(CONFIG_FILE, encoding="utf-8")
+
+DB_ENGINE = _config.get("DATABASE", "engine", fallback="postgresql")
+DB_FILE = os.path.join(BASE_DIR, _config.get("DATABASE", "path", fallback="inventory.db"))
+SQLITE_JOURNAL_MODE = _config.get(
+    "DATABASE", "journal_mode", fallback=storage_engine.SQLITE_JOURNAL_MODE
+)
+
+DB_HOST = _config.get("POSTGRESQL", "host", fallback="localhost")
+DB_PORT = _config.get("POSTGRESQL", "port", fallback="5432")
+DB_NAME = _config.get("POSTGRESQL", "dbname", fallback="postgres")
+DB_USER = _config.get("POSTGRESQL", "user", fallback="postgres")
+DB_PASS = _config.get("POSTGRESQL", "password", fallback="password")
+
+# 共有サーバー（inventory_server.py）を使う端末は、DBの代わりにこのURLへつなぐ（空ならDBに直接つなぐ）
+#   [SERVER]
+#   url = http://192.168.0.10:8765
+SERVER_URL = _config.get("SERVER", "url", fallback="")
+
+# DBにつながらない・この時間（ミリ秒）待っても書き込みが終わらないときは、
+# 入出庫をこの端末のジャーナルに記録して先に進み、つながったら裏で送る
+JOURNAL_FILE = os.path.join(
+    BASE_DIR, _config.get("JOURNAL", "path", fallback="write_journal.jsonl")
+)
+JOURNAL_LATENCY_MS = _config.getfloat("JOURNAL", "latency_ms", fallback=3000)
+JOURNAL_BATCH_SIZE = write_journal.REPLAY_BATCH_SIZE
+
+# これより時間のかかったDB処理を app.log に記録する（ミリ秒）
+SLOW_QUERY_MS = _config.getfloat(
+    "LOGGING", "slow_query_ms", fallback=query_stats.SLOW_QUERY_MS
+)
+
+# コネクションプール設定
+# キー入力のたびに接続（TCP＋認証）をやり直さないよう、接続を使い回す
+#   [POOL]
+#   max_size = 10 … 端末が多い・サーバーの max_connections が小さいときに調整する
+POOL_MIN_SIZE = _config.getint("POOL", "min_size", fallback=1)  # 常に確保しておく接続数
+POOL_MAX_SIZE = _config.getint("POOL", "max_size", fallback=10)  # 同時に貸し出せる接続数の上限
+# 空き接続を待つ最大秒数
+POOL_ACQUIRE_TIMEOUT = _config.getfloat("POOL", "acquire_timeout", fallback=10.0)
+# これ以上使われていない接続は貸出前に生存確認する（秒）
+POOL_HEALTH_CHECK_INTERVAL = _config.getfloat("POOL", "health_check_interval", fallback=30.0)
+# 最小数を超えた遊休接続を閉じるまでの秒数
+POOL_IDLE_TIMEOUT = _config.getfloat("POOL", "idle_timeout", fallback=300.0)
+# これより古い接続は作り直す（秒）
+POOL_MAX_LIFETIME = _config.getfloat("POOL", "max_lifetime", fallback=3600.0)
+
+# 何か月先までの履歴パーティションを用意しておくか
+# （起動時と、月が変わって最初の入出庫のときに、足りなければ作る。create_postgres_tables.py も同じ）
+HISTORY_MONTHS_AHEAD = 3
+# パーティションを作れなかったとき（権限が無い・ロック待ちなど）に、次に試すまでの秒数
+HISTORY_PARTITION_RETRY_SECONDS = 3600
+HISTORY_PARTITION_LOCK_TIMEOUT_MS = 2000
+
+# サジェスト検索を許可する列（列名はSQLに埋め込むので、必ずこの中から選ぶ）
+SEARCHABLE_COLUMNS = ("型番", "製品名", "カテゴリ", "メーカー")
+SUGGESTION_LIMIT = 50  # 1回のサジェストで返す候補の最大数
+# 途中の一部分・打ち間違いでも探せる列（全角/半角・カタカナ/ひらがなの違いも無視する）
+FUZZY_SEARCH_COLUMNS = tuple(storage_engine.SEARCH_KEY_COLUMNS)
+
+# 在庫一覧（inventory_browser.py）で1回に読む行数
+INVENTORY_PAGE_SIZE = 200
+
+# 発注点アラート
+STOCK_ALERT_CHANNEL = "stock_alert"  # create_postgres_tables.py のトリガーが送るチャンネル
+STOCK_ALERT_LIMIT = 100  # 1回に読むアラートの最大数
+
+# 過去の在庫数のチェックポイント（月初めの0時0分0秒ごとに、全型番の在庫数を保存する）
+# 端末に記録した入出庫は後から元の日時で届くので、この日数より新しい月初めにはまだ作らない
+CHECKPOINT_LAG_DAYS = 7
+
+# 型番詳細キャッシュ（在庫が変わるとDBからの通知で自動的に捨てられる）
+ITEM_CACHE_SIZE = item_cache.CACHE_MAX_SIZE
+ITEM_CACHE_TTL = item_cache.CACHE_TTL
 
 
 # ==================================================================================
 # ユーティリティ関数
 # ==================================================================================
+def _import_psycopg2():
+    global psycopg2, RealDictCursor, execute_values
+    if psycopg2 is not None:
+        return
+    try:
+        import psycopg2 as module
+        from psycopg2 import extras
+    except ImportError:
+        raise RuntimeError(
+            "PostgreSQLを使うには psycopg2 をインストールしてください。"
+        ) from None
+    RealDictCursor = extras.RealDictCursor
+    execute_values = extras.execute_values
+    psycopg2 = module  # 他のスレッドが途中の状態を見ないよう、最後に入れる
+
+
 def get_db_connection():
-    """PostgreSQLへの接続を確立する"""
+    """PostgreSQLへの接続を確立する（プールを通さない専用の接続）"""
+    _import_psycopg2()
     conn = psycopg2.connect(
-        host=DB_HOST, port="5432", database=DB_NAME, user=DB_USER, password=DB_PASS
+        host=DB_HOST, port=DB_PORT, database=DB_NAME, user=DB_USER, password=DB_PASS
     )
     return conn, RealDictCursor
 
 
+# ==================================================================================
+# コネクションプール
+# ==================================================================================
+class PoolTimeoutError(Exception):
+    """空き接続を待っている間にタイムアウトした"""
+
+
+class _PooledConnection:
+    """プール内の接続と、その作成・最終利用時刻"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+
+class ConnectionPool:
+    """
+    psycopg2の接続を使い回すスレッドセーフなプール
+
+    - 貸出前に、しばらく使われていなかった接続を SELECT 1 で生存確認する
+    - 壊れた接続・古くなった接続は捨てて、次の貸出時に接続し直す
+    - 最小数を超えて遊んでいる接続は一定時間で閉じる
+    """
+
+    def __init__(
+        self,
+        connect_func,
+        min_size=POOL_MIN_SIZE,
+        max_size=POOL_MAX_SIZE,
+        acquire_timeout=POOL_ACQUIRE_TIMEOUT,
+        health_check_interval=POOL_HEALTH_CHECK_INTERVAL,
+        idle_timeout=POOL_IDLE_TIMEOUT,
+        max_lifetime=POOL_MAX_LIFETIME,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("プールサイズの指定が不正です。")
+
+        self._connect = connect_func
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self.idle_timeout = idle_timeout
+        self.max_lifetime = max_lifetime
+
+        self._cond = threading.Condition()
+        self._idle = []  # 末尾が最後に返却された接続（LIFO）
+        self._size = 0  # 貸出中＋待機中の接続数
+        self._closed = False
+
+        for _ in range(min_size):
+            entry = _PooledConnection(self._connect())
+            with self._cond:
+                self._size += 1
+                self._idle.append(entry)
+
+    # ---------------------------------------------------------
+    # 貸出・返却
+    # ---------------------------------------------------------
+    def acquire(self, timeout=None):
+        """接続を1本借りる。空きがなければ返却されるまで待つ"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+
+        while True:
+            entry = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeoutError("コネクションプールは終了しています。")
+                    if self._idle:
+                        entry = self._idle.pop()
+                        break
+                    if self._size < self.max_size:
+                        # 接続を作る権利だけ先に確保し、接続処理はロックの外で行う
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            "データベース接続の空きがありません。しばらくしてから再度お試しください。"
+                        )
+                    self._cond.wait(remaining)
+
+            if entry is None:
+                try:
+                    return _PooledConnection(self._connect())
+                except Exception:
+                    self._forget(None)
+                    raise
+
+            if self._is_usable(entry):
+                return entry
+
+            # 死んでいた接続は捨てて、もう一度（今度は新規接続で）取り直す
+            self._forget(entry)
+            self._flush_idle()
+
+    def release(self, entry, broken=False):
+        """借りた接続を返す。壊れている場合は閉じて捨てる"""
+        conn = entry.conn
+        if not broken and not conn.closed:
+            try:
+                # 途中のトランザクションが残っていたら巻き戻してから戻す
+                if (
+                    conn.get_transaction_status()
+                    != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+                ):
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+
+        if broken or conn.closed:
+            self._forget(entry)
+            self._flush_idle()
+            return
+
+        entry.last_used = time.monotonic()
+        with self._cond:
+            if self._closed:
+                self._size -= 1
+                expired = [entry]
+            else:
+                self._idle.append(entry)
+                expired = self._pop_expired_locked()
+            self._cond.notify()
+        for old in expired:
+            _close_quietly(old.conn)
+
+    @contextmanager
+    def connection(self):
+        """with文で接続を借りる。抜けるときに自動で返却される"""
+        with query_stats.phase("acquire"):
+            entry = self.acquire()
+        broken = False
+        try:
+            yield entry.conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            # 通信断など：この接続は二度と使わない
+            broken = True
+            raise
+        finally:
+            self.release(entry, broken=broken)
+
+    def close(self):
+        """待機中の接続をすべて閉じ、以後の貸出を止める"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            _close_quietly(entry.conn)
+
+    # ---------------------------------------------------------
+    # 内部処理
+    # ---------------------------------------------------------
+    def _is_usable(self, entry):
+        """貸出前のヘルスチェック"""
+        if entry.conn.closed:
+            return False
+        now = time.monotonic()
+        if now - entry.created_at > self.max_lifetime:
+            return False
+        if now - entry.last_used > self.health_check_interval:
+            try:
+                with entry.conn.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                entry.conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _forget(self, entry):
+        """接続をプールの管理から外す（entryがNoneなら枠だけ返す）"""
+        if entry is not None:
+            _close_quietly(entry.conn)
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _flush_idle(self):
+        """
+        1本死んでいたらDB再起動などで全滅している可能性が高いので、
+        待機中の接続も生存確認の対象にする（次の貸出で必ずチェックさせる）
+        """
+        with self._cond:
+            for entry in self._idle:
+                entry.last_used = float("-inf")
+
+    def _pop_expired_locked(self):
+        """最小数を超えて長く遊んでいる接続・寿命切れの接続を取り出す"""
+        now = time.monotonic()
+        expired = []
+        # _idle は先頭ほど長く使われていない
+        while self._idle and self._size > self.min_size:
+            oldest = self._idle[0]
+            if now - oldest.last_used <= self.idle_timeout:
+                break
+            expired.append(self._idle.pop(0))
+            self._size -= 1
+        for entry in list(self._idle):
+            if now - entry.created_at > self.max_lifetime:
+                self._idle.remove(entry)
+                self._size -= 1
+                expired.append(entry)
+        return expired
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+def _open_pooled_connection():
+    conn, _ = get_db_connection()
+    return conn
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool():
+    """アプリ全体で共有するコネクションプールを返す（初回呼び出し時に作成）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(_open_pooled_connection)
+            atexit.register(_pool.close)
+        return _pool
+
+
+def close_connection_pool():
+    """共有プールを閉じる（設定を変えて作り直したいときなど）"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            atexit.unregister(_pool.close)
+            _pool = None
+
+
+@contextmanager
+def borrow_connection():
+    """プールから接続を借りる。with文を抜けると自動で返却される"""
+    with get_connection_pool().connection() as conn:
+        with query_stats.phase("transaction"):
+            yield conn, RealDictCursor
+
+
+# ==================================================================================
+# PostgreSQLエンジン
+# ==================================================================================
+# 人気度を足す（storage_engine.logaddexp と同じ計算。差が大きいときは exp が0に潰れないよう抑える）
+# 版は更新のたびに振り直し、サジェスト索引が変わった分だけ取りに来られるようにする
+POPULARITY_UPSERT_SQL = """
+INSERT INTO item_popularity AS p (型番, 人気度) VALUES %s
+ON CONFLICT (型番) DO UPDATE
+    SET 人気度 = GREATEST(p.人気度, EXCLUDED.人気度)
+               + ln(1 + exp(-LEAST(abs(p.人気度 - EXCLUDED.人気度), 50))),
+        版 = nextval('item_popularity_version_seq')
+"""
+
+# 在庫の増減と履歴の記録を1往復で行うSQL
+# - movement_id を applied_movements に記録する（反映済みなら以降は何もせず、行も返さない）
+# - 型番が無ければ新規登録（在庫数＝入力数量）、あれば現在数量に増減を足す
+# - どちらも0未満にはしない
+# - 型番の人気度を足す
+# - 更新後の在庫数を history に書き、その値を返す
+STOCK_MOVEMENT_SQL = """
+WITH claimed AS (
+    INSERT INTO applied_movements (movement_id) VALUES (%(movement_id)s)
+    ON CONFLICT DO NOTHING
+    RETURNING movement_id
+), moved AS (
+    INSERT INTO inventory AS i (型番, 製品名, カテゴリ, メーカー, 現在数量, 保管場所)
+    SELECT
+        %(型番)s, %(製品名)s, %(カテゴリ)s, %(メーカー)s,
+        GREATEST(%(数量)s, 0), %(保管場所)s
+    FROM claimed
+    ON CONFLICT (型番) DO UPDATE
+        SET 現在数量 = GREATEST(i.現在数量 + %(増減)s, 0),
+            保管場所 = EXCLUDED.保管場所
+    RETURNING 現在数量
+), popular AS (
+    INSERT INTO item_popularity AS p (型番, 人気度)
+    SELECT %(型番)s, %(人気度)s FROM moved
+    ON CONFLICT (型番) DO UPDATE
+        SET 人気度 = GREATEST(p.人気度, EXCLUDED.人気度)
+                   + ln(1 + exp(-LEAST(abs(p.人気度 - EXCLUDED.人気度), 50))),
+            版 = nextval('item_popularity_version_seq')
+)
+INSERT INTO history (日時, 型番, 製品名, カテゴリ, メーカー, 数量, 在庫数量)
+SELECT %(日時)s, %(型番)s, %(製品名)s, %(カテゴリ)s, %(メーカー)s, %(増減)s, 現在数量
+FROM moved
+RETURNING 在庫数量
+"""
+
+# サジェストの候補を1回の問い合わせで、2つの配列にして返す
+# popular     : 前方一致する値のうち、人気度のある型番の値を人気度の順に
+#               （型番以外の列は、その値を持つ型番のうち一番よく動いている型番の人気度で並べる）
+#               読む候補は POPULARITY_SCAN_LIMIT の2通りだけなので、短い入力でもカタログ全体を並べ替えない
+#               （前方一致が POPULARITY_SCAN_LIMIT 件に収まる入力では、一致するものを全部見るので正確）
+# alphabetical: 前方一致する値を、重複なしで五十音（バイト）順に
+#               DISTINCTだと同じ値の行（カテゴリなど）を全部なめてしまうので、
+#               「直前の候補より大きい最初の値」を索引で1件ずつ飛び石に引く（ループスキャン）
+#               並び順は text_pattern_ops 索引と同じ ~<~ にして、LIMIT 件で止める
+SUGGESTIONS_SQL = """
+WITH RECURSIVE candidates(value) AS (
+    (SELECT {column} FROM inventory
+     WHERE {column} LIKE %(pattern)s
+     ORDER BY {column} USING ~<~ LIMIT 1)
+    UNION ALL
+    SELECT (SELECT {column} FROM inventory
+            WHERE {column} LIKE %(pattern)s
+              AND {column} ~>~ candidates.value
+            ORDER BY {column} USING ~<~ LIMIT 1)
+    FROM candidates
+    WHERE candidates.value IS NOT NULL
+), prefixed AS (
+    SELECT 型番 AS model, {column} AS value FROM inventory
+    WHERE {column} LIKE %(pattern)s
+    ORDER BY {column} USING ~<~ LIMIT %(scan)s
+), scanned AS (
+    -- 相手の表は型番の索引で1行ずつ引く（LIMIT 1 で、表全体のハッシュ結合にさせない）
+    SELECT i.value, p.人気度 AS score
+    FROM prefixed i
+    CROSS JOIN LATERAL (
+        SELECT 人気度 FROM item_popularity WHERE 型番 = i.model LIMIT 1
+    ) p
+    UNION ALL
+    -- 前方一致が多すぎて全部は見られないとき（短い入力）だけ、人気度の高い型番からも探す
+    SELECT i.value, p.人気度
+    FROM (SELECT 型番, 人気度 FROM item_popularity ORDER BY 人気度 DESC LIMIT %(scan)s) p
+    CROSS JOIN LATERAL (
+        SELECT {column} AS value FROM inventory WHERE 型番 = p.型番 LIMIT 1
+    ) i
+    WHERE i.value LIKE %(pattern)s
+      AND (SELECT count(*) FROM prefixed) >= %(scan)s
+)
+SELECT
+    ARRAY(SELECT value FROM scanned GROUP BY value
+          ORDER BY max(score) DESC, value USING ~<~ LIMIT %(limit)s) AS popular,
+    ARRAY(SELECT value FROM candidates WHERE value IS NOT NULL LIMIT %(limit)s) AS alphabetical
+"""
+
+# あいまい検索（pg_trgm の GIN 索引で、部分一致と似ている値の両方を引く）
+# 部分一致は word_similarity が1になるので先に並ぶ。似ている度合いのしきい値はトランザクション内だけ変える
+FUZZY_SEARCH_SQL = """
+SELECT {column} FROM inventory
+WHERE {key} LIKE %(pattern)s OR %(key)s <%% {key}
+GROUP BY {column}
+ORDER BY max(word_similarity(%(key)s, {key})) DESC, {column}
+LIMIT %(limit)s
+"""
+
+# pg_trgm が入れられないサーバーでは、部分一致だけを順に探す
+SUBSTRING_SEARCH_SQL = """
+SELECT {column} FROM inventory
+WHERE {key} LIKE %(pattern)s
+GROUP BY {column}
+ORDER BY {column}
+LIMIT %(limit)s
+"""
+
+ITEM_DETAILS_SQL = "SELECT * FROM inventory WHERE 型番 = %s"
+
+# 先の月の履歴パーティションが足りないときだけ、その親テーブルを返す
+# （履歴の持ち方で親が変わる。create_postgres_tables.py の関数が無い＝パーティション分割していないなら何もしない）
+HISTORY_PARTITION_PARENT_SQL = """
+SELECT parent FROM (
+    SELECT CASE WHEN to_regclass('history_compact') IS NULL
+                THEN 'history' ELSE 'history_compact' END AS parent
+) p
+WHERE to_regclass(
+        parent || '_' || to_char(now() + make_interval(months => %(months_ahead)s), 'YYYYMM')
+      ) IS NULL
+  AND to_regprocedure('ensure_history_partitions(integer, date, text)') IS NOT NULL
+"""
+
+# ある時点の在庫数 = その時点以前で一番新しい履歴行の在庫数量
+# 一番新しいチェックポイントの値に、その後の履歴を上書きして求める
+# 同じ日時の行は追記順（履歴の id）で並べる
+# {history} には履歴の持ち方に合わせた (型番, 在庫数量, 日時, id) の表、
+# {model_filter} には型番の絞り込みを入れる（全型番なら空）
+STOCK_AS_OF_SQL = """
+WITH base AS (
+    SELECT max(日時) AS at FROM stock_checkpoints WHERE 日時 <= %(at)s
+)
+SELECT DISTINCT ON (型番) 型番, 在庫数量
+FROM (
+    SELECT c.型番, c.在庫数量, c.日時, NULL::bigint AS id
+    FROM stock_checkpoints c JOIN base ON c.日時 = base.at
+    WHERE true {model_filter}
+    UNION ALL
+    SELECT h.型番, h.在庫数量, h.日時, h.id
+    FROM ({history}) h
+    WHERE h.日時 <= %(at)s
+      AND h.日時 > COALESCE((SELECT at FROM base), '-infinity')
+      AND h.型番 IS NOT NULL {model_filter}
+) AS rows
+ORDER BY 型番, 日時 DESC, id DESC NULLS LAST
+"""
+
+# 履歴の持ち方ごとの (型番, 在庫数量, 日時, id)（create_postgres_tables.py の --history-layout）
+HISTORY_SOURCES = {
+    "wide": "SELECT 型番, 在庫数量, 日時, id FROM history",
+    "compact": (
+        "SELECT i.型番, c.在庫数量, c.日時, c.id"
+        " FROM history_compact c JOIN history_items i ON i.id = c.item_id"
+    ),
+}
+
+
+def _stock_as_of_sql(cursor, model_number):
+    cursor.execute("SELECT to_regclass('history_compact') IS NOT NULL")
+    layout = "compact" if cursor.fetchone()[0] else "wide"
+    return STOCK_AS_OF_SQL.format(
+        history=HISTORY_SOURCES[layout],
+        model_filter="AND 型番 = %(model)s" if model_number is not None else "",
+    )
+
+
+class PostgresEngine(storage_engine.StorageEngine):
+    """
+    共有のコネクションプール経由でPostgreSQLに読み書きするエンジン
+    型番詳細は変更通知（LISTEN/NOTIFY）で無効化されるキャッシュを通す
+    """
+
+    name = "postgresql"
+    _has_trgm = None  # pg_trgm が入っているか（最初のあいまい検索で調べる）
+    _partitions_month = None  # 先の月の履歴パーティションを確かめ済みの月（"YYYYMM"）
+    _partitions_retry_at = 0.0  # 作れなかったとき、次に試してよい時刻（time.monotonic()）
+
+    # ---------------------------------------------------------
+    # 読み取り
+    # ---------------------------------------------------------
+    def get_suggestions(self, column_name, search_term, limit):
+        # プールから接続を借りる（キー入力のたびに接続し直さない）
+        with borrow_connection() as (conn, cursor_factory):
+            # ★修正: cursorを作成してから execute する
+            with conn.cursor(cursor_factory=cursor_factory) as cursor:
+                # 列名は SEARCHABLE_COLUMNS で確認済みなので埋め込み、値は %s
+                params = {
+                    "pattern": storage_engine.escape_like(search_term) + "%",
+                    "limit": limit,
+                    "scan": storage_engine.POPULARITY_SCAN_LIMIT,
+                }
+                with query_stats.phase("execute"):
+                    cursor.execute(SUGGESTIONS_SQL.format(column=column_name), params)
+                    row = cursor.fetchone()
+            suggestions = storage_engine.merge_suggestions(
+                row["popular"], row["alphabetical"], limit
+            )
+            query_stats.add_rows(len(suggestions))
+            return suggestions
+
+    def search_fuzzy(self, column_name, search_term, limit):
+        # 検索キーの列は create_postgres_tables.py の生成列（search_key() で自動的に入る）
+        key = storage_engine.search_key(search_term)
+        params = {
+            "key": key,
+            "pattern": "%" + storage_engine.escape_like(key) + "%",
+            "limit": limit,
+        }
+        with borrow_connection() as (conn, _):
+            with conn.cursor() as cursor, query_stats.phase("execute"):
+                if self._has_trgm is None:
+                    cursor.execute(
+                        "SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"
+                    )
+                    self._has_trgm = cursor.fetchone()[0]
+                if self._has_trgm:
+                    cursor.execute(
+                        "SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)",
+                        (str(storage_engine.FUZZY_THRESHOLD),),
+                    )
+                    sql = FUZZY_SEARCH_SQL
+                else:
+                    sql = SUBSTRING_SEARCH_SQL
+                cursor.execute(
+                    sql.format(
+                        column=column_name,
+                        key=storage_engine.SEARCH_KEY_COLUMNS[column_name],
+                    ),
+                    params,
+                )
+                rows = [row[0] for row in cursor.fetchall()]
+        query_stats.add_rows(len(rows))
+        return rows
+
+    def get_item_details(self, model_number):
+        # 同じ型番は何度も選ばれるので、変更通知で無効化されるキャッシュを通す
+        return get_item_cache().get(model_number, _load_item_details)
+
+    def load_item_details(self, model_number):
+        return _load_item_details(model_number)
+
+    def iter_inventory_rows_since(self, last_no, batch_size=5000):
+        # サーバーサイドカーソルで少しずつ読むので、件数が多くてもメモリを食わない
+        with borrow_connection() as (conn, cursor_factory):
+            with conn.cursor(
+                name="inventory_rows_since", cursor_factory=cursor_factory
+            ) as cursor:
+                cursor.itersize = batch_size
+                with query_stats.phase("execute"):
+                    cursor.execute(
+                        'SELECT "No.", 型番, 製品名, カテゴリ, メーカー FROM inventory WHERE "No." > %s ORDER BY "No."',
+                        (last_no,),
+                    )
+                for row in cursor:
+                    query_stats.add_rows(1)
+                    yield row
+
+    def iter_popularity_since(self, version, batch_size=5000):
+        with borrow_connection() as (conn, cursor_factory):
+            with conn.cursor(
+                name="popularity_since", cursor_factory=cursor_factory
+            ) as cursor:
+                cursor.itersize = batch_size
+                with query_stats.phase("execute"):
+                    cursor.execute(
+                        "SELECT p.型番, i.製品名, i.カテゴリ, i.メーカー, p.人気度, p.版"
+                        " FROM item_popularity p JOIN inventory i ON i.型番 = p.型番"
+                        " WHERE p.版 > %s ORDER BY p.版",
+                        (version,),
+                    )
+                for row in cursor:
+                    query_stats.add_rows(1)
+                    yield row
+
+    def row_counts(self):
+        with borrow_connection() as (conn, _):
+            with conn.cursor() as cursor, query_stats.phase("execute"):
+                cursor.execute(
+                    "SELECT (SELECT count(*) FROM inventory), (SELECT count(*) FROM history)"
+                )
+                inventory, history = cursor.fetchone()
+        return {"inventory": inventory, "history": history}
+
+    def get_stock_alerts(self, after_id, limit):
+        with borrow_connection() as (conn, cursor_factory):
+            with conn.cursor(cursor_factory=cursor_factory) as cursor:
+                with query_stats.phase("execute"):
+                    cursor.execute(
+                        "SELECT * FROM stock_alerts WHERE id > %s ORDER BY id LIMIT %s",
+                        (after_id, limit),
+                    )
+                    rows = cursor.fetchall()
+        query_stats.add_rows(len(rows))
+        return rows
+
+    def get_stock_as_of(self, at, model_number=None):
+        with borrow_connection() as (conn, _):
+            with conn.cursor() as cursor, query_stats.phase("execute"):
+                cursor.execute(
+                    _stock_as_of_sql(cursor, model_number),
+                    {"at": at, "model": model_number},
+                )
+                rows = cursor.fetchall()
+        query_stats.add_rows(len(rows))
+        return dict(rows)
+
+    def count_inventory(self, filters):
+        sql, params = storage_engine.inventory_count_sql(filters, "%s")
+        with borrow_connection() as (conn, _):
+            with conn.cursor() as cursor, query_stats.phase("execute"):
+                cursor.execute(sql, params)
+                return cursor.fetchone()[0]
+
+    def get_inventory_page(self, filters, sort_column, descending, after, limit):
+        sql, params = storage_engine.inventory_page_sql(
+            filters, sort_column, descending, after, limit, "%s"
+        )
+        with borrow_connection() as (conn, cursor_factory):
+            with conn.cursor(cursor_factory=cursor_factory) as cursor:
+                with query_stats.phase("execute"):
+                    cursor.execute(sql, params)
+                    rows = cursor.fetchall()
+        query_stats.add_rows(len(rows))
+        return [dict(row) for row in rows]
+
+    def get_inventory_key_at(self, filters, sort_column, descending, offset):
+        sql, params = storage_engine.inventory_key_sql(
+            filters, sort_column, descending, offset, "%s"
+        )
+        with borrow_connection() as (conn, _):
+            with conn.cursor() as cursor, query_stats.phase("execute"):
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+        return list(row) if row else None
+
+    def stock_checkpoint_times(self):
+        with borrow_connection() as (conn, _):
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT DISTINCT 日時 FROM stock_checkpoints ORDER BY 日時")
+                return [row[0] for row in cursor.fetchall()]
+
+    def first_history_time(self):
+        with borrow_connection() as (conn, _):
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT min(日時) FROM history")
+                return cursor.fetchone()[0]
+
+    # ---------------------------------------------------------
+    # 書き込み
+    # ---------------------------------------------------------
+    def apply_movement(self, movement):
+        # 増減の計算はDB側で行うので、別のPCが同じ型番を同時に更新しても数がずれない
+        self._ensure_history_partitions()
+        with borrow_connection() as (conn, cursor_factory):
+            with conn.cursor(cursor_factory=cursor_factory) as cursor:
+                with query_stats.phase("execute"):
+                    cursor.execute(
+                        STOCK_MOVEMENT_SQL,
+                        dict(
+                            movement,
+                            人気度=storage_engine.popularity_score(movement["日時"]),
+                        ),
+                    )
+                    row = cursor.fetchone()
+            with query_stats.phase("execute"):
+                conn.commit()
+        if row is None:
+            return None  # 反映済み
+        query_stats.add_rows(1)
+        _invalidate_items([movement["型番"]])
+        return row["在庫数量"]
+
+    def apply_movements(self, movements):
+        # 行数に関係なく、SQLは「反映済みの確認」「新規登録」「ロック＆読み取り」「在庫更新」「履歴追加」「人気度」の6回だけ
+        all_movements = movements
+        self._ensure_history_partitions()
+
+        with borrow_connection() as (conn, cursor_factory):
+            # 計算はごくわずかなので、0〜6をまとめて「実行」として測る
+            with conn.cursor(cursor_factory=cursor_factory) as cursor, query_stats.phase(
+                "execute"
+            ):
+                # 0. movement_id を記録し、まだ反映していないものだけを残す
+                claimed = execute_values(
+                    cursor,
+                    "INSERT INTO applied_movements (movement_id) VALUES %s"
+                    " ON CONFLICT DO NOTHING RETURNING movement_id",
+                    [(movement["movement_id"],) for movement in movements],
+                    page_size=len(movements),
+                    fetch=True,
+                )
+                claimed_ids = {row["movement_id"] for row in claimed}
+                movements = [m for m in movements if m["movement_id"] in claimed_ids]
+                if not movements:
+                    conn.commit()
+                    return [None] * len(all_movements)
+
+                first_by_model = storage_engine.first_movements(movements)
+                models = sorted(first_by_model)  # ロックの順番を揃えてデッドロックを防ぐ
+
+                # 1. 未登録の型番を登録する（在庫数＝最初の行の数量）
+                created = execute_values(
+                    cursor,
+                    "INSERT INTO inventory (型番,製品名,カテゴリ,メーカー,現在数量,保管場所) VALUES %s"
+                    " ON CONFLICT (型番) DO NOTHING RETURNING 型番",
+                    [
+                        (
+                            model,
+                            first_by_model[model]["製品名"],
+                            first_by_model[model]["カテゴリ"],
+                            first_by_model[model]["メーカー"],
+                            max(first_by_model[model]["数量"], 0),
+                            first_by_model[model]["保管場所"],
+                        )
+                        for model in models
+                    ],
+                    page_size=len(models),
+                    fetch=True,
+                )
+                created_models = {row["型番"] for row in created}
+
+                # 2. 対象の型番をすべてロックし、現在数量を読む
+                cursor.execute(
+                    "SELECT 型番, 現在数量 FROM inventory WHERE 型番 = ANY(%s) ORDER BY 型番 FOR UPDATE",
+                    (models,),
+                )
+                stock = {row["型番"]: row["現在数量"] for row in cursor.fetchall()}
+
+                # 3. 入力順に在庫数を計算する
+                results = storage_engine.plan_batch(movements, stock, created_models)
+                locations = storage_engine.last_locations(movements)
+
+                # 4. 型番ごとの最終結果で在庫を更新する（VALUESリストとの結合で1文）
+                execute_values(
+                    cursor,
+                    "UPDATE inventory AS i SET 現在数量 = v.現在数量, 保管場所 = v.保管場所"
+                    " FROM (VALUES %s) AS v(型番, 現在数量, 保管場所) WHERE i.型番 = v.型番",
+                    [(model, stock[model], locations[model]) for model in models],
+                    template="(%s, %s::integer, %s::integer)",
+                    page_size=len(models),
+                )
+
+                # 5. 履歴をまとめて追加する
+                execute_values(
+                    cursor,
+                    "INSERT INTO history (日時,型番,製品名,カテゴリ,メーカー,数量,在庫数量) VALUES %s",
+                    [
+                        (
+                            movement["日時"],
+                            movement["型番"],
+                            movement["製品名"],
+                            movement["カテゴリ"],
+                            movement["メーカー"],
+                            movement["増減"],
+                            new_stock,
+                        )
+                        for movement, new_stock in zip(movements, results)
+                    ],
+                    page_size=len(movements),
+                )
+
+                # 6. 人気度を足す（在庫と同じ型番の順で、ロック済みの行だけ）
+                increments = storage_engine.popularity_increments(movements)
+                execute_values(
+                    cursor,
+                    POPULARITY_UPSERT_SQL,
+                    [(model, increments[model]) for model in models],
+                    page_size=len(models),
+                )
+            with query_stats.phase("execute"):
+                conn.commit()
+            query_stats.add_rows(len(movements))
+        _invalidate_items(models)
+        return storage_engine.align_results(all_movements, movements, results)
+
+    def create_stock_checkpoint(self, at):
+        with borrow_connection() as (conn, _):
+            with conn.cursor() as cursor, query_stats.phase("execute"):
+                # 同じ時点のチェックポイントを2か所から同時に作らない
+                cursor.execute("LOCK TABLE stock_checkpoints IN SHARE ROW EXCLUSIVE MODE")
+                cursor.execute("SELECT 1 FROM stock_checkpoints WHERE 日時 = %s LIMIT 1", (at,))
+                if cursor.fetchone():
+                    conn.rollback()
+                    return None
+                cursor.execute(
+                    "INSERT INTO stock_checkpoints (日時, 型番, 在庫数量)"
+                    " SELECT %(at)s, 型番, 在庫数量 FROM ("
+                    + _stock_as_of_sql(cursor, None)
+                    + ") AS stock",
+                    {"at": at},
+                )
+                count = cursor.rowcount
+                conn.commit()
+        query_stats.add_rows(count)
+        return count
+
+    def clear_stock_checkpoints(self):
+        with borrow_connection() as (conn, _):
+            with conn.cursor() as cursor:
+                cursor.execute("TRUNCATE stock_checkpoints")
+                conn.commit()
+
+    def set_reorder_point(self, model_number, reorder_point):
+        with borrow_connection() as (conn, _):
+            with conn.cursor() as cursor, query_stats.phase("execute"):
+                cursor.execute(
+                    "UPDATE inventory SET 発注点 = %s WHERE 型番 = %s",
+                    (reorder_point, model_number),
+                )
+                updated = cursor.rowcount
+                conn.commit()
+        _invalidate_items([model_number])
+        return updated > 0
+
+    def warm_up(self):
+        get_connection_pool()
+        get_item_cache()
+        self._ensure_history_partitions()
+
+    def _ensure_history_partitions(self):
+        """
+        今月から HISTORY_MONTHS_AHEAD か月先までの履歴パーティションが無ければ作る
+        月が変わって最初の呼び出しだけDBに確かめるので、ふだんの入出庫の邪魔にはならない
+        作れなくても入出庫は既定パーティションに入るので、ログに残して続ける
+        """
+        month = datetime.now().strftime("%Y%m")
+        if month == self._partitions_month or time.monotonic() < self._partitions_retry_at:
+            return
+        self._partitions_month = month
+        try:
+            with borrow_connection() as (conn, _):
+                with conn.cursor() as cursor:
+                    params = {"months_ahead": HISTORY_MONTHS_AHEAD}
+                    cursor.execute(HISTORY_PARTITION_PARENT_SQL, params)
+                    row = cursor.fetchone()
+                    if row is not None:
+                        cursor.execute(
+                            f"SET LOCAL lock_timeout = {int(HISTORY_PARTITION_LOCK_TIMEOUT_MS)}"
+                        )
+                        cursor.execute(
+                            "SELECT ensure_history_partitions(%(months_ahead)s, NULL, %(parent)s)",
+                            dict(params, parent=row[0]),
+                        )
+                    conn.commit()
+        except Exception:
+            self._partitions_month = None
+            self._partitions_retry_at = time.monotonic() + HISTORY_PARTITION_RETRY_SECONDS
+            logging.error("先の月の履歴パーティションを作れませんでした", exc_info=True)
+
+    def close(self):
+        global _item_cache
+        with _item_cache_lock:
+            if _item_cache is not None:
+                _item_cache.stop()
+                _item_cache = None
+        close_connection_pool()
+
+
+def _load_item_details(model_number):
+    with borrow_connection() as (conn, cursor_factory):
+        with conn.cursor(cursor_factory=cursor_factory) as cursor:
+            with query_stats.phase("execute"):
+                cursor.execute(ITEM_DETAILS_SQL, (model_number,))
+                item = cursor.fetchone()
+        query_stats.add_rows(1 if item else 0)
+        return dict(item) if item else None
+
+
+_item_cache = None
+_item_cache_lock = threading.Lock()
+
+
+def get_item_cache():
+    """型番詳細のキャッシュを返す（初回呼び出し時に変更通知の受信を始める）"""
+    global _item_cache
+    with _item_cache_lock:
+        if _item_cache is None:
+            _item_cache = item_cache.ItemDetailCache(
+                _open_pooled_connection,
+                max_size=ITEM_CACHE_SIZE,
+                ttl=ITEM_CACHE_TTL,
+            )
+            _item_cache.start()
+        return _item_cache
+
+
+def get_item_cache_stats():
+    """キャッシュのヒット・ミス数など（サイズ調整用。PostgreSQL以外では None）"""
+    if DB_ENGINE != PostgresEngine.name:
+        return None
+    return get_item_cache().stats()
+
+
+def _invalidate_items(models):
+    """このPCで更新した型番は、通知を待たずにすぐ捨てる"""
+    if _item_cache is not None:
+        for model in models:
+            _item_cache.invalidate(model)
+
+
+# ==================================================================================
+# エンジンの選択
+# ==================================================================================
+# 公開関数ごとに所要時間を集計する（遅いものは app.log へ）
+_query_stats = query_stats.QueryStats(slow_query_ms=SLOW_QUERY_MS)
+
+
+def get_query_stats():
+    """DB処理の所要時間の集計（main.py の隠しキーで app.log に書き出せる）"""
+    return _query_stats
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """config.ini の engine に応じたストレージエンジンを返す（初回呼び出し時に作成）"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            if DB_ENGINE == PostgresEngine.name:
+                _engine = PostgresEngine()
+            elif DB_ENGINE == storage_engine.SQLiteEngine.name:
+                _engine = storage_engine.SQLiteEngine(
+                    DB_FILE, journal_mode=SQLITE_JOURNAL_MODE
+                )
+            else:
+                raise ValueError(f"未対応のデータベースです: {DB_ENGINE}")
+            atexit.register(_engine.close)
+        return _engine
+
+
+def warm_up():
+    """
+    最初の操作で待たせないよう、接続などを先に用意しておく
+    起動直後に裏のスレッドから呼ぶ
+    """
+    get_engine().warm_up()
+
+
+def close_engine():
+    """エンジンを閉じる（DB_ENGINE・DB_FILE などを変えて作り直したいときに呼ぶ）"""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.close()
+            atexit.unregister(_engine.close)
+            _engine = None
+
+
+# ==================================================================================
+# オフライン用ジャーナル
+# ==================================================================================
+_journal = None
+_journal_lock = threading.Lock()
+_write_executor = None
+
+
+def get_write_journal():
+    """未送信の入出庫のジャーナルを返す（初回呼び出し時に、残っている分の送信を始める）"""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = write_journal.WriteJournal(
+                JOURNAL_FILE,
+                _replay_movements,
+                _is_unavailable,
+                batch_size=JOURNAL_BATCH_SIZE,
+            )
+            _journal.start()
+            atexit.register(_journal.stop)
+        return _journal
+
+
+def close_write_journal():
+    """送信スレッドを止める（JOURNAL_FILE を変えて作り直したいときなど）"""
+    global _journal
+    with _journal_lock:
+        if _journal is not None:
+            _journal.stop()
+            atexit.unregister(_journal.stop)
+            _journal = None
+
+
+def _replay_movements(movements):
+    """ジャーナルの入出庫を送る（反映済みのIDはエンジン側で飛ばされる）"""
+    with _query_stats.track("journal_replay"):
+        get_engine().apply_movements(movements)
+
+
+def _is_unavailable(error):
+    """DBにつながらない・混んでいるなど、時間をおけば書けるはずのエラーか"""
+    if isinstance(error, PoolTimeoutError):
+        return True
+    if psycopg2 is not None and isinstance(
+        error, (psycopg2.OperationalError, psycopg2.InterfaceError)
+    ):
+        return True
+    if isinstance(error, sqlite3.OperationalError):
+        message = str(error)
+        return any(
+            text in message for text in ("locked", "busy", "unable to open", "disk I/O")
+        )
+    return False
+
+
+def _get_write_executor():
+    global _write_executor
+    with _journal_lock:
+        if _write_executor is None:
+            # 待ちきれずにジャーナルへ回した書き込みが残っていても、次の書き込みを待たせない
+            _write_executor = ThreadPoolExecutor(
+                max_workers=POOL_MAX_SIZE, thread_name_prefix="db-writer"
+            )
+        return _write_executor
+
+
+def _apply_or_journal(movements, operation, apply_func):
+    """
+    apply_func() でDBへの反映を試み、つながらない・遅いときはジャーナルに回す
+    :return: (apply_func の結果, None)。ジャーナルに回したときは (None, 理由)
+    """
+    journal = get_write_journal()
+    if journal.has_pending():
+        # 先に受け付けた分を追い越すと在庫の計算順が変わるので、後ろに並べる
+        journal.append(movements)
+        return None, "未送信の入出庫が残っているため"
+
+    def tracked():
+        with _query_stats.track(operation):
+            return apply_func()
+
+    future = _get_write_executor().submit(tracked)
+    try:
+        return future.result(timeout=JOURNAL_LATENCY_MS / 1000), None
+    except FutureTimeoutError:
+        # 書き込みはまだ続いているが、同じ movement_id なので後から両方届いても1回しか反映されない
+        reason = "データベースの応答が遅いため"
+    except Exception as e:
+        if not _is_unavailable(e):
+            raise
+        reason = _unavailable_reason(e)
+    journal.append(movements)
+    return None, reason
+
+
+def _unavailable_reason(error):
+    if psycopg2 is not None and isinstance(
+        error, psycopg2.extensions.TransactionRollbackError
+    ):
+        # デッドロック・直列化の失敗（時間をおいて送り直せば通る）
+        return "他の端末の更新と競合したため"
+    if isinstance(error, sqlite3.OperationalError) and "locked" in str(error):
+        return "他の端末が書き込み中で待ちきれなかったため"
+    return "データベースに接続できないため"
+
+
+def _journaled_result(reason):
+    return {
+        "success": True,
+        "message": f"{reason}、この端末に記録しました。\n接続が戻ると自動でデータベースに反映されます。",
+        "在庫数量": None,
+        "保留": True,
+    }
+
+
 # ==================================================================================
 # データ読み取り（Read）
 # ==================================================================================
-def get_autocomplete_suggestions(column_name, search_term):
-    """指定された列から「前方一致」する候補をSQLで検索する"""
+def get_autocomplete_suggestions(column_name, search_term, limit=SUGGESTION_LIMIT):
+    """指定された列から「前方一致」する候補を検索する（上位 limit 件まで）"""
+    if column_name not in SEARCHABLE_COLUMNS:
+        raise ValueError(f"サジェスト対象外の列です: {column_name}")
     if not search_term:
         return []
+    with _query_stats.track(f"suggestions:{column_name}"):
+        return get_engine().get_suggestions(column_name, search_term, limit)
 
-    # ★修正: 戻り値を2つ受け取る
-    conn, cursor_factory = get_db_connection()
-    try:
-        # ★修正: cursorを作成してから execute する
-        with conn.cursor(cursor_factory=cursor_factory) as cursor:
-            # 列名はプレースホルダにできないのでF文字列、値は %s
-            query = f"SELECT DISTINCT {column_name} FROM inventory WHERE CAST({column_name} AS TEXT) LIKE %s ORDER BY {column_name}"
-            cursor.execute(query, (search_term + "%",))
-            suggestions = cursor.fetchall()
-            return [row[column_name] for row in suggestions]
-    finally:
-        conn.close()
+
+def search_fuzzy(column_name, search_term, limit=SUGGESTION_LIMIT):
+    """
+    製品名・メーカーから、入力を途中に含む値と、多少打ち間違えていても似ている値を探す
+    全角/半角・カタカナ/ひらがな・大文字/小文字・空白の違いは無視し、似ている順に返す
+    """
+    if column_name not in FUZZY_SEARCH_COLUMNS:
+        raise ValueError(f"あいまい検索の対象外の列です: {column_name}")
+    if not storage_engine.search_key(search_term):
+        return []
+    with _query_stats.track(f"fuzzy:{column_name}"):
+        return get_engine().search_fuzzy(column_name, search_term, limit)
 
 
 def get_item_details_by_model(model_number):
     """指定された型番のレコードをデータベースから取得し、辞書として返す"""
-    # ★修正: 戻り値を2つ受け取る
-    conn, cursor_factory = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=cursor_factory) as cursor:
-            query = "SELECT * FROM inventory WHERE 型番 = %s"
-            cursor.execute(query, (model_number,))
-            item = cursor.fetchone()
-            return dict(item) if item else None
-    finally:
-        conn.close()
+    with _query_stats.track("item_details"):
+        return get_engine().get_item_details(model_number)
+
+
+def iter_inventory_rows_since(last_no):
+    """
+    "No." が last_no より大きい在庫レコード（サジェスト対象の列のみ）を順に返す
+    少しずつ読むので、件数が多くてもメモリを食わない
+    """
+    with _query_stats.track("inventory_rows_since"):
+        yield from get_engine().iter_inventory_rows_since(last_no)
+
+
+def iter_popularity_since(version):
+    """
+    版が version より大きい型番の人気度を、版の順に返す（サジェスト索引の並び替え用）
+    各行は 型番・製品名・カテゴリ・メーカー・人気度・版 を持つ
+    """
+    with _query_stats.track("popularity_since"):
+        yield from get_engine().iter_popularity_since(version)
+
+
+def get_stock_alerts(after_id=0, limit=STOCK_ALERT_LIMIT):
+    """
+    発注点アラート（在庫数が発注点以下になった・回復した記録）を古い順に返す
+    前回読んだ最後の id を after_id に渡せば、その後に起きた分だけを読める
+    PostgreSQLでは、アラートが起きたとき STOCK_ALERT_CHANNEL にも NOTIFY される
+    """
+    with _query_stats.track("stock_alerts"):
+        return get_engine().get_stock_alerts(after_id, limit)
+
+
+def get_stock_as_of(at, model_number=None):
+    """
+    日時 at 時点の在庫数を {型番: 在庫数} で返す（model_number を渡せばその型番だけ）
+    その時点以前で一番新しい履歴の在庫数量を、チェックポイントとその後の履歴から求める
+    その時点でまだ履歴の無い型番は含まれない
+    """
+    with _query_stats.track("stock_as_of"):
+        return get_engine().get_stock_as_of(at, model_number)
+
+
+def _inventory_filters(filters):
+    """在庫一覧の絞り込み条件を確かめ、空欄の条件を除く"""
+    checked = {}
+    for column, value in (filters or {}).items():
+        if column not in storage_engine.INVENTORY_FILTER_COLUMNS:
+            raise ValueError(f"絞り込みできない列です: {column}")
+        value = "" if value is None else str(value).strip()
+        if not value:
+            continue
+        if column == "保管場所":
+            try:
+                value = int(value)  # 全角数字もそのまま数字になる
+            except ValueError:
+                raise ValueError("保管場所は数字で指定してください。") from None
+        checked[column] = value
+    return checked
+
+
+def _check_sort_column(sort_column):
+    if sort_column not in storage_engine.INVENTORY_SORT_EXPRESSIONS:
+        raise ValueError(f"並べ替えできない列です: {sort_column}")
+
+
+def count_inventory(filters=None):
+    """絞り込み条件 filters（{カテゴリ/メーカー/保管場所: 値}。空欄は条件なし）に合う在庫の件数"""
+    filters = _inventory_filters(filters)
+    with _query_stats.track("inventory_count"):
+        return get_engine().count_inventory(filters)
+
+
+def get_inventory_page(
+    filters=None, sort_column="No.", descending=False, after=None, limit=INVENTORY_PAGE_SIZE
+):
+    """
+    在庫一覧の1ページ分（INVENTORY_LIST_COLUMNS の列の辞書のリスト）を返す
+    次のページは、最後の行の storage_engine.inventory_page_key() を after に渡して読む
+    （何ページ目でも、前のページの続きから索引をたどるだけなので速さは変わらない）
+    """
+    filters = _inventory_filters(filters)
+    _check_sort_column(sort_column)
+    with _query_stats.track("inventory_page"):
+        return get_engine().get_inventory_page(filters, sort_column, descending, after, limit)
+
+
+def get_inventory_key_at(offset, filters=None, sort_column="No.", descending=False):
+    """
+    同じ並びで offset 件目（0から）の行の並べ替えキー（なければ None）
+    スクロールバーで離れた位置へ飛ぶとき、そこから get_inventory_page を読み始めるのに使う
+    """
+    filters = _inventory_filters(filters)
+    _check_sort_column(sort_column)
+    with _query_stats.track("inventory_key_at"):
+        return get_engine().get_inventory_key_at(filters, sort_column, descending, offset)
+
+
+def create_stock_checkpoints(until=None, rebuild=False):
+    """
+    まだ無い月初めのチェックポイントを古い順に作る（前のチェックポイントからの差分だけ読む）
+    月に1回実行しておけば、過去のどの時点の在庫数も1か月分以内の履歴から求められる
+
+    :param until: この日時までの月初めを作る（既定は CHECKPOINT_LAG_DAYS 日前まで）
+    :param rebuild: 作ってあるチェックポイントを消して作り直す（過去の履歴を直したとき）
+    :return: 作ったチェックポイントの日時のリスト
+    """
+    engine = get_engine()
+    if rebuild:
+        engine.clear_stock_checkpoints()
+    if until is None:
+        until = datetime.now() - timedelta(days=CHECKPOINT_LAG_DAYS)
+
+    first = engine.first_history_time()
+    if first is None:
+        return []
+    existing = set(engine.stock_checkpoint_times())
+
+    created = []
+    month_start = _next_month_start(first)
+    while month_start <= until:
+        if month_start not in existing:
+            with _query_stats.track("create_stock_checkpoint"):
+                if engine.create_stock_checkpoint(month_start) is not None:
+                    created.append(month_start)
+        month_start = _next_month_start(month_start)
+    return created
+
+
+def _next_month_start(value):
+    """value より後で一番早い月初めの0時0分0秒"""
+    if value.month == 12:
+        return datetime(value.year + 1, 1, 1)
+    return datetime(value.year, value.month + 1, 1)
 
 
 # ==================================================================================
 # 司令塔部門（Controller / Writer）
 # ==================================================================================
-def run_main_process_from_ui(input_data):
-    """UIから受け取ったデータに基づき、在庫の更新または新規登録を実行する"""
-
+def _sanitize_input(input_data):
+    """
+    入力データを整える（input_data をその場で書き換える）
+    問題があればエラーメッセージを、なければ None を返す
+    """
     # 1. 入力データのサニタイズ
     try:
         if input_data.get("数量") and str(input_data["数量"]).strip() != "":
@@ -78,7 +1347,7 @@ def run_main_process_from_ui(input_data):
         else:
             input_data["数量"] = None
     except (ValueError, TypeError):
-        return {"success": False, "message": "数量には数字を入力してください。"}
+        return "数量には数字を入力してください。"
 
     if input_data.get("保管場所") and isinstance(input_data["保管場所"], str):
         zen = "０１２３４５６７８９ＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺａｂｃｄｅｆｇｈｉｊｋｌｍｎｏｐｑｒｓｔｕｖｗｘｙｚ"
@@ -91,88 +1360,88 @@ def run_main_process_from_ui(input_data):
     if (
         input_data.get("製品名") is None or str(input_data["製品名"]).strip() == ""
     ) or (input_data.get("数量") is None):
-        return {"success": False, "message": "製品名と数量は必須です。"}
+        return "製品名と数量は必須です。"
 
-    # 3. データベース更新処理
-    # ★修正: 戻り値を2つ受け取る
-    conn, cursor_factory = get_db_connection()
+    return None
 
-    try:
-        # ★修正: cursorを作成する
-        with conn.cursor(cursor_factory=cursor_factory) as cursor:
 
-            # 4. 既存レコードの確認
-            cursor.execute(
-                "SELECT * FROM inventory WHERE 型番 = %s",
-                (str(input_data.get("型番", "")),),
-            )
-            existing_item = cursor.fetchone()
+def _signed_quantity(input_data):
+    """履歴に記録する増減（使用はマイナス）"""
+    if input_data["処理種別"] != "使用":
+        return input_data["数量"]
+    return -input_data["数量"]
 
-            final_stock = 0
 
-            if existing_item:
-                # --- 更新処理 ---
-                current_stock = int(existing_item["現在数量"])
-                quantity = input_data["数量"]
-                action = input_data["処理種別"]
+def _to_movement(input_data, now):
+    """サニタイズ済みの入力を、エンジンに渡す1件の入出庫にする"""
+    return {
+        "movement_id": uuid.uuid4().hex,
+        "日時": now,
+        "型番": input_data["型番"],
+        "製品名": input_data["製品名"],
+        "カテゴリ": input_data["カテゴリ"],
+        "メーカー": input_data["メーカー"],
+        "数量": input_data["数量"],
+        "増減": _signed_quantity(input_data),
+        "保管場所": input_data["保管場所"],
+    }
 
-                if action == "補充":
-                    new_stock = current_stock + quantity
-                else:
-                    new_stock = current_stock - quantity
-                    if new_stock < 0:
-                        new_stock = 0
 
-                final_stock = new_stock
+def run_main_process_from_ui(input_data):
+    """UIから受け取ったデータに基づき、在庫の更新または新規登録を実行する"""
 
-                cursor.execute(
-                    "UPDATE inventory SET 現在数量 = %s, 保管場所 = %s WHERE 型番 = %s",
-                    (new_stock, input_data["保管場所"], str(input_data["型番"])),
-                )
-            else:
-                # --- 新規登録処理 ---
-                final_stock = input_data["数量"]
-                if final_stock < 0:
-                    final_stock = 0
+    # 1. 入力データのサニタイズ / 2. 必須項目のチェック
+    error_message = _sanitize_input(input_data)
+    if error_message:
+        return {"success": False, "message": error_message}
 
-                cursor.execute(
-                    "INSERT INTO inventory (型番,製品名,カテゴリ,メーカー,現在数量,保管場所) VALUES (%s,%s,%s,%s,%s,%s)",
-                    (
-                        input_data["型番"],
-                        input_data["製品名"],
-                        input_data["カテゴリ"],
-                        input_data["メーカー"],
-                        final_stock,
-                        input_data["保管場所"],
-                    ),
-                )
+    # 3. データベース更新処理
+    # 在庫の増減（0未満にはしない）と履歴の記録を1トランザクションでまとめて実行する
+    # DBにつながらない・遅いときは、この端末に記録して後で送る
+    try:
+        movement = _to_movement(input_data, datetime.now().replace(microsecond=0))
+        final_stock, journaled = _apply_or_journal(
+            [movement], "apply_movement", lambda: get_engine().apply_movement(movement)
+        )
+        if journaled:
+            return _journaled_result(journaled)
+        return {
+            "success": True,
+            "message": "データベースの更新が完了しました！",
+            "在庫数量": final_stock,
+        }
 
-            # 5. 履歴の記録
-            history_quantity = (
-                input_data["数量"]
-                if input_data["処理種別"] != "使用"
-                else -input_data["数量"]
-            )
+    except Exception as e:
+        import traceback
 
-            cursor.execute(
-                "INSERT INTO history (日時,型番,製品名,カテゴリ,メーカー,数量,在庫数量) VALUES (%s,%s,%s,%s,%s,%s,%s)",
-                (
-                    datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    input_data["型番"],
-                    input_data["製品名"],
-                    input_data["カテゴリ"],
-                    input_data["メーカー"],
-                    history_quantity,
-                    final_stock,
-                ),
-            )
+        traceback.print_exc()
+        return {
+            "success": False,
+            "message": f"処理中にデータベースエラーが発生しました:\n{str(e)}",
+        }
 
-            # 6. コミット（確定）
-            conn.commit()
-            return {"success": True, "message": "データベースの更新が完了しました！"}
 
+def set_reorder_point(model_number, reorder_point):
+    """
+    型番の発注点を設定する（空欄・None で解除）
+    在庫数が発注点以下になると、次の入出庫を待たずにアラートが記録される
+    """
+    if reorder_point is None or str(reorder_point).strip() == "":
+        reorder_point = None
+    else:
+        try:
+            reorder_point = int(
+                str(reorder_point).translate(str.maketrans("０１２３４５６７８９", "0123456789"))
+            )
+        except ValueError:
+            return {"success": False, "message": "発注点には数字を入力してください。"}
+        if reorder_point < 0:
+            return {"success": False, "message": "発注点は0以上にしてください。"}
+
+    try:
+        with _query_stats.track("set_reorder_point"):
+            found = get_engine().set_reorder_point(model_number, reorder_point)
     except Exception as e:
-        conn.rollback()
         import traceback
 
         traceback.print_exc()
@@ -180,5 +1449,62 @@ def run_main_process_from_ui(input_data):
             "success": False,
             "message": f"処理中にデータベースエラーが発生しました:\n{str(e)}",
         }
-    finally:
-        conn.close()
+    if not found:
+        return {"success": False, "message": f"型番が登録されていません: {model_number}"}
+    return {"success": True, "message": "発注点を設定しました。"}
+
+
+def run_batch_process(list_of_inputs):
+    """
+    複数の入出庫をまとめて1トランザクションで実行する
+    結果は入力と同じ順のリストで返す（各要素は run_main_process_from_ui と同じ形）
+
+    同じ型番が何行あっても、入力順に1行ずつ足し引きした結果になる（途中で0未満にはしない）
+    """
+    results = [None] * len(list_of_inputs)
+
+    # 1. まとめてサニタイズ・チェック（NGの行だけ失敗にして、残りは実行する）
+    indexes = []
+    movements = []
+    now = datetime.now().replace(microsecond=0)
+    for index, input_data in enumerate(list_of_inputs):
+        error_message = _sanitize_input(input_data)
+        if error_message is None and input_data.get("型番") is None:
+            error_message = "型番がありません。"
+        if error_message:
+            results[index] = {"success": False, "message": error_message}
+        else:
+            indexes.append(index)
+            movements.append(_to_movement(input_data, now))
+
+    if not movements:
+        return results
+
+    # 2. まとめて反映する（DBにつながらない・遅いときは、この端末に記録して後で送る）
+    try:
+        stocks, journaled = _apply_or_journal(
+            movements, "apply_movements", lambda: get_engine().apply_movements(movements)
+        )
+    except Exception as e:
+        import traceback
+
+        traceback.print_exc()
+        for index in indexes:
+            results[index] = {
+                "success": False,
+                "message": f"処理中にデータベースエラーが発生しました:\n{str(e)}",
+            }
+        return results
+
+    if journaled:
+        for index in indexes:
+            results[index] = _journaled_result(journaled)
+        return results
+
+    for index, new_stock in zip(indexes, stocks):
+        results[index] = {
+            "success": True,
+            "message": "データベースの更新が完了しました！",
+            "在庫数量": new_stock,
+        }
+    return results
@@ -0,0 +1,353 @@
+import argparse
+import json
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import backend_logic as logic
+import suggestion_index
+from storage_engine import search_key
+from create_postgres_tables import COMPACT_HISTORY_TABLES, current_history_layout
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+DEFAULT_ITEMS = 10_000
+DEFAULT_HISTORY = 100_000
+DEFAULT_ITERATIONS = 200  # 1つの処理を何回測るか
+DEFAULT_BATCH_SIZE = 100
+RESULTS_FILE = "benchmark_results.jsonl"  # 1回の実行＝1行で追記していく
+
+CATEGORY_COUNT = 50
+MAKER_COUNT = 300
+
+
+# ==================================================================================
+# ダミーデータの生成
+# ==================================================================================
+# サーバー側の generate_series で作るので、100万件でもクライアントには何も流れない
+# setseed() で毎回同じデータになる
+GENERATE_INVENTORY_SQL = """
+INSERT INTO inventory (型番, 製品名, カテゴリ, メーカー, 現在数量, 保管場所)
+SELECT
+    chr(65 + g %% 26) || chr(65 + (g / 26) %% 26) || '-' || lpad(g::text, 7, '0'),
+    (ARRAY['ボルト','ナット','ワッシャ','ベアリング','モーター','センサー','ケーブル','スイッチ'])[1 + g %% 8]
+        || ' ' || (g %% 997)::text,
+    'カテゴリ' || (g %% %(categories)s)::text,
+    'メーカー' || (g %% %(makers)s)::text,
+    (random() * 500)::integer,
+    (random() * 999)::integer
+FROM generate_series(1, %(items)s) AS g
+"""
+
+# 履歴は過去1年に散らばせ、日時順に入れる（実運用と同じく追記順＝日時順にする）
+GENERATE_HISTORY_SQL = """
+INSERT INTO history (日時, 型番, 製品名, カテゴリ, メーカー, 数量, 在庫数量)
+SELECT
+    now() - interval '365 days' + (g::double precision / %(history)s) * interval '365 days',
+    i.型番, i.製品名, i.カテゴリ, i.メーカー,
+    (random() * 20)::integer - 10,
+    (random() * 500)::integer
+FROM generate_series(1, %(history)s) AS g
+JOIN inventory i ON i."No." = 1 + (g::bigint * 7919) %% %(items)s
+ORDER BY g
+"""
+
+
+def generate_catalog(n_items, n_history, seed=0.42):
+    """inventory と history を空にして、ダミーデータを作る"""
+    if logic.DB_ENGINE == "sqlite":
+        generate_catalog_sqlite(n_items, n_history, seed)
+        return
+
+    with logic.borrow_connection() as (conn, _):
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT setseed(%s)", (seed,))
+            # compact の履歴なら、history はビューなので中のテーブルを空にする
+            history_tables = ["history"]
+            if current_history_layout(cursor) == "compact":
+                history_tables = list(COMPACT_HISTORY_TABLES)
+            # 過去の在庫数のチェックポイントと人気度も、作り直した履歴とは合わなくなるので消す
+            cursor.execute(
+                f"TRUNCATE inventory, {', '.join(history_tables)}, stock_checkpoints, item_popularity"
+                " RESTART IDENTITY"
+            )
+            cursor.execute(
+                GENERATE_INVENTORY_SQL,
+                {"items": n_items, "categories": CATEGORY_COUNT, "makers": MAKER_COUNT},
+            )
+            cursor.execute(
+                GENERATE_HISTORY_SQL, {"items": n_items, "history": n_history}
+            )
+            cursor.execute("ANALYZE inventory")
+            for table in history_tables:
+                cursor.execute(f"ANALYZE {table}")
+        conn.commit()
+
+
+def generate_catalog_sqlite(n_items, n_history, seed=0.42):
+    """SQLite版（random() に種を指定できないので、Python側で同じ形のデータを作る）"""
+    rng = random.Random(seed)
+    products = ["ボルト", "ナット", "ワッシャ", "ベアリング", "モーター", "センサー", "ケーブル", "スイッチ"]
+    items = [
+        (
+            chr(65 + g % 26) + chr(65 + (g // 26) % 26) + "-" + str(g).zfill(7),
+            f"{products[g % 8]} {g % 997}",
+            f"カテゴリ{g % CATEGORY_COUNT}",
+            f"メーカー{g % MAKER_COUNT}",
+            rng.randint(0, 500),
+            rng.randint(0, 999),
+        )
+        for g in range(1, n_items + 1)
+    ]
+    # あいまい検索の検索キーは、アプリが書くときと同じ search_key() で作っておく
+    keyed_items = [item + (search_key(item[1]), search_key(item[3])) for item in items]
+    start = datetime.now() - timedelta(days=365)
+    history = []
+    for g in range(1, n_history + 1):
+        item = items[(g * 7919) % n_items]
+        history.append(
+            (
+                (start + timedelta(days=365 * g / n_history)).strftime("%Y-%m-%d %H:%M:%S"),
+                *item[:4],
+                rng.randint(-10, 10),
+                rng.randint(0, 500),
+            )
+        )
+
+    logic.get_engine().create_schema()
+    conn = sqlite3.connect(logic.DB_FILE)
+    try:
+        with conn:
+            conn.execute("DELETE FROM inventory")
+            conn.execute("DELETE FROM history")
+            conn.execute("DELETE FROM stock_checkpoints")
+            conn.execute("DELETE FROM item_popularity")
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = 'inventory'")
+            conn.executemany(
+                "INSERT INTO inventory (型番,製品名,カテゴリ,メーカー,現在数量,保管場所,製品名_検索,メーカー_検索)"
+                " VALUES (?,?,?,?,?,?,?,?)",
+                keyed_items,
+            )
+            conn.executemany(
+                "INSERT INTO history (日時,型番,製品名,カテゴリ,メーカー,数量,在庫数量) VALUES (?,?,?,?,?,?,?)",
+                history,
+            )
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+
+def sample_rows(count, seed=42):
+    """測定に使う実在の品目を取ってくる（全件を1回流し読みするリザーバサンプリング）"""
+    rng = random.Random(seed)
+    sample = []
+    for seen, row in enumerate(logic.iter_inventory_rows_since(0)):
+        if seen < count:
+            sample.append(dict(row))
+        else:
+            slot = rng.randint(0, seen)
+            if slot < count:
+                sample[slot] = dict(row)
+    return sample
+
+
+def sample_values(rows, column_name):
+    return [row[column_name] for row in rows if row[column_name]]
+
+
+def count_rows():
+    """測定時点の件数（結果の比較用）"""
+    counts = logic.get_engine().row_counts()
+    return {"items": counts["inventory"], "history": counts["history"]}
+
+
+# ==================================================================================
+# 測定
+# ==================================================================================
+def percentile(sorted_values, p):
+    """ソート済みの値から p パーセンタイル（最近傍順位）を返す"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))  # 切り上げ
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies):
+    """秒のリストを、比較用のミリ秒の要約にする"""
+    values = sorted(latency * 1000 for latency in latencies)
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "mean_ms": round(statistics.fmean(values), 3),
+        "max_ms": round(values[-1], 3),
+    }
+
+
+def measure(func, args_list):
+    """args_list の引数で func を1回ずつ呼び、それぞれの所要時間（秒）を返す"""
+    latencies = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def make_movement(model, rng):
+    return {
+        "処理種別": rng.choice(["補充", "使用"]),
+        "型番": model,
+        "製品名": "ベンチマーク",
+        "カテゴリ": "ベンチマーク",
+        "メーカー": "ベンチマーク",
+        "数量": rng.randint(1, 10),
+        "保管場所": str(rng.randint(1, 999)),
+    }
+
+
+def run_benchmarks(iterations, batch_size, seed=42):
+    """各処理の所要時間を測り、{処理名: 要約} を返す"""
+    rng = random.Random(seed)
+    results = {}
+
+    # 接続を温めてから測る（初回接続の時間は測定に含めない）
+    logic.get_autocomplete_suggestions("型番", "A")
+
+    # 1. サジェスト（列ごと。DB検索と、メモリ上の索引の両方）
+    index = suggestion_index.SuggestionIndex(refresh_interval=float("inf"))
+    start = time.perf_counter()
+    index.refresh(force=True)
+    results["suggestion_index_load"] = summarize([time.perf_counter() - start])
+
+    rows = sample_rows(iterations)
+    for column in logic.SEARCHABLE_COLUMNS:
+        values = sample_values(rows, column)
+        prefixes = [(column, value[: rng.randint(1, 3)]) for value in values]
+        results[f"autocomplete_db:{column}"] = summarize(
+            measure(logic.get_autocomplete_suggestions, prefixes)
+        )
+        results[f"autocomplete_index:{column}"] = summarize(
+            measure(index.get_suggestions, prefixes)
+        )
+
+    # 1b. あいまい検索（値の途中の一部分と、1文字打ち間違えた値）
+    for column in logic.FUZZY_SEARCH_COLUMNS:
+        values = sample_values(rows, column)
+        substrings = [(column, value[len(value) // 3 :]) for value in values]
+        typos = []
+        for value in values:
+            position = rng.randrange(len(value))
+            typos.append((column, value[:position] + "ー" + value[position + 1 :]))
+        results[f"fuzzy_substring:{column}"] = summarize(measure(logic.search_fuzzy, substrings))
+        results[f"fuzzy_typo:{column}"] = summarize(measure(logic.search_fuzzy, typos))
+
+    # 2. 型番詳細（キャッシュなし・キャッシュあり。キャッシュはPostgreSQLのみ）
+    models = sample_values(rows, "型番")
+    results["item_detail_uncached"] = summarize(
+        measure(logic.get_engine().load_item_details, [(model,) for model in models])
+    )
+    if logic.DB_ENGINE == "postgresql":
+        logic.get_item_cache()
+        time.sleep(0.5)  # 変更通知の受信が始まるのを待つ
+        measure(logic.get_item_details_by_model, [(model,) for model in models])
+        results["item_detail_cached"] = summarize(
+            measure(logic.get_item_details_by_model, [(model,) for model in models])
+        )
+
+    # 3. 書き込み（1件ずつ・まとめて）
+    results["write_single"] = summarize(
+        measure(
+            logic.run_main_process_from_ui,
+            [(make_movement(rng.choice(models), rng),) for _ in range(iterations)],
+        )
+    )
+    batches = [
+        ([make_movement(rng.choice(models), rng) for _ in range(batch_size)],)
+        for _ in range(max(1, iterations // 10))
+    ]
+    batch_latencies = measure(logic.run_batch_process, batches)
+    results[f"write_batch_{batch_size}"] = summarize(batch_latencies)
+    results[f"write_batch_{batch_size}_per_row"] = summarize(
+        [latency / batch_size for latency in batch_latencies]
+    )
+
+    return results
+
+
+# ==================================================================================
+# 実行
+# ==================================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="サジェスト・型番詳細・書き込みの所要時間（p50/p99）を測る"
+    )
+    parser.add_argument(
+        "--generate",
+        action="store_true",
+        help="測定前に inventory と history を消してダミーデータを作る（本番DBでは使わないこと）",
+    )
+    parser.add_argument("--items", type=int, default=DEFAULT_ITEMS, help="品目数")
+    parser.add_argument("--history", type=int, default=DEFAULT_HISTORY, help="履歴の行数")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument(
+        "--engine",
+        choices=("postgresql", "sqlite"),
+        default=logic.DB_ENGINE,
+        help="測定するストレージエンジン（既定は config.ini の engine）",
+    )
+    parser.add_argument("--path", default=logic.DB_FILE, help="SQLiteのDBファイル")
+    parser.add_argument("--host", default=logic.DB_HOST, help="測定に使うDBのホスト")
+    parser.add_argument("--dbname", default=logic.DB_NAME, help="測定に使うDB名")
+    parser.add_argument(
+        "--output", default=RESULTS_FILE, help="結果を1行のJSONとして追記するファイル"
+    )
+    args = parser.parse_args(argv)
+
+    logic.DB_ENGINE = args.engine
+    logic.DB_FILE = args.path
+    logic.DB_HOST = args.host
+    logic.DB_NAME = args.dbname
+
+    if args.generate:
+        print(f"🔨 ダミーデータを生成中... (品目{args.items}件 / 履歴{args.history}件)")
+        start = time.perf_counter()
+        generate_catalog(args.items, args.history)
+        print(f"生成完了！ ({time.perf_counter() - start:.1f}秒)")
+
+    print("⏱ 測定中...")
+    rows = count_rows()
+    results = run_benchmarks(args.iterations, args.batch_size)
+
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "params": {
+            "engine": args.engine,
+            "path": args.path if args.engine == "sqlite" else None,
+            "host": args.host,
+            "dbname": args.dbname,
+            "items": rows["items"],
+            "history": rows["history"],
+            "iterations": args.iterations,
+            "batch_size": args.batch_size,
+        },
+        "results": results,
+        "item_cache": logic.get_item_cache_stats(),
+        "query_stats": logic.get_query_stats().report(),
+    }
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    for name, summary in results.items():
+        print(f"{name:40s} p50={summary['p50_ms']:9.3f}ms  p99={summary['p99_ms']:9.3f}ms")
+    print(f"結果を {args.output} に追記しました。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
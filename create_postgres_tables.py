@@ -1,18 +1,477 @@
-import psycopg2
+import argparse
 
+from backend_logic import (
+    HISTORY_MONTHS_AHEAD,
+    SEARCHABLE_COLUMNS,
+    STOCK_ALERT_CHANNEL,
+    get_db_connection,
+)
+from storage_engine import (
+    APPLIED_MOVEMENTS_RETENTION_DAYS,
+    HIRAGANA,
+    INVENTORY_INDEXED_COLUMNS,
+    INVENTORY_SORT_EXPRESSIONS,
+    KATAKANA,
+    POPULARITY_BACKFILL_DAYS,
+    POPULARITY_EPOCH,
+    POPULARITY_HALF_LIFE_DAYS,
+    SEARCH_KEY_COLUMNS,
+    STOCK_ALERT_RECOVERED,
+    STOCK_ALERT_SHORTAGE,
+)
+
+# 履歴の持ち方
+#   wide   : history に1件ごとの型番・製品名・カテゴリ・メーカーをそのまま書く（従来どおり）
+#   compact: history_compact に (日時, 品目ID, 数量, 在庫数量) だけを書き、
+#            品目（型番・製品名）は history_items、カテゴリ・メーカーは辞書テーブルに1回だけ持つ
+#            history は従来と同じ列のビューになるので、読み書きするコードはそのまま動く
+#            （PostgreSQL 15 以上が必要）
+HISTORY_LAYOUTS = ("wide", "compact")
+
+# compact で使うテーブル（ダミーデータの作り直しなどで、まとめて空にする用）
+COMPACT_HISTORY_TABLES = ("history_compact", "history_items", "categories", "makers")
+
+# 履歴の月別パーティションを作る関数
+# - from_month の月から「今月＋months_ahead」までの <parent>_YYYYMM を作る
+# - 既定パーティション(<parent>_default)に該当月の行があれば、新しいパーティションへ移してから付け替える
+# - アプリ（backend_logic）も月が変わるたびに呼ぶので、同時に呼ばれても1つずつ作る
+ENSURE_HISTORY_PARTITIONS_SQL = """
+CREATE OR REPLACE FUNCTION ensure_history_partitions(
+    months_ahead integer DEFAULT 3,
+    from_month date DEFAULT NULL,
+    parent text DEFAULT 'history'
+) RETURNS integer
+LANGUAGE plpgsql AS $$
+DECLARE
+    month_start date := date_trunc('month', COALESCE(from_month, now()::date))::date;
+    last_month date := (date_trunc('month', now()) + make_interval(months => months_ahead))::date;
+    month_end date;
+    part_name text;
+    created integer := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_history_partitions'));
+    WHILE month_start <= last_month LOOP
+        month_end := (month_start + interval '1 month')::date;
+        part_name := parent || '_' || to_char(month_start, 'YYYYMM');
+        IF to_regclass(part_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)', part_name, parent);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM %I WHERE 日時 >= %L AND 日時 < %L RETURNING *)'
+                ' INSERT INTO %I SELECT * FROM moved',
+                parent || '_default', month_start, month_end, part_name
+            );
+            EXECUTE format(
+                'ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                parent, part_name, month_start, month_end
+            );
+            created := created + 1;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$
+"""
+
+
+# compact の history ビュー
+# 外部結合にしておくと、日時・数量だけを読む集計では品目・辞書テーブルの結合が省かれる
+# （history_compact の各行には必ず品目があるので、内部結合と結果は同じ）
+COMPACT_HISTORY_VIEW_SQL = """
+CREATE OR REPLACE VIEW history AS
+SELECT h.日時, i.型番, i.製品名, c.カテゴリ, m.メーカー, h.数量, h.在庫数量, h.id
+FROM history_compact h
+LEFT JOIN history_items i ON i.id = h.item_id
+LEFT JOIN categories c ON c.id = i.category_id
+LEFT JOIN makers m ON m.id = i.maker_id
+"""
+
+# history ビューへの INSERT を history_compact へ書き換える
+# カテゴリ・メーカー・品目は、既にあればそのIDを使い、無ければ登録する
+# （同時に同じものを登録しても ON CONFLICT で1つにまとまる）
+COMPACT_HISTORY_INSERT_SQL = """
+CREATE OR REPLACE FUNCTION history_insert_compact() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    cid integer;
+    mid integer;
+    iid integer;
+BEGIN
+    IF NEW.カテゴリ IS NOT NULL THEN
+        SELECT id INTO cid FROM categories WHERE カテゴリ = NEW.カテゴリ;
+        IF cid IS NULL THEN
+            INSERT INTO categories (カテゴリ) VALUES (NEW.カテゴリ)
+            ON CONFLICT DO NOTHING RETURNING id INTO cid;
+            IF cid IS NULL THEN
+                SELECT id INTO cid FROM categories WHERE カテゴリ = NEW.カテゴリ;
+            END IF;
+        END IF;
+    END IF;
+
+    IF NEW.メーカー IS NOT NULL THEN
+        SELECT id INTO mid FROM makers WHERE メーカー = NEW.メーカー;
+        IF mid IS NULL THEN
+            INSERT INTO makers (メーカー) VALUES (NEW.メーカー)
+            ON CONFLICT DO NOTHING RETURNING id INTO mid;
+            IF mid IS NULL THEN
+                SELECT id INTO mid FROM makers WHERE メーカー = NEW.メーカー;
+            END IF;
+        END IF;
+    END IF;
+
+    -- 型番で索引を引き、残りの列は NULL 同士も同じものとして比べる
+    SELECT id INTO iid FROM history_items
+    WHERE (型番 = NEW.型番 OR (NEW.型番 IS NULL AND 型番 IS NULL))
+      AND 製品名 IS NOT DISTINCT FROM NEW.製品名
+      AND category_id IS NOT DISTINCT FROM cid
+      AND maker_id IS NOT DISTINCT FROM mid;
+    IF iid IS NULL THEN
+        INSERT INTO history_items (型番, 製品名, category_id, maker_id)
+        VALUES (NEW.型番, NEW.製品名, cid, mid)
+        ON CONFLICT DO NOTHING RETURNING id INTO iid;
+        IF iid IS NULL THEN
+            SELECT id INTO iid FROM history_items
+            WHERE (型番 = NEW.型番 OR (NEW.型番 IS NULL AND 型番 IS NULL))
+              AND 製品名 IS NOT DISTINCT FROM NEW.製品名
+              AND category_id IS NOT DISTINCT FROM cid
+              AND maker_id IS NOT DISTINCT FROM mid;
+        END IF;
+    END IF;
+
+    INSERT INTO history_compact (日時, item_id, 数量, 在庫数量)
+    VALUES (NEW.日時, iid, NEW.数量, NEW.在庫数量);
+    RETURN NEW;
+END;
+$$
+"""
+
+# wide（または移行前）の履歴 history_legacy を compact へまとめて移す
+# 1件ずつトリガーを通すと遅いので、辞書→品目→履歴の順に集合で入れる
+# 品目との突き合わせは、NULL も区別できる jsonb の配列をキーにしてハッシュ結合させる
+# 日時は秒までなので、同じ日時の行は元の追記順（id）のまま入れる（新しい id も同じ順に振られる）
+MIGRATE_TO_COMPACT_SQL = (
+    """
+INSERT INTO categories (カテゴリ)
+SELECT DISTINCT カテゴリ FROM history_legacy WHERE カテゴリ IS NOT NULL
+ON CONFLICT DO NOTHING
+""",
+    """
+INSERT INTO makers (メーカー)
+SELECT DISTINCT メーカー FROM history_legacy WHERE メーカー IS NOT NULL
+ON CONFLICT DO NOTHING
+""",
+    """
+CREATE TEMPORARY TABLE legacy_keyed ON COMMIT DROP AS
+SELECT h.日時, h.型番, h.製品名, c.id AS category_id, m.id AS maker_id, h.数量, h.在庫数量,
+       jsonb_build_array(h.型番, h.製品名, c.id, m.id) AS item_key,
+       row_number() OVER (ORDER BY h.id) AS seq
+FROM history_legacy h
+LEFT JOIN categories c ON c.カテゴリ = h.カテゴリ
+LEFT JOIN makers m ON m.メーカー = h.メーカー
+""",
+    """
+INSERT INTO history_items (型番, 製品名, category_id, maker_id)
+SELECT DISTINCT 型番, 製品名, category_id, maker_id FROM legacy_keyed
+ON CONFLICT DO NOTHING
+""",
+    """
+INSERT INTO history_compact (日時, item_id, 数量, 在庫数量)
+SELECT k.日時, i.id, k.数量, k.在庫数量
+FROM legacy_keyed k
+JOIN history_items i
+  ON jsonb_build_array(i.型番, i.製品名, i.category_id, i.maker_id) = k.item_key
+ORDER BY k.seq
+""",
+)
+
+# 在庫が変わったら NOTIFY inventory_changed で型番を知らせる（型番詳細キャッシュの無効化用）
+# 1文で大量に変わったとき（CSV取り込みなど）は、型番ごとではなく "*"（全部）を1回だけ送る
+NOTIFY_INVENTORY_CHANGED_SQL = """
+CREATE OR REPLACE FUNCTION notify_inventory_changed() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+    IF (SELECT count(*) FROM changed) > 100 THEN
+        PERFORM pg_notify('inventory_changed', '*');
+    ELSE
+        PERFORM pg_notify('inventory_changed', 型番) FROM changed WHERE 型番 IS NOT NULL;
+    END IF;
+    RETURN NULL;
+END;
+$$
+"""
+
+# 在庫数が発注点をまたいだら stock_alerts に記録し、NOTIFY でも知らせる
+# 関数を呼ぶかどうかはトリガーの WHEN で判定するので、またがない更新では何も増えない
+RECORD_STOCK_ALERT_SQL = f"""
+CREATE OR REPLACE FUNCTION record_stock_alert() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+    alert stock_alerts;
+BEGIN
+    INSERT INTO stock_alerts (型番, 在庫数量, 発注点, 状態)
+    VALUES (
+        NEW.型番, NEW.現在数量, NEW.発注点,
+        CASE WHEN NEW.現在数量 <= NEW.発注点
+             THEN '{STOCK_ALERT_SHORTAGE}' ELSE '{STOCK_ALERT_RECOVERED}' END
+    )
+    RETURNING * INTO alert;
+    PERFORM pg_notify('{STOCK_ALERT_CHANNEL}', row_to_json(alert)::text);
+    RETURN NULL;
+END;
+$$
+"""
+
+# 発注点を新しく設定した時点で既に下回っていれば、それも「不足」として記録する
+STOCK_ALERT_TRIGGER_SQL = """
+CREATE TRIGGER inventory_stock_alert
+AFTER UPDATE OF 現在数量, 発注点 ON inventory
+FOR EACH ROW
+WHEN (
+    NEW.発注点 IS NOT NULL
+    AND COALESCE(OLD.現在数量 <= OLD.発注点, false)
+        IS DISTINCT FROM (NEW.現在数量 <= NEW.発注点)
+)
+EXECUTE FUNCTION record_stock_alert()
+"""
+
+
+# 人気度を初めて作るとき、最近の履歴から型番ごとに数える（storage_engine.popularity_score の合計）
+# 型番ごとに一番新しい入出庫を基準に足すので、exp が大きくなりすぎない
+POPULARITY_BACKFILL_SQL = """
+INSERT INTO item_popularity (型番, 人気度)
+SELECT 型番, 最新 + ln(sum(exp(GREATEST(経過 - 最新, -50))))
+FROM (
+    SELECT 型番, 経過, max(経過) OVER (PARTITION BY 型番) AS 最新
+    FROM (
+        SELECT 型番,
+               extract(epoch FROM 日時 - %(epoch)s) / 86400 * ln(2) / %(half_life)s AS 経過
+        FROM history
+        WHERE 日時 >= localtimestamp - make_interval(days => %(days)s) AND 型番 IS NOT NULL
+    ) h
+) h
+GROUP BY 型番, 最新
+"""
 
-def create_tables():
-    print("🔨 PostgreSQLにテーブルを作成中...")
 
-    # データベースに接続
-    conn = psycopg2.connect(
-        host="localhost",
-        port="5432",
-        database="postgres",
-        user="postgres",
-        password="password",
+# 検索キー（storage_engine.search_key と同じ変換）
+# NFKC で全角英数字・半角カナをそろえ、英字を小文字に（"C" の照合順序なら英字だけが変わる）、
+# 空白を除いて、カタカナをひらがなにする。生成列に使うので IMMUTABLE にする
+SEARCH_KEY_FUNCTION_SQL = f"""
+CREATE OR REPLACE FUNCTION search_key(value text) RETURNS text
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+    SELECT translate(
+        regexp_replace(lower(normalize(value, NFKC) COLLATE "C"), '\\s', '', 'g'),
+        '{KATAKANA}', '{HIRAGANA}'
     )
-    conn.autocommit = True
+$$
+"""
+
+
+def current_history_layout(cursor):
+    """
+    今の history の持ち方を返す
+    （"wide" / "compact" / 分割前の "legacy" / まだ無ければ None）
+    """
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('history')")
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return {"p": "wide", "v": "compact"}.get(row[0], "legacy")
+
+
+def create_history(cursor, months_ahead=HISTORY_MONTHS_AHEAD, layout=None):
+    """
+    history を layout の持ち方で作る（layout が None なら今の持ち方のまま）
+    持ち方が変わるときは、既存の履歴を新しい持ち方へ移す
+    """
+    current = current_history_layout(cursor)
+    if current is not None:
+        add_history_ids(cursor, current)
+    if layout is None:
+        layout = current if current in HISTORY_LAYOUTS else "wide"
+    if layout not in HISTORY_LAYOUTS:
+        raise ValueError(f"履歴の持ち方は {', '.join(HISTORY_LAYOUTS)} のどれかです: {layout}")
+    if layout == "compact":
+        cursor.execute("SHOW server_version_num")
+        if int(cursor.fetchone()[0]) < 150000:
+            raise ValueError("compact の履歴には PostgreSQL 15 以上が必要です。")
+
+    cursor.execute(ENSURE_HISTORY_PARTITIONS_SQL)
+
+    migrate_from = current if current is not None and current != layout else None
+    if migrate_from:
+        # いったん退避して作り直し、最後に中身を移して消す
+        print(f"既存の history ({migrate_from}) を {layout} へ移行します...")
+        kind = "VIEW" if migrate_from == "compact" else "TABLE"
+        cursor.execute(f"ALTER {kind} history RENAME TO history_legacy")
+
+    if layout == "wide":
+        parent = "history"
+        create_wide_history(cursor)
+    else:
+        parent = "history_compact"
+        create_compact_history(cursor)
+
+    if migrate_from:
+        # 一番古い月から先の月までパーティションを作ってから流し込む
+        cursor.execute(
+            "SELECT ensure_history_partitions(%s, (SELECT min(日時) FROM history_legacy)::date, %s)",
+            (months_ahead, parent),
+        )
+        if layout == "wide":
+            cursor.execute(
+                """
+            INSERT INTO history (日時, 型番, 製品名, カテゴリ, メーカー, 数量, 在庫数量)
+            SELECT 日時, 型番, 製品名, カテゴリ, メーカー, 数量, 在庫数量 FROM history_legacy
+            ORDER BY id
+            """
+            )
+            moved = cursor.rowcount
+        else:
+            for sql in MIGRATE_TO_COMPACT_SQL:
+                cursor.execute(sql)
+            moved = cursor.rowcount
+        print(f"{moved}件の履歴を移行しました。")
+        # 入れ直した直後は統計が無く、型番での検索などで実行計画を誤るので取り直す
+        for table in ("history",) if layout == "wide" else COMPACT_HISTORY_TABLES:
+            cursor.execute(f"ANALYZE {table}")
+
+        if migrate_from == "compact":
+            cursor.execute("DROP VIEW history_legacy")
+            cursor.execute(f"DROP TABLE {', '.join(COMPACT_HISTORY_TABLES)}")
+            cursor.execute("DROP FUNCTION history_insert_compact()")
+        else:
+            cursor.execute("DROP TABLE history_legacy")
+    else:
+        cursor.execute("SELECT ensure_history_partitions(%s, NULL, %s)", (months_ahead, parent))
+
+
+def add_history_ids(cursor, layout):
+    """
+    追記順の id が無い（この列を足す前に作った）履歴に id を足す
+    今ある行には物理的な並びの順に振られる（それまでの ctid の順と同じ）
+    """
+    table = "history_compact" if layout == "compact" else "history"
+    cursor.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS id BIGSERIAL")
+    if layout == "compact":
+        cursor.execute(COMPACT_HISTORY_VIEW_SQL)
+
+
+def create_wide_history(cursor):
+    # historyテーブル（履歴）
+    # 1列目: 日時
+    # 2列目: 型番
+    # 3列目: 製品名
+    # 4列目: カテゴリ
+    # 5列目: メーカー
+    # 6列目: 数量（移動数）
+    # 7列目: 在庫数量（残数）
+    # 8列目: id（追記順の連番。日時は秒までなので、同じ日時の行はこの順に並べる）
+    # 日時で月ごとにパーティション分割する（範囲外・日時なしの行は history_default へ）
+    # ctid は VACUUM 後の空き領域の再利用やパーティションへの移動で追記順と変わるので、並べ替えには使わない
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS history (
+        日時 TIMESTAMP,
+        型番 TEXT,
+        製品名 TEXT,
+        カテゴリ TEXT,
+        メーカー TEXT,
+        数量 INTEGER,
+        在庫数量 INTEGER,
+        id BIGSERIAL
+    ) PARTITION BY RANGE (日時);
+    """
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS history_default PARTITION OF history DEFAULT"
+    )
+
+    # 日時の範囲検索はBRIN（追記順＝日時順なのでとても小さい）、
+    # 型番ごとの履歴は (型番, 日時) の索引で引く
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS history_日時_brin ON history USING brin (日時)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS history_型番_日時_idx ON history (型番, 日時)"
+    )
+    # 差分書き出し（export_data.py --watermark）は追記順の id で続きを探す
+    cursor.execute("CREATE INDEX IF NOT EXISTS history_id_brin ON history USING brin (id)")
+
+
+def create_compact_history(cursor):
+    # 辞書テーブル（カテゴリ・メーカーの文字列を1回だけ持つ）
+    for table, column in (("categories", "カテゴリ"), ("makers", "メーカー")):
+        cursor.execute(
+            f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+            {column} TEXT NOT NULL UNIQUE
+        )
+        """
+        )
+
+    # 品目（履歴に書かれた 型番・製品名・カテゴリ・メーカー の組み合わせごとに1行）
+    # 製品名などが途中で変わっても、その時点の値で履歴を読めるように組み合わせで持つ
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS history_items (
+        id INTEGER GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        型番 TEXT,
+        製品名 TEXT,
+        category_id INTEGER,
+        maker_id INTEGER,
+        UNIQUE NULLS NOT DISTINCT (型番, 製品名, category_id, maker_id)
+    )
+    """
+    )
+
+    # 履歴本体（固定長の4列だけなので、1行が wide の半分以下になる）
+    # 1列目: 日時
+    # 2列目: 品目ID
+    # 3列目: 数量（移動数）
+    # 4列目: 在庫数量（残数）
+    # 5列目: id（追記順の連番）
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS history_compact (
+        日時 TIMESTAMP,
+        item_id INTEGER NOT NULL,
+        数量 INTEGER,
+        在庫数量 INTEGER,
+        id BIGSERIAL
+    ) PARTITION BY RANGE (日時);
+    """
+    )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS history_compact_default PARTITION OF history_compact DEFAULT"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS history_compact_日時_brin ON history_compact USING brin (日時)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS history_compact_item_日時_idx ON history_compact (item_id, 日時)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS history_compact_id_brin ON history_compact USING brin (id)"
+    )
+
+    # 従来の列で読み書きできるビュー
+    cursor.execute(COMPACT_HISTORY_VIEW_SQL)
+    cursor.execute(COMPACT_HISTORY_INSERT_SQL)
+    cursor.execute("DROP TRIGGER IF EXISTS history_insert ON history")
+    cursor.execute(
+        "CREATE TRIGGER history_insert INSTEAD OF INSERT ON history"
+        " FOR EACH ROW EXECUTE FUNCTION history_insert_compact()"
+    )
+
+
+def create_tables(months_ahead=HISTORY_MONTHS_AHEAD, history_layout=None):
+    print("🔨 PostgreSQLにテーブルを作成中...")
+
+    # データベースに接続（接続先は config.ini の [POSTGRESQL]）
+    conn, _ = get_db_connection()
+    # 既存の history の移行もあるので、全体を1つのトランザクションで行う
     cursor = conn.cursor()
 
     # ---------------------------------------------------------
@@ -27,6 +486,7 @@ def create_tables():
     # 5列目: メーカー
     # 6列目: 現在数量
     # 7列目: 保管場所 (数字)
+    # 8列目: 発注点（在庫数がこれ以下になったらアラート。NULLならアラートなし）
     cursor.execute(
         """
     CREATE TABLE IF NOT EXISTS inventory (
@@ -36,36 +496,180 @@ def create_tables():
         カテゴリ TEXT,
         メーカー TEXT,
         現在数量 INTEGER,
-        保管場所 INTEGER
+        保管場所 INTEGER,
+        発注点 INTEGER
     );
     """
     )
+    # 発注点より前の版で作ったテーブルには列を足す
+    cursor.execute("ALTER TABLE inventory ADD COLUMN IF NOT EXISTS 発注点 INTEGER")
 
-    # historyテーブル（履歴）
-    # 1列目: 日時
-    # 2列目: 型番
-    # 3列目: 製品名
-    # 4列目: カテゴリ
-    # 5列目: メーカー
-    # 6列目: 数量（移動数）
-    # 7列目: 在庫数量（残数）
+    # 履歴（wide / compact のどちらでも、history を従来の列で読み書きできる）
+    create_history(cursor, months_ahead, history_layout)
+
+    # ---------------------------------------------------------
+    # 2. サジェスト用の索引
+    # ---------------------------------------------------------
+    # 前方一致(LIKE 'abc%')はロケールに関係なく text_pattern_ops の索引で引ける
+    # （型番のUNIQUE制約の索引は通常の照合順序なので LIKE には使われない）
+    for column in SEARCHABLE_COLUMNS:
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS inventory_{column}_prefix_idx"
+            f" ON inventory ({column} text_pattern_ops)"
+        )
+
+    # ---------------------------------------------------------
+    # 3. 在庫の変更通知
+    # ---------------------------------------------------------
+    # 変更後の行を一括で受け取れる文単位トリガー（INSERT・UPDATE・DELETEで1つずつ必要）
+    cursor.execute(NOTIFY_INVENTORY_CHANGED_SQL)
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        table = "OLD" if event == "DELETE" else "NEW"
+        trigger = f"inventory_{event.lower()}_notify"
+        cursor.execute(f"DROP TRIGGER IF EXISTS {trigger} ON inventory")
+        cursor.execute(
+            f"CREATE TRIGGER {trigger} AFTER {event} ON inventory"
+            f" REFERENCING {table} TABLE AS changed"
+            " FOR EACH STATEMENT EXECUTE FUNCTION notify_inventory_changed()"
+        )
+
+    # ---------------------------------------------------------
+    # 4. 反映済みの入出庫ID（オフライン分を送り直しても二重に数えないため）
+    # ---------------------------------------------------------
     cursor.execute(
         """
-    CREATE TABLE IF NOT EXISTS history (
+    CREATE TABLE IF NOT EXISTS applied_movements (
+        movement_id TEXT PRIMARY KEY,
+        applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS applied_movements_applied_at_idx"
+        " ON applied_movements USING brin (applied_at)"
+    )
+    # 送り直しは数日以内に終わるので、古いIDは月1回の実行のついでに消す
+    cursor.execute(
+        "DELETE FROM applied_movements WHERE applied_at < now() - make_interval(days => %s)",
+        (APPLIED_MOVEMENTS_RETENTION_DAYS,),
+    )
+
+    # ---------------------------------------------------------
+    # 5. 発注点アラート
+    # ---------------------------------------------------------
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS stock_alerts (
+        id BIGINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+        日時 TIMESTAMP NOT NULL DEFAULT localtimestamp(0),
+        型番 TEXT,
+        在庫数量 INTEGER,
+        発注点 INTEGER,
+        状態 TEXT
+    )
+    """
+    )
+    cursor.execute(RECORD_STOCK_ALERT_SQL)
+    cursor.execute("DROP TRIGGER IF EXISTS inventory_stock_alert ON inventory")
+    cursor.execute(STOCK_ALERT_TRIGGER_SQL)
+
+    # ---------------------------------------------------------
+    # 6. 過去の在庫数のチェックポイント（stock_as_of.py checkpoint で月初めごとに作る）
+    # ---------------------------------------------------------
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS stock_checkpoints (
         日時 TIMESTAMP,
         型番 TEXT,
-        製品名 TEXT,
-        カテゴリ TEXT,
-        メーカー TEXT,
-        数量 INTEGER,
-        在庫数量 INTEGER
-    );
+        在庫数量 INTEGER,
+        PRIMARY KEY (日時, 型番)
+    )
+    """
+    )
+
+    # ---------------------------------------------------------
+    # 7. サジェストの並び順に使う型番ごとの人気度（入出庫のたびに足す）
+    # ---------------------------------------------------------
+    cursor.execute("CREATE SEQUENCE IF NOT EXISTS item_popularity_version_seq")
+    cursor.execute(
+        """
+    CREATE TABLE IF NOT EXISTS item_popularity (
+        型番 TEXT PRIMARY KEY,
+        人気度 DOUBLE PRECISION NOT NULL,
+        版 BIGINT NOT NULL DEFAULT nextval('item_popularity_version_seq')
+    )
     """
     )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS item_popularity_版_idx ON item_popularity (版)"
+    )
+    # サジェストで人気度の高い型番から決まった件数だけを読む用
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS item_popularity_人気度_idx ON item_popularity (人気度 DESC)"
+    )
+    cursor.execute("SELECT NOT EXISTS (SELECT 1 FROM item_popularity)")
+    if cursor.fetchone()[0]:
+        cursor.execute(
+            POPULARITY_BACKFILL_SQL,
+            {
+                "epoch": POPULARITY_EPOCH,
+                "half_life": POPULARITY_HALF_LIFE_DAYS,
+                "days": POPULARITY_BACKFILL_DAYS,
+            },
+        )
 
+    # ---------------------------------------------------------
+    # 8. 製品名・メーカーのあいまい検索（検索キーの生成列と、3文字組の索引）
+    # ---------------------------------------------------------
+    cursor.execute(SEARCH_KEY_FUNCTION_SQL)
+    for column, key_column in SEARCH_KEY_COLUMNS.items():
+        cursor.execute(
+            f"ALTER TABLE inventory ADD COLUMN IF NOT EXISTS {key_column} TEXT"
+            f" GENERATED ALWAYS AS (search_key({column})) STORED"
+        )
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm')"
+    )
+    if cursor.fetchone()[0]:
+        # 日本語の3文字組を作るには、DBの LC_CTYPE が C 以外（ja_JP.UTF-8 など）である必要がある
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for key_column in SEARCH_KEY_COLUMNS.values():
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS inventory_{key_column}_trgm_idx"
+                f" ON inventory USING gin ({key_column} gin_trgm_ops)"
+            )
+    else:
+        print("⚠ pg_trgm が無いため、あいまい検索は部分一致を順に探すだけになります。")
+
+    # ---------------------------------------------------------
+    # 9. 在庫一覧の並べ替え・絞り込み（キーセット方式のページ送り用）
+    # ---------------------------------------------------------
+    # 並べ替えと同じ式（NULL を読み替えたもの）と "No." の索引（現在数量は作らない）
+    for column in INVENTORY_INDEXED_COLUMNS:
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS inventory_{column}_list_idx"
+            f' ON inventory ({INVENTORY_SORT_EXPRESSIONS[column]}, "No.")'
+        )
+
+    conn.commit()
     print("テーブル作成完了！")
     conn.close()
 
 
 if __name__ == "__main__":
-    create_tables()
+    parser = argparse.ArgumentParser(
+        description="テーブル・索引を作成する（先の月の履歴パーティションは、アプリも月が変わると作る）"
+    )
+    parser.add_argument(
+        "--months-ahead",
+        type=int,
+        default=HISTORY_MONTHS_AHEAD,
+        help="何か月先までの履歴パーティションを作っておくか",
+    )
+    parser.add_argument(
+        "--history-layout",
+        choices=HISTORY_LAYOUTS,
+        help="履歴の持ち方（省略時は今のまま。変えると既存の履歴も移行する）",
+    )
+    args = parser.parse_args()
+    create_tables(args.months_ahead, args.history_layout)
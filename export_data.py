@@ -0,0 +1,257 @@
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+import backend_logic as logic
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+# 書き出せるテーブルと列（並び順のキーも兼ねる）
+EXPORT_TABLES = {
+    "history": {
+        "columns": ("日時", "型番", "製品名", "カテゴリ", "メーカー", "数量", "在庫数量"),
+        "order_by": "日時, id",
+    },
+    "inventory": {
+        "columns": ('"No."', "型番", "製品名", "カテゴリ", "メーカー", "現在数量", "保管場所"),
+        "order_by": '"No."',
+    },
+}
+
+CHUNK_SIZE = 5000  # JSONLでサーバーから一度に受け取る行数
+
+# 差分書き出しの区切りは、履歴の追記順の id（日時ではない）
+# 日時で区切ると、後から送られた入出庫（端末のジャーナルから元の日時のまま送り直したもの）や、
+# 先に始まって遅くコミットした書き込みが、前回の区切りより前の日時で後から現れて抜けてしまう
+# 今回の上限は、書き込み中のトランザクションが終わるのを待ってから採番済みの id で決める
+# （その間の新しい書き込みは待たされるので、待つのはこの時間まで。過ぎたら今回は書き出さない）
+WATERMARK_LOCK_TIMEOUT_MS = 2000
+LOCK_NOT_AVAILABLE = "55P03"  # lock_timeout を過ぎたときの SQLSTATE
+
+
+# ==================================================================================
+# 書き出し処理
+# ==================================================================================
+def build_query(table, since=None, until=None, models=None, after=None, upto=None):
+    """
+    書き出し用のSELECT文と、パラメータを返す
+
+    :param since: この日時以降（history のみ）
+    :param until: この日時より前（history のみ）
+    :param models: 型番の一覧で絞り込む
+    :param after: 前回の書き出しの区切り（この id より後だけ。前の版の区切りファイルなら最終日時）
+    :param upto: 今回の書き出しの区切り（この id 以前だけ）
+    """
+    spec = EXPORT_TABLES[table]
+    conditions = []
+    params = []
+
+    time_filters = [("日時 >= %s", since), ("日時 < %s", until)]
+    if isinstance(after, datetime):
+        time_filters.append(("日時 > %s", after))
+    else:
+        time_filters.append(("id > %s", after))
+    time_filters.append(("id <= %s", upto))
+    for condition, value in time_filters:
+        if value is None:
+            continue
+        if table != "history":
+            raise ValueError("日時での絞り込みは history だけで使えます。")
+        conditions.append(condition)
+        params.append(value)
+
+    if models:
+        conditions.append("型番 = ANY(%s)")
+        params.append(list(models))
+
+    query = f"SELECT {', '.join(spec['columns'])} FROM {table}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += f" ORDER BY {spec['order_by']}"
+    return query, params
+
+
+def read_watermark(path):
+    """
+    前回の区切り（履歴の id）を読む（ファイルが無ければ None）
+    前の版が書いた最終日時のファイルなら datetime を返す（次の書き出しから id に置き換わる）
+    """
+    if not path or not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        text = f.read().strip()
+    if not text:
+        return None
+    return int(text) if text.isdigit() else datetime.fromisoformat(text)
+
+
+def write_watermark(path, value):
+    """区切りを書き込む（途中で落ちても壊れないよう、一時ファイルから置き換える）"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(str(value))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def committed_history_id(conn, lock_timeout_ms=WATERMARK_LOCK_TIMEOUT_MS):
+    """
+    これ以下の id の履歴はすべてコミット済み（またはロールバック済み）という id を返す
+
+    history を SHARE で一瞬ロックして、書き込み中のトランザクションが終わるのを待ち、
+    その時点で採番済みの最後の id を読む（以後に書かれる行の id は必ずこれより大きい）
+    compact の history はビューなので、ロックは history_compact にもかかる
+    """
+    with conn.cursor() as cursor:
+        cursor.execute("SET LOCAL lock_timeout = %s", (f"{int(lock_timeout_ms)}ms",))
+        try:
+            cursor.execute("LOCK TABLE history IN SHARE MODE")
+        except logic.psycopg2.OperationalError as e:
+            conn.rollback()
+            if e.pgcode != LOCK_NOT_AVAILABLE:
+                raise
+            raise ValueError(
+                f"書き込み中のトランザクションが {lock_timeout_ms}ms で終わらなかったため、"
+                "今回の差分書き出しを見送りました。時間をおいて再実行してください。"
+            )
+        cursor.execute(
+            "SELECT pg_get_serial_sequence(CASE WHEN to_regclass('history_compact') IS NULL"
+            " THEN 'history' ELSE 'history_compact' END, 'id')"
+        )
+        sequence = cursor.fetchone()[0]
+        cursor.execute(f"SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM {sequence}")
+        upto = cursor.fetchone()[0]
+    conn.commit()  # ロックはすぐに放す
+    return upto
+
+
+def export_table(
+    table,
+    output_path,
+    fmt="csv",
+    since=None,
+    until=None,
+    models=None,
+    watermark_path=None,
+    encoding="utf-8-sig",
+    chunk_size=CHUNK_SIZE,
+):
+    """
+    テーブルをファイルへ少しずつ書き出す（件数が多くてもメモリは一定）
+    - csv  : COPY TO STDOUT をそのままファイルに流す
+    - jsonl: サーバーサイドカーソルで chunk_size 行ずつ受け取る
+
+    watermark_path を指定すると、前回の続き（前回の区切りより後に追記された行）だけを書き出し、
+    成功したら今回の区切り（履歴の id）で更新する。後から届いた古い日時の入出庫も、次の回で書き出される
+
+    :return: 書き出した行数
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"書き出せないテーブルです: {table}")
+    if fmt not in ("csv", "jsonl"):
+        raise ValueError(f"未対応の形式です: {fmt}")
+    if watermark_path and table != "history":
+        raise ValueError("差分書き出しは history だけで使えます。")
+    if logic.DB_ENGINE != "postgresql":
+        raise ValueError("書き出しは PostgreSQL でのみ使えます（config.ini の engine を確認してください）。")
+
+    conn, cursor_factory = logic.get_db_connection()
+    try:
+        after = read_watermark(watermark_path)
+        upto = None
+        if watermark_path:
+            # 書き出し中に増えた行・まだコミットされていない行で抜けが出ないよう、先に今回の上限を決めておく
+            upto = committed_history_id(conn)
+            if isinstance(after, int) and upto <= after:
+                return 0  # 前回から増えていない
+
+        # 書き込みは一切しないので、読み取り専用トランザクションで実行する
+        conn.set_session(readonly=True)
+
+        query, params = build_query(table, since, until, models, after, upto)
+
+        if fmt == "csv":
+            with conn.cursor() as cursor:
+                copy_sql = cursor.mogrify(query, params).decode()
+                with open(output_path, "w", encoding=encoding, newline="") as out:
+                    cursor.copy_expert(
+                        f"COPY ({copy_sql}) TO STDOUT WITH (FORMAT csv, HEADER true)",
+                        out,
+                    )
+                count = cursor.rowcount
+        else:
+            count = 0
+            with conn.cursor(name="export_cursor", cursor_factory=cursor_factory) as cursor:
+                cursor.itersize = chunk_size
+                cursor.execute(query, params)
+                with open(output_path, "w", encoding="utf-8") as out:
+                    for row in cursor:
+                        out.write(json.dumps(row, ensure_ascii=False, default=str))
+                        out.write("\n")
+                        count += 1
+
+        conn.rollback()  # 読み取り専用トランザクションを閉じる
+        if watermark_path:
+            write_watermark(watermark_path, upto)
+        return count
+    finally:
+        conn.close()
+
+
+def parse_datetime(text):
+    return datetime.fromisoformat(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="在庫・履歴をCSV/JSONLに少しずつ書き出す（パワークエリで全件を引かずに済むように）"
+    )
+    parser.add_argument("table", choices=sorted(EXPORT_TABLES), help="書き出すテーブル")
+    parser.add_argument("output", help="書き出し先のファイル")
+    parser.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    parser.add_argument(
+        "--since", type=parse_datetime, help="この日時以降（例: 2024-04-01）"
+    )
+    parser.add_argument(
+        "--until", type=parse_datetime, help="この日時より前（例: 2024-05-01）"
+    )
+    parser.add_argument(
+        "--model", action="append", dest="models", help="型番で絞り込む（複数指定可）"
+    )
+    parser.add_argument(
+        "--watermark",
+        help="差分書き出し用のファイル。前回の書き出しより後に追記された履歴だけを書き出し、成功したら更新する",
+    )
+    parser.add_argument(
+        "--encoding", default="utf-8-sig", help="CSVの文字コード（Excel向けの既定は BOM付きUTF-8）"
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    print(f"📤 {args.table} を {args.output} に書き出し中...")
+    try:
+        count = export_table(
+            args.table,
+            args.output,
+            fmt=args.format,
+            since=args.since,
+            until=args.until,
+            models=args.models,
+            watermark_path=args.watermark,
+            encoding=args.encoding,
+            chunk_size=args.chunk_size,
+        )
+    except ValueError as e:
+        print(f"書き出しを中止しました: {e}")
+        return 1
+
+    print(f"書き出し完了！ {count}行")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+import argparse
+import csv
+import sys
+from datetime import datetime
+
+import backend_logic as logic
+import storage_engine
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+# CSVに書いてよい列（1行目に列名を書く。順番は自由、処理種別・カテゴリ・メーカー・保管場所は省略可）
+IMPORT_COLUMNS = ("処理種別", "型番", "製品名", "カテゴリ", "メーカー", "数量", "保管場所")
+REQUIRED_COLUMNS = ("型番", "製品名", "数量")
+
+# UIと同じ全角→半角の変換表（backend_logic._sanitize_input と揃える）
+ZEN_DIGITS = "０１２３４５６７８９"
+HAN_DIGITS = "0123456789"
+ZEN_ALNUM = "０１２３４５６７８９ＡＢＣＤＥＦＧＨＩＪＫＬＭＮＯＰＱＲＳＴＵＶＷＸＹＺａｂｃｄｅｆｇｈｉｊｋｌｍｎｏｐｑｒｓｔｕｖｗｘｙｚ"
+HAN_ALNUM = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+
+# ==================================================================================
+# SQL
+# ==================================================================================
+# 1. 取り込み用の一時テーブル（行番号はCOPYした順に振られる）
+CREATE_STAGING_SQL = """
+CREATE TEMP TABLE import_staging (
+    行番号 BIGSERIAL,
+    処理種別 TEXT,
+    型番 TEXT,
+    製品名 TEXT,
+    カテゴリ TEXT,
+    メーカー TEXT,
+    数量 TEXT,
+    保管場所 TEXT
+) ON COMMIT DROP
+"""
+
+# 2. サニタイズとチェックをまとめて行う（理由が入った行は取り込まない）
+CHECK_SQL = """
+CREATE TEMP TABLE import_checked ON COMMIT DROP AS
+SELECT
+    s.行番号,
+    COALESCE(NULLIF(btrim(s.処理種別), ''), '補充') AS 処理種別,
+    s.型番, s.製品名, s.カテゴリ, s.メーカー,
+    q.数量, q.保管場所,
+    CASE
+        WHEN q.数量 IS NOT NULL AND q.数量 !~ '^[+-]?[0-9]{1,9}$'
+            THEN '数量には数字を入力してください。'
+        WHEN NULLIF(btrim(s.製品名), '') IS NULL OR q.数量 IS NULL
+            THEN '製品名と数量は必須です。'
+        WHEN s.型番 IS NULL
+            THEN '型番がありません。'
+        WHEN COALESCE(NULLIF(btrim(s.処理種別), ''), '補充') NOT IN ('補充', '使用')
+            THEN '処理種別は「補充」か「使用」を指定してください。'
+        WHEN q.保管場所 IS NOT NULL AND q.保管場所 !~ '^[0-9]{1,9}$'
+            THEN '保管場所には数字を入力してください。'
+    END AS 理由
+FROM import_staging s
+CROSS JOIN LATERAL (
+    SELECT
+        NULLIF(btrim(translate(s.数量, %(zen_digits)s, %(han_digits)s)), '') AS 数量,
+        NULLIF(btrim(translate(s.保管場所, %(zen_alnum)s, %(han_alnum)s)), '') AS 保管場所
+) q
+"""
+
+# 3. 1行ずつ足し引きした在庫数を、ウィンドウ関数でまとめて計算する
+#    0で止める計算 s(k) = max(0, s(k-1) + d(k)) は、累積和 S(k) を使って
+#    s(k) = S(k) - min(0, S(1), ..., S(k)) と書けるので、行ごとのループが要らない
+#    未登録の型番は、最初の行の数量がそのまま在庫数になる（UIの新規登録と同じ）
+MOVES_SQL = """
+CREATE TEMP TABLE import_moves ON COMMIT DROP AS
+WITH m AS (
+    SELECT
+        c.*,
+        c.数量::integer AS qty,
+        CASE WHEN c.処理種別 = '使用' THEN -c.数量::integer ELSE c.数量::integer END AS 増減,
+        i.型番 IS NULL AS is_new,
+        COALESCE(i.現在数量, 0) AS base,
+        row_number() OVER (PARTITION BY c.型番 ORDER BY c.行番号) AS seq
+    FROM import_checked c
+    LEFT JOIN inventory i ON i.型番 = c.型番
+    WHERE c.理由 IS NULL
+), r AS (
+    SELECT
+        m.*,
+        base + SUM(CASE WHEN is_new AND seq = 1 THEN qty ELSE 増減 END) OVER w AS raw
+    FROM m
+    WINDOW w AS (PARTITION BY 型番 ORDER BY 行番号)
+)
+SELECT r.*, raw - LEAST(0, MIN(raw) OVER w) AS 在庫数量
+FROM r
+WINDOW w AS (PARTITION BY 型番 ORDER BY 行番号)
+"""
+
+# 4. 型番ごとの最終行で在庫を登録・更新する（新規登録の製品名などは最初の行から）
+#    保管場所は空でない最後の値にする（列が無い・空欄なら、登録済みの保管場所を残す）
+MERGE_INVENTORY_SQL = """
+INSERT INTO inventory AS i (型番, 製品名, カテゴリ, メーカー, 現在数量, 保管場所)
+SELECT l.型番, f.製品名, f.カテゴリ, f.メーカー, l.在庫数量, loc.保管場所::integer
+FROM (
+    SELECT DISTINCT ON (型番) * FROM import_moves ORDER BY 型番, 行番号 DESC
+) l
+JOIN import_moves f ON f.型番 = l.型番 AND f.seq = 1
+LEFT JOIN (
+    SELECT DISTINCT ON (型番) 型番, 保管場所 FROM import_moves
+    WHERE 保管場所 IS NOT NULL
+    ORDER BY 型番, 行番号 DESC
+) loc ON loc.型番 = l.型番
+ON CONFLICT (型番) DO UPDATE
+    SET 現在数量 = EXCLUDED.現在数量,
+        保管場所 = COALESCE(EXCLUDED.保管場所, i.保管場所)
+"""
+
+# 5. 型番ごとの人気度を、取り込んだ行数の分だけ足す（backend_logic.STOCK_MOVEMENT_SQL と同じ計算）
+#    %(score)s は取り込んだ日時に1回動いたときの人気度。n 行なら ln(n) を足せば n 回分になる
+#    他の一括処理とロックの順番をそろえるため、型番の順に足す
+POPULARITY_SQL = """
+INSERT INTO item_popularity AS p (型番, 人気度)
+SELECT 型番, %(score)s + ln(count(*)) FROM import_moves
+GROUP BY 型番
+ORDER BY 型番
+ON CONFLICT (型番) DO UPDATE
+    SET 人気度 = GREATEST(p.人気度, EXCLUDED.人気度)
+               + ln(1 + exp(-LEAST(abs(p.人気度 - EXCLUDED.人気度), 50))),
+        版 = nextval('item_popularity_version_seq')
+"""
+
+# 6. 1行＝1件の履歴として記録する
+INSERT_HISTORY_SQL = """
+INSERT INTO history (日時, 型番, 製品名, カテゴリ, メーカー, 数量, 在庫数量)
+SELECT %s, 型番, 製品名, カテゴリ, メーカー, 増減, 在庫数量
+FROM import_moves
+ORDER BY 行番号
+"""
+
+REJECTS_SQL = """
+COPY (
+    SELECT s.行番号, c.理由, s.処理種別, s.型番, s.製品名, s.カテゴリ, s.メーカー, s.数量, s.保管場所
+    FROM import_checked c JOIN import_staging s USING (行番号)
+    WHERE c.理由 IS NOT NULL
+    ORDER BY s.行番号
+) TO STDOUT WITH (FORMAT csv, HEADER true)
+"""
+
+
+# ==================================================================================
+# 取り込み処理
+# ==================================================================================
+def read_header(csv_file):
+    """1行目の列名を読み、COPYに渡す列の並びを返す"""
+    header_line = csv_file.readline()
+    header = [name.strip() for name in next(csv.reader([header_line]), [])]
+
+    unknown = [name for name in header if name not in IMPORT_COLUMNS]
+    if unknown:
+        raise ValueError(f"知らない列があります: {', '.join(unknown)}")
+    missing = [name for name in REQUIRED_COLUMNS if name not in header]
+    if missing:
+        raise ValueError(f"必須の列がありません: {', '.join(missing)}")
+    if len(set(header)) != len(header):
+        raise ValueError("同じ列名が2回以上あります。")
+    return header
+
+
+def import_csv(path, encoding="utf-8-sig", rejects_path=None):
+    """
+    CSVファイルを COPY FROM STDIN で流し込み、在庫と履歴にまとめて反映する
+    ファイルはDBへストリームで送るので、どれだけ大きくてもメモリは増えない
+
+    :return: {"total": 全行数, "imported": 取り込んだ行数, "rejected": 除外した行数, "models": 更新した型番数}
+    """
+    if logic.DB_ENGINE != "postgresql":
+        raise ValueError("CSVの取り込みは PostgreSQL でのみ使えます（config.ini の engine を確認してください）。")
+
+    conn, _ = logic.get_db_connection()
+    try:
+        with open(path, encoding=encoding, newline="") as csv_file:
+            header = read_header(csv_file)
+
+            with conn.cursor() as cursor:
+                cursor.execute(CREATE_STAGING_SQL)
+                cursor.copy_expert(
+                    f"COPY import_staging ({', '.join(header)}) FROM STDIN WITH (FORMAT csv)",
+                    csv_file,
+                )
+                total = cursor.rowcount
+
+        with conn.cursor() as cursor:
+            cursor.execute(
+                CHECK_SQL,
+                {
+                    "zen_digits": ZEN_DIGITS,
+                    "han_digits": HAN_DIGITS,
+                    "zen_alnum": ZEN_ALNUM,
+                    "han_alnum": HAN_ALNUM,
+                },
+            )
+            cursor.execute("SELECT count(*) FROM import_checked WHERE 理由 IS NOT NULL")
+            rejected = cursor.fetchone()[0]
+
+            if rejected and rejects_path:
+                with open(rejects_path, "w", encoding=encoding, newline="") as out:
+                    cursor.copy_expert(REJECTS_SQL, out)
+
+            # 取り込み中に他のPCが在庫を書き換えないよう止める（読み取りは可能）
+            cursor.execute("LOCK TABLE inventory IN SHARE ROW EXCLUSIVE MODE")
+            cursor.execute(MOVES_SQL)
+            imported = cursor.rowcount
+            cursor.execute(MERGE_INVENTORY_SQL)
+            models = cursor.rowcount
+            now = datetime.now().replace(microsecond=0)
+            cursor.execute(POPULARITY_SQL, {"score": storage_engine.popularity_score(now)})
+            cursor.execute(INSERT_HISTORY_SQL, (now,))
+
+        conn.commit()
+        return {
+            "total": total,
+            "imported": imported,
+            "rejected": rejected,
+            "models": models,
+        }
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="CSVファイルの入出庫データを在庫・履歴にまとめて取り込む"
+    )
+    parser.add_argument("csv_path", help="取り込むCSVファイル（1行目は列名）")
+    parser.add_argument(
+        "--encoding",
+        default="utf-8-sig",
+        help="文字コード（Excelの「CSV(コンマ区切り)」で保存したものは cp932）",
+    )
+    parser.add_argument(
+        "--rejects",
+        help="取り込めなかった行の書き出し先（省略時は <CSVファイル名>.rejects.csv）",
+    )
+    args = parser.parse_args(argv)
+    rejects_path = args.rejects or f"{args.csv_path}.rejects.csv"
+
+    print(f"📥 {args.csv_path} を取り込み中...")
+    try:
+        result = import_csv(args.csv_path, args.encoding, rejects_path)
+    except ValueError as e:
+        print(f"取り込みを中止しました: {e}")
+        return 1
+
+    print(
+        f"取り込み完了！ 全{result['total']}行 / 取り込み{result['imported']}行 / "
+        f"更新した型番{result['models']}件"
+    )
+    if result["rejected"]:
+        print(f"⚠ {result['rejected']}行を除外しました → {rejects_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,377 @@
+import logging
+import threading
+import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import ttk
+
+import backend_logic as logic
+import storage_engine
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+VISIBLE_ROWS = 25  # 一覧に表示する行数（Treeview にはこの数の行しか作らない）
+MAX_CACHED_PAGES = 8  # 覚えておくページの数（ページの大きさは logic.INVENTORY_PAGE_SIZE）
+WHEEL_ROWS = 3  # マウスホイール1目盛りで動かす行数
+POLL_MS = 20  # ページの読み込みが終わったかを確認する間隔（ミリ秒）
+LOADING_TEXT = "…"
+
+# ページを読むワーカースレッド（一覧ウィンドウを何枚開いても共有する）
+_page_executor = None
+
+
+def _get_page_executor():
+    global _page_executor
+    if _page_executor is None:
+        _page_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="inventory-page")
+    return _page_executor
+
+
+# ==================================================================================
+# ページの読み込み（画面を持たない部分）
+# ==================================================================================
+class KeysetPager:
+    """
+    絞り込み・並べ替えの決まった在庫一覧を、ページ単位で読んで覚えておく
+
+    - 覚えるページは max_pages 枚まで（古く使われたものから捨てる）ので、何十万件でもメモリは一定
+    - 次のページは、前のページの最後の行の並べ替えキーの後ろから読む（キーセット方式）
+    - 前のページを覚えていない位置（スクロールバーで飛んだ先）だけは、直前の行のキーを
+      OFFSET で1回探す。分かったページの先頭のキーは覚えておき、次からは探さない
+    - load_page() はDBを読むのでワーカースレッドから呼ぶ。それ以外は画面のスレッドから呼んでよい
+    """
+
+    def __init__(
+        self,
+        backend,
+        filters,
+        sort_column,
+        descending,
+        page_size=logic.INVENTORY_PAGE_SIZE,
+        max_pages=MAX_CACHED_PAGES,
+    ):
+        """
+        :param backend: count_inventory・get_inventory_page・get_inventory_key_at を持つもの
+            （backend_logic か、共有サーバーの InventoryClient）
+        """
+        self.backend = backend
+        self.filters = filters
+        self.sort_column = sort_column
+        self.descending = descending
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.total = backend.count_inventory(filters)  # DBを読むので、作るのもワーカースレッドで
+
+        self._lock = threading.Lock()
+        self._pages = OrderedDict()  # ページ番号 -> 行のリスト
+        self._starts = {0: None}  # ページ番号 -> 直前の行の並べ替えキー（分かっている分だけ）
+
+    def rows(self, start, stop):
+        """start〜stop-1 行目（未読み込みの行は None）"""
+        result = []
+        with self._lock:
+            for index in range(start, min(stop, self.total)):
+                page = self._pages.get(index // self.page_size)
+                offset = index % self.page_size
+                result.append(page[offset] if page is not None and offset < len(page) else None)
+        return result
+
+    def missing_pages(self, start, stop):
+        """start〜stop-1 行目を表示するのに足りないページ番号"""
+        if stop <= start or start >= self.total:
+            return []
+        first = start // self.page_size
+        last = (min(stop, self.total) - 1) // self.page_size
+        with self._lock:
+            return [page for page in range(first, last + 1) if page not in self._pages]
+
+    def load_page(self, page):
+        """ページを読んで覚える（ワーカースレッドから呼ぶ）"""
+        with self._lock:
+            if page in self._pages:
+                return
+            known = page in self._starts
+            after = self._starts.get(page)
+            previous = self._pages.get(page - 1)
+            if not known and previous is not None and len(previous) == self.page_size:
+                known, after = True, self._key(previous[-1])
+
+        if not known:
+            after = self.backend.get_inventory_key_at(
+                page * self.page_size - 1, self.filters, self.sort_column, self.descending
+            )
+        if not known and after is None:
+            rows = []  # 数えたあとに行が減っていた
+        else:
+            rows = self.backend.get_inventory_page(
+                self.filters, self.sort_column, self.descending, after, self.page_size
+            )
+
+        with self._lock:
+            self._pages[page] = rows
+            self._pages.move_to_end(page)
+            while len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+            self._starts[page] = after
+            if len(rows) == self.page_size:
+                self._starts[page + 1] = self._key(rows[-1])
+
+    def _key(self, row):
+        return storage_engine.inventory_page_key(row, self.sort_column)
+
+
+# ==================================================================================
+# 在庫一覧ウィンドウ
+# ==================================================================================
+class InventoryBrowser(tk.Toplevel):
+    """
+    在庫を一覧で見るウィンドウ（カテゴリ・メーカー・保管場所で絞り込み、見出しのクリックで並べ替え）
+
+    Treeview には見えている VISIBLE_ROWS 行しか作らず、スクロールのたびにその行の中身だけを
+    入れ替える。絞り込み・並べ替えはDB側で行い、読んだページは MAX_CACHED_PAGES 枚しか覚えない
+    """
+
+    def __init__(
+        self,
+        master,
+        backend=logic,
+        on_select_callback=None,
+        visible_rows=VISIBLE_ROWS,
+        font=None,
+    ):
+        """
+        :param backend: 読み取りの相手（backend_logic か、共有サーバーの InventoryClient）
+        :param on_select_callback: 行をダブルクリックしたときに型番を渡して呼ぶ関数
+        :param visible_rows: 表示する行数
+        """
+        super().__init__(master)
+        self.title("在庫一覧")
+        self.backend = backend
+        self.on_select_callback = on_select_callback
+        self.visible_rows = visible_rows
+
+        self._pager = None
+        self._first = 0  # 一番上に表示している行
+        self._sort_column = "No."
+        self._descending = False
+        self._loading = {}  # ページ番号 -> Future（今の pager の分だけ）
+        self._opening = None  # 絞り込み・並べ替えを変えたときの (pager を作る Future)
+        self._poll_id = None
+
+        # 絞り込み欄
+        filter_frame = ttk.Frame(self, padding=(10, 10, 10, 0))
+        filter_frame.pack(fill=tk.X)
+        self._filter_entries = {}
+        for column in storage_engine.INVENTORY_FILTER_COLUMNS:
+            ttk.Label(filter_frame, text=f"{column}:").pack(side=tk.LEFT)
+            entry = ttk.Entry(filter_frame, width=14, font=font)
+            entry.pack(side=tk.LEFT, padx=(2, 10))
+            entry.bind("<Return>", lambda event: self.reload())
+            self._filter_entries[column] = entry
+        ttk.Button(filter_frame, text="絞り込み", command=self.reload).pack(side=tk.LEFT)
+        ttk.Button(filter_frame, text="解除", command=self._clear_filters).pack(side=tk.LEFT)
+
+        # 一覧（見えている行だけ作っておき、中身を入れ替える）
+        list_frame = ttk.Frame(self, padding=10)
+        list_frame.pack(fill=tk.BOTH, expand=True)
+        columns = storage_engine.INVENTORY_LIST_COLUMNS
+        self.tree = ttk.Treeview(
+            list_frame, columns=columns, show="headings", height=visible_rows, selectmode="browse"
+        )
+        for column in columns:
+            # 並べ替えの式がある列だけ、見出しのクリックで並べ替える
+            if column in storage_engine.INVENTORY_SORT_EXPRESSIONS:
+                self.tree.heading(column, command=lambda column=column: self._sort_by(column))
+            numeric = column in ("No.", "保管場所", "現在数量", "発注点")
+            self.tree.column(column, width=70 if numeric else 140, anchor=tk.E if numeric else tk.W)
+        for row in range(visible_rows):
+            self.tree.insert("", tk.END, iid=str(row))
+        self.scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.LEFT, fill=tk.Y)
+
+        self.status_label = ttk.Label(self, padding=(10, 0, 10, 10))
+        self.status_label.pack(fill=tk.X)
+
+        # スクロール（Treeview 自体は動かさず、表示する行の番号を動かす）
+        self.tree.bind("<MouseWheel>", self._on_mouse_wheel)
+        self.tree.bind("<Button-4>", lambda event: self._scroll_to(self._first - WHEEL_ROWS))
+        self.tree.bind("<Button-5>", lambda event: self._scroll_to(self._first + WHEEL_ROWS))
+        self.tree.bind("<Prior>", lambda event: self._scroll_to(self._first - self.visible_rows))
+        self.tree.bind("<Next>", lambda event: self._scroll_to(self._first + self.visible_rows))
+        self.tree.bind("<Home>", lambda event: self._scroll_to(0))
+        self.tree.bind("<End>", lambda event: self._scroll_to(self._total()))
+        self.tree.bind("<Up>", self._on_up)
+        self.tree.bind("<Down>", self._on_down)
+        self.tree.bind("<Double-1>", self._on_double_click)
+        self.bind("<Destroy>", self._on_destroy)
+
+        self._update_headings()
+        self.reload()
+
+    # ---------------------------------------------------------
+    # 絞り込み・並べ替え
+    # ---------------------------------------------------------
+    def reload(self):
+        """絞り込み欄の条件・今の並び順で読み直す（件数を数え直し、先頭に戻る）"""
+        filters = {column: entry.get() for column, entry in self._filter_entries.items()}
+        self._pager = None
+        self._loading = {}
+        self._first = 0
+        self.status_label.config(text="読み込み中…")
+        self._opening = _get_page_executor().submit(
+            self._open_pager, filters, self._sort_column, self._descending
+        )
+        self._schedule_poll()
+        self._render()
+
+    def _open_pager(self, filters, sort_column, descending):
+        # 条件のチェック（保管場所が数字か等）と件数は、backend_logic 側の関数で行う
+        pager = KeysetPager(self.backend, filters, sort_column, descending)
+        pager.load_page(0)
+        return pager
+
+    def _clear_filters(self):
+        for entry in self._filter_entries.values():
+            entry.delete(0, tk.END)
+        self.reload()
+
+    def _sort_by(self, column):
+        if column == self._sort_column:
+            self._descending = not self._descending
+        else:
+            self._sort_column, self._descending = column, False
+        self._update_headings()
+        self.reload()
+
+    def _update_headings(self):
+        for column in storage_engine.INVENTORY_LIST_COLUMNS:
+            mark = ""
+            if column == self._sort_column:
+                mark = " ▼" if self._descending else " ▲"
+            self.tree.heading(column, text=column + mark)
+
+    # ---------------------------------------------------------
+    # 表示
+    # ---------------------------------------------------------
+    def _total(self):
+        return self._pager.total if self._pager is not None else 0
+
+    def _scroll_to(self, first):
+        first = max(0, min(first, self._total() - self.visible_rows))
+        if first != self._first:
+            self._first = first
+            self._render()
+        return "break"
+
+    def _render(self):
+        """見えている行の中身を入れ替え、足りないページを読みに行く"""
+        pager = self._pager
+        rows = pager.rows(self._first, self._first + self.visible_rows) if pager else []
+        for position in range(self.visible_rows):
+            iid = str(position)
+            if position >= len(rows):
+                self.tree.item(iid, values=())
+            elif rows[position] is None:
+                self.tree.item(iid, values=(LOADING_TEXT,))
+            else:
+                row = rows[position]
+                self.tree.item(
+                    iid,
+                    values=[
+                        "" if row[column] is None else row[column]
+                        for column in storage_engine.INVENTORY_LIST_COLUMNS
+                    ],
+                )
+
+        total = self._total()
+        if total:
+            self.scrollbar.set(self._first / total, (self._first + len(rows)) / total)
+        else:
+            self.scrollbar.set(0, 1)
+
+        if pager is not None:
+            # 見えている分に加えて、次の1画面分も先に読んでおく
+            stop = self._first + 2 * self.visible_rows
+            for page in pager.missing_pages(self._first, stop):
+                if page not in self._loading:
+                    self._loading[page] = _get_page_executor().submit(pager.load_page, page)
+            if self._loading:
+                self._schedule_poll()
+
+    def _schedule_poll(self):
+        if self._poll_id is None:
+            self._poll_id = self.after(POLL_MS, self._poll)
+
+    def _poll(self):
+        """裏での読み込みが終わっていれば表示し直す（画面のスレッドで実行される）"""
+        self._poll_id = None
+        changed = False
+
+        if self._opening is not None and self._opening.done():
+            future, self._opening = self._opening, None
+            try:
+                self._pager = future.result()
+            except ValueError as e:
+                self.status_label.config(text=str(e))
+            except Exception as e:
+                logging.error("在庫一覧の読み込みに失敗しました", exc_info=e)
+                self.status_label.config(text=f"読み込みに失敗しました: {e}")
+            else:
+                self.status_label.config(text=f"{self._pager.total:,} 件")
+            changed = True
+
+        for page, future in list(self._loading.items()):
+            if future.done():
+                del self._loading[page]
+                if future.exception() is not None:
+                    error = future.exception()
+                    logging.error("在庫一覧の読み込みに失敗しました", exc_info=error)
+                    self.status_label.config(text=f"読み込みに失敗しました: {error}")
+                else:
+                    changed = True
+
+        if changed:
+            self._render()
+        if self._opening is not None or self._loading:
+            self._schedule_poll()
+
+    # ---------------------------------------------------------
+    # イベント
+    # ---------------------------------------------------------
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == tk.MOVETO:
+            self._scroll_to(int(float(amount) * self._total()))
+        elif action == tk.SCROLL:
+            step = self.visible_rows if unit == tk.PAGES else 1
+            self._scroll_to(self._first + int(amount) * step)
+
+    def _on_mouse_wheel(self, event):
+        # Windows は1目盛り120、macOS は1ずつ届く
+        notches = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self._scroll_to(self._first - notches * WHEEL_ROWS)
+
+    def _on_up(self, event):
+        selection = self.tree.selection()
+        if selection and selection[0] == "0":
+            return self._scroll_to(self._first - 1)
+
+    def _on_down(self, event):
+        selection = self.tree.selection()
+        if selection and selection[0] == str(self.visible_rows - 1):
+            return self._scroll_to(self._first + 1)
+
+    def _on_double_click(self, event):
+        iid = self.tree.identify_row(event.y)
+        if not iid or self.on_select_callback is None:
+            return
+        values = self.tree.item(iid, "values")
+        model = values[1] if len(values) > 1 else ""
+        if model:
+            self.on_select_callback(model)
+
+    def _on_destroy(self, event):
+        if event.widget is self and self._poll_id is not None:
+            self.after_cancel(self._poll_id)
+            self._poll_id = None
@@ -0,0 +1,154 @@
+import http.client
+import json
+import threading
+from urllib.parse import urlencode, urlsplit
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+REQUEST_TIMEOUT = 10.0  # 1リクエストの応答を待つ最大秒数
+
+
+class ServerError(Exception):
+    """共有サーバーがエラーを返した（message はサーバーからの説明）"""
+
+
+# ==================================================================================
+# 共有サーバーのクライアント
+# ==================================================================================
+class InventoryClient:
+    """
+    共有サーバー（inventory_server.py）経由で読み書きする薄いアダプター
+
+    backend_logic・SuggestionIndex と同じ名前の関数を持つので、main.py はDBに直接つなぐ代わりに
+    これを渡すだけでよい（接続・型番詳細キャッシュ・サジェスト索引はサーバー側で全端末が共有する）
+
+    - 読み取りは、スレッドごとに1本のTCP接続を使い回す（切れていたら1回だけつなぎ直す）
+    - 書き込みは毎回新しい接続で送り、送り直さない（届いたかわからないまま二重に反映しないため）
+    """
+
+    def __init__(self, base_url, timeout=REQUEST_TIMEOUT):
+        """
+        :param base_url: サーバーのURL（例: http://192.168.0.10:8765）
+        :param timeout: 1リクエストの応答を待つ最大秒数
+        """
+        url = urlsplit(base_url)
+        if url.scheme != "http" or not url.hostname:
+            raise ValueError(f"共有サーバーのURLが不正です: {base_url}")
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    # ---------------------------------------------------------
+    # 読み取り（backend_logic / SuggestionIndex と同じ形）
+    # ---------------------------------------------------------
+    def get_suggestions(self, column_name, search_term):
+        """サーバーのサジェスト索引から候補を返す"""
+        if not search_term:
+            return []
+        return self._get("/suggestions", column=column_name, term=search_term)["suggestions"]
+
+    get_autocomplete_suggestions = get_suggestions
+
+    def get_item_details_by_model(self, model_number):
+        return self._get("/items", model=model_number)["item"]
+
+    def count_inventory(self, filters=None):
+        return self._get("/inventory/count", **(filters or {}))["count"]
+
+    def get_inventory_page(
+        self, filters=None, sort_column="No.", descending=False, after=None, limit=None
+    ):
+        params = dict(filters or {}, sort=sort_column, desc="1" if descending else "0")
+        if after is not None:
+            params["after"] = json.dumps(after, ensure_ascii=False)
+        if limit is not None:
+            params["limit"] = limit
+        return self._get("/inventory/page", **params)["rows"]
+
+    def get_inventory_key_at(self, offset, filters=None, sort_column="No.", descending=False):
+        params = dict(filters or {}, sort=sort_column, desc="1" if descending else "0")
+        return self._get("/inventory/key", offset=offset, **params)["key"]
+
+    def warm_up(self):
+        """最初の入力より前にサーバーへつないでおく"""
+        self._get("/health")
+
+    def refresh(self, force=False):
+        """サジェスト索引はサーバーが最新に保つので、端末では何もしない"""
+
+    def add_item(self, row):
+        """登録した値はサーバーが索引に足すので、端末では何もしない"""
+
+    # ---------------------------------------------------------
+    # 書き込み
+    # ---------------------------------------------------------
+    def run_batch_process(self, list_of_inputs):
+        """
+        backend_logic.run_batch_process と同じ形の結果を返す
+        サーバーに届かなかったときは、全件を失敗（success=False）にして返す
+        """
+        try:
+            return self._post("/movements", {"inputs": list_of_inputs})["results"]
+        except (OSError, http.client.HTTPException, ServerError) as e:
+            message = (
+                f"共有サーバーとの通信に失敗しました:\n{e}\n"
+                "反映されていない可能性があります。在庫数を確認してから再度実行してください。"
+            )
+            return [{"success": False, "message": message} for _ in list_of_inputs]
+
+    def run_main_process_from_ui(self, input_data):
+        return self.run_batch_process([input_data])[0]
+
+    def close(self):
+        """このスレッドの読み取り用の接続を閉じる"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ---------------------------------------------------------
+    # 内部処理
+    # ---------------------------------------------------------
+    def _get(self, path, **params):
+        if params:
+            path += "?" + urlencode(params)
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            try:
+                return self._request(conn, "GET", path)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # サーバーが使っていない接続を閉じていた：読み取りなのでつなぎ直して送り直す
+                conn.close()
+        conn = self._local.conn = self._connect()
+        try:
+            return self._request(conn, "GET", path)
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+
+    def _post(self, path, payload):
+        conn = self._connect()
+        try:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            return self._request(conn, "POST", path, body)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _request(self, conn, method, path, body=None):
+        headers = {"Accept": "application/json"}
+        if body is not None:
+            headers["Content-Type"] = "application/json; charset=utf-8"
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        payload = json.loads(response.read().decode("utf-8"))
+        if response.status == 400:
+            raise ValueError(payload.get("message"))
+        if response.status != 200:
+            raise ServerError(payload.get("message") or f"HTTP {response.status}")
+        return payload
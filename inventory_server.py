@@ -0,0 +1,221 @@
+import argparse
+import json
+import logging
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import backend_logic as logic
+import suggestion_index
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+DEFAULT_HOST = "127.0.0.1"  # 他のPCから使うときは --host 0.0.0.0 などで待ち受ける
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 1_000_000  # これより大きいリクエストは受け付けない
+
+# API（どれも JSON を返す。失敗したときは {"success": false, "message": ...}）
+#   GET  /health                         … {"status": "ok"}
+#   GET  /suggestions?column=型番&term=AB … {"suggestions": [...]}（共有のサジェスト索引から）
+#   GET  /items?model=AB-0001            … {"item": {...} または null}
+#   POST /movements  {"inputs": [...]}   … {"results": [...]}（run_batch_process と同じ形）
+#   在庫一覧（絞り込みは カテゴリ・メーカー・保管場所 を同じ名前のパラメーターで渡す）:
+#   GET  /inventory/count                … {"count": 件数}
+#   GET  /inventory/page?sort=No.&desc=0&after=[JSON]&limit=200 … {"rows": [...]}
+#   GET  /inventory/key?offset=1000&sort=No.&desc=0             … {"key": [...] または null}
+
+
+# ==================================================================================
+# リクエストの処理
+# ==================================================================================
+class InventoryRequestHandler(BaseHTTPRequestHandler):
+    """backend_logic の読み書きを HTTP/JSON で受け付ける（1リクエスト＝1スレッド）"""
+
+    # 端末ごとに同じTCP接続を使い回せるようにする（応答には必ず Content-Length を付ける）
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を別々に書くので、Nagle と遅延ACKが重なって1応答ごとに約40ms待たされないようにする
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/health":
+            self._handle(lambda: {"status": "ok"})
+        elif url.path == "/suggestions":
+            self._handle(
+                lambda: {
+                    "suggestions": self.server.suggestions.get_suggestions(
+                        _param(query, "column"), _param(query, "term")
+                    )
+                }
+            )
+        elif url.path == "/items":
+            self._handle(
+                lambda: {"item": logic.get_item_details_by_model(_param(query, "model"))}
+            )
+        elif url.path == "/inventory/count":
+            self._handle(lambda: {"count": logic.count_inventory(_filters(query))})
+        elif url.path == "/inventory/page":
+            self._handle(
+                lambda: {
+                    "rows": logic.get_inventory_page(
+                        _filters(query),
+                        *_sort(query),
+                        after=json.loads(query["after"][0]) if "after" in query else None,
+                        limit=int(query.get("limit", [logic.INVENTORY_PAGE_SIZE])[0]),
+                    )
+                }
+            )
+        elif url.path == "/inventory/key":
+            self._handle(
+                lambda: {
+                    "key": logic.get_inventory_key_at(
+                        int(_param(query, "offset")), _filters(query), *_sort(query)
+                    )
+                }
+            )
+        else:
+            self._send_json(404, {"success": False, "message": f"不明なURLです: {url.path}"})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path == "/movements":
+            self._handle(lambda: {"results": self._run_movements(self._read_json())})
+        else:
+            self._send_json(404, {"success": False, "message": f"不明なURLです: {url.path}"})
+
+    def log_message(self, format, *args):
+        # キー入力のたびに来るので、アクセスごとのログは出さない（エラーは app.log へ）
+        pass
+
+    # ---------------------------------------------------------
+    # 内部処理
+    # ---------------------------------------------------------
+    def _handle(self, func):
+        """func() の結果を JSON で返す。入力の誤りは 400、それ以外の例外は 500"""
+        try:
+            payload = func()
+        except _RequestTooLarge as e:
+            self._send_json(413, {"success": False, "message": str(e)})
+        except ValueError as e:
+            self._send_json(400, {"success": False, "message": str(e)})
+        except Exception as e:
+            logging.error(f"{self.command} {self.path} の処理中にエラーが発生", exc_info=True)
+            self._send_json(500, {"success": False, "message": f"サーバーでエラーが発生しました:\n{e}"})
+        else:
+            self._send_json(200, payload)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True  # 読まずに捨てる本文が残るので、この接続は使い回さない
+            raise _RequestTooLarge(f"リクエストが大きすぎます（{length} バイト）。")
+        return json.loads(self.rfile.read(length).decode("utf-8"))
+
+    def _run_movements(self, payload):
+        inputs = payload.get("inputs") if isinstance(payload, dict) else None
+        if not isinstance(inputs, list) or not all(isinstance(row, dict) for row in inputs):
+            raise ValueError("inputs には入出庫（辞書）のリストを指定してください。")
+        results = logic.run_batch_process(inputs)
+        # 新しく登録された型番などを、次の差分取り込みを待たずに全端末の候補へ出す
+        for input_data, result in zip(inputs, results):
+            if result["success"]:
+                self.server.suggestions.add_item(input_data)
+        return results
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _RequestTooLarge(Exception):
+    pass
+
+
+def _param(query, name):
+    values = query.get(name)
+    if not values:
+        raise ValueError(f"{name} を指定してください。")
+    return values[0]
+
+
+def _filters(query):
+    return {
+        column: query[column][0]
+        for column in logic.storage_engine.INVENTORY_FILTER_COLUMNS
+        if column in query
+    }
+
+
+def _sort(query):
+    """(並べ替えの列, 降順か)"""
+    return query.get("sort", ["No."])[0], query.get("desc", ["0"])[0] == "1"
+
+
+# ==================================================================================
+# サーバー
+# ==================================================================================
+class InventoryServer(ThreadingHTTPServer):
+    """
+    全端末の読み書きを1か所で受けるサーバー
+
+    DBへの接続（backend_logic のコネクションプール）・型番詳細キャッシュ・サジェスト索引を
+    全端末で共有するので、端末が増えてもDBの接続数と問い合わせは増えない
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, suggestions=None):
+        super().__init__(address, InventoryRequestHandler)
+        if suggestions is None:
+            suggestions = suggestion_index.SuggestionIndex()
+        self.suggestions = suggestions
+
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, suggestions=None):
+    """サーバーを作る（port=0 なら空いているポートを使う。実際のポートは server_address[1]）"""
+    return InventoryServer((host, port), suggestions)
+
+
+# ==================================================================================
+# 実行
+# ==================================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="在庫管理の共有サーバー（各端末の main.py --server から使う）"
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST, help="待ち受けるアドレス")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="待ち受けるポート")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        filename="app.log",
+        level=logging.ERROR,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        encoding="utf-8",
+    )
+
+    server = make_server(args.host, args.port)
+    # 最初の端末を待たせないよう、接続とサジェスト候補を先に用意し、
+    # 前回DBにつながらずに記録した入出庫が残っていれば送り始める
+    logic.warm_up()
+    server.suggestions.refresh(force=True)
+    logic.get_write_journal()
+
+    print(f"在庫管理サーバーを起動しました: http://{args.host}:{server.server_address[1]}/", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import logging
+import select
+import threading
+import time
+from collections import OrderedDict
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+CACHE_MAX_SIZE = 1000  # 覚えておく型番の数（LRUで古いものから捨てる）
+CACHE_TTL = 300.0  # 通知が届かなかった場合の保険として、この秒数で必ず捨てる
+NOTIFY_CHANNEL = "inventory_changed"  # create_postgres_tables.py のトリガーが送るチャンネル
+INVALIDATE_ALL = "*"  # 大量更新時に送られる「全部捨てて」の合図
+LISTEN_POLL_INTERVAL = 5.0  # 通知待ちのタイムアウト（この間隔で接続の生存も確認する）
+RECONNECT_DELAY = 5.0  # 通知用の接続が切れたときの再接続までの秒数
+
+MISSING = object()  # lookup() でキャッシュに無かったことを表す
+
+
+# ==================================================================================
+# 型番詳細キャッシュ
+# ==================================================================================
+class ItemDetailCache:
+    """
+    型番 → 詳細（get_item_details_by_model の結果）を覚えておく LRU＋TTL キャッシュ
+
+    在庫が変わると inventory のトリガーが NOTIFY を送るので、
+    専用の接続で LISTEN しておき、届いた型番をその場で捨てる。
+    LISTEN できていない間（起動直後・接続断）はキャッシュを使わず毎回DBを読むため、
+    他のPCで更新された現在数量が古いまま表示されることはない。
+    """
+
+    def __init__(
+        self,
+        connect_func,
+        max_size=CACHE_MAX_SIZE,
+        ttl=CACHE_TTL,
+        channel=NOTIFY_CHANNEL,
+    ):
+        """
+        :param connect_func: LISTEN用の（プールを通さない）接続を返す関数
+        :param max_size: 覚えておく型番の最大数
+        :param ttl: 1件を覚えておく最大秒数
+        :param channel: LISTENするチャンネル名
+        """
+        self._connect = connect_func
+        self.max_size = max_size
+        self.ttl = ttl
+        self.channel = channel
+
+        self._entries = OrderedDict()  # 型番 -> (期限, 詳細)
+        self._lock = threading.Lock()
+        # 捨てるたびに進める番号。読み込み中に捨てられた値は覚えない
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+        self._listening = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------------------------------------------------------
+    # 読み書き
+    # ---------------------------------------------------------
+    def get(self, model_number, loader):
+        """キャッシュにあればそれを、なければ loader(model_number) の結果を返す"""
+        value, generation = self.lookup(model_number)
+        if value is not MISSING:
+            return value
+        value = loader(model_number)
+        self.store(model_number, value, generation)
+        return _copy(value)
+
+    def lookup(self, model_number):
+        """
+        キャッシュにあれば (詳細, 世代) を、なければ (MISSING, 世代) を返す
+        DBから読んだ値は、このとき受け取った世代を添えて store() に渡す（読み込みを自分で行う非同期版用）
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(model_number, MISSING)
+            if entry is not MISSING and entry[0] > now and self._listening.is_set():
+                self._entries.move_to_end(model_number)
+                self.hits += 1
+                return _copy(entry[1]), self._generation
+            self.misses += 1
+            return MISSING, self._generation
+
+    def store(self, model_number, value, generation):
+        """lookup() で外れた型番の、DBから読んだ値を覚える"""
+        with self._lock:
+            # 読み込み中に通知が来ていたら、その値は古いかもしれないので覚えない
+            if self._listening.is_set() and generation == self._generation:
+                self._entries[model_number] = (time.monotonic() + self.ttl, value)
+                self._entries.move_to_end(model_number)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+
+    def invalidate(self, model_number):
+        """1件を捨てる（INVALIDATE_ALL なら全件）"""
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if model_number == INVALIDATE_ALL:
+                self._entries.clear()
+            else:
+                self._entries.pop(model_number, None)
+
+    def clear(self):
+        self.invalidate(INVALIDATE_ALL)
+
+    def stats(self):
+        """ヒット率などの統計（サイズ調整用）"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "invalidations": self.invalidations,
+                "evictions": self.evictions,
+                "listening": self._listening.is_set(),
+            }
+
+    # ---------------------------------------------------------
+    # 変更通知の受信（LISTEN）
+    # ---------------------------------------------------------
+    def start(self):
+        """通知を受け取るスレッドを起動する"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._listen_loop, name="item-cache-listener", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=LISTEN_POLL_INTERVAL + 1)
+            self._thread = None
+
+    def _listen_loop(self):
+        while not self._stop.is_set():
+            conn = None
+            try:
+                conn = self._connect()
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {self.channel}")
+                # LISTENする前の変更は通知されないので、それまでの分は捨てて始める
+                self.clear()
+                self._listening.set()
+
+                while not self._stop.is_set():
+                    readable, _, _ = select.select([conn], [], [], LISTEN_POLL_INTERVAL)
+                    if not readable:
+                        # しばらく静かなら、接続が生きているか確かめる
+                        with conn.cursor() as cursor:
+                            cursor.execute("SELECT 1")
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self.invalidate(notify.payload)
+            except Exception:
+                logging.error("在庫変更通知の受信に失敗しました", exc_info=True)
+            finally:
+                # 通知を取りこぼしているかもしれないので、再接続までキャッシュは使わない
+                self._listening.clear()
+                self.clear()
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            self._stop.wait(RECONNECT_DELAY)
+
+
+def _copy(value):
+    """呼び出し側で書き換えられてもキャッシュが壊れないよう、辞書は複製して返す"""
+    return dict(value) if value is not None else None
@@ -0,0 +1,415 @@
+import argparse
+import bisect
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+import backend_logic as logic
+from benchmark import percentile
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+DEFAULT_CLIENTS = 8  # 同時に動かす端末の数
+DEFAULT_DURATION = 30.0  # 負荷をかける秒数
+DEFAULT_KEYS = 1000  # 負荷テスト用に作る型番の数
+DEFAULT_ZIPF_S = 1.1  # 型番の偏り（大きいほど一部の型番に集中する）
+DEFAULT_WRITE_RATIO = 0.2  # 操作のうち「更新実行」の割合（残りはサジェスト）
+DEFAULT_THINK_MS = 0.0  # 1操作ごとの平均の待ち時間（0なら休まず続ける）
+RESULTS_FILE = "load_results.jsonl"  # 1回の実行＝1行で追記していく
+
+INITIAL_STOCK = 1_000_000  # 使用で0を下回らない（0で止まる計算が起きない）ように大きくしておく
+SETUP_BATCH_SIZE = 500
+PROCESS_STARTUP_WAIT = 3.0  # 別プロセスの端末が起動し終わるのを待つ秒数
+JOURNAL_DRAIN_TIMEOUT = 120.0  # 終了時に、端末に記録した分が送り終わるのを待つ最大秒数
+MODEL_PREFIX = "LOAD"
+
+# 失敗・端末への記録の理由を、メッセージから分類する
+ERROR_KINDS = (
+    ("deadlock", ("deadlock detected",)),
+    ("serialization", ("could not serialize access",)),
+    ("lock_timeout", ("database is locked", "lock timeout")),
+    ("pool_timeout", ("データベース接続の空きがありません",)),
+)
+JOURNAL_REASON_KINDS = (
+    ("conflict", ("競合",)),
+    ("busy", ("書き込み中",)),
+    ("slow", ("応答が遅い",)),
+    ("queued", ("未送信の入出庫が残っている",)),
+    ("unavailable", ("接続できない",)),
+)
+
+# 結果の確認: 使用で0を下回らないので、現在数量は履歴の数量の合計と一致するはず
+VERIFY_SQL = """
+SELECT i.型番, i.現在数量, h.合計, h.件数
+FROM inventory i
+JOIN (
+    SELECT 型番, SUM(数量) AS 合計, COUNT(*) AS 件数
+    FROM history WHERE 型番 LIKE {placeholder} GROUP BY 型番
+) h ON h.型番 = i.型番
+WHERE i.型番 LIKE {placeholder}
+"""
+
+
+# ==================================================================================
+# 準備
+# ==================================================================================
+def model_names(run_id, keys):
+    """負荷テスト用の型番（実行ごとに別の型番を使うので、前回の結果と混ざらない）"""
+    return [f"{MODEL_PREFIX}-{run_id}-{k:05d}" for k in range(keys)]
+
+
+def make_input(model, action, quantity, location):
+    return {
+        "処理種別": action,
+        "型番": model,
+        "製品名": f"負荷テスト {model[-5:]}",
+        "カテゴリ": "負荷テスト",
+        "メーカー": "負荷テスト",
+        "数量": str(quantity),
+        "保管場所": str(location),
+    }
+
+
+def create_models(models):
+    """負荷テスト用の型番を、十分な在庫数で登録する"""
+    for start in range(0, len(models), SETUP_BATCH_SIZE):
+        batch = [
+            make_input(model, "補充", INITIAL_STOCK, 1)
+            for model in models[start : start + SETUP_BATCH_SIZE]
+        ]
+        for result in logic.run_batch_process(batch):
+            if not result["success"] or result.get("保留"):
+                raise RuntimeError(f"負荷テスト用の型番を登録できませんでした: {result['message']}")
+
+
+def zipf_sampler(n, s, rng):
+    """0〜n-1 を、順位 k の出やすさが 1/(k+1)^s になるように選ぶ関数を返す"""
+    cumulative = list(itertools.accumulate(1 / (k**s) for k in range(1, n + 1)))
+    total = cumulative[-1]
+    return lambda: bisect.bisect_left(cumulative, rng.random() * total)
+
+
+def apply_settings(settings):
+    """接続先などを backend_logic に反映する（別プロセスの端末でも同じ設定にする）"""
+    logic.DB_ENGINE = settings["engine"]
+    logic.DB_FILE = settings["path"]
+    logic.DB_HOST = settings["host"]
+    logic.DB_NAME = settings["dbname"]
+    logic.JOURNAL_FILE = settings["journal"]
+
+
+# ==================================================================================
+# 端末1台分の操作
+# ==================================================================================
+def classify(message, kinds=ERROR_KINDS):
+    for kind, texts in kinds:
+        if any(text in message for text in texts):
+            return kind
+    return "other"
+
+
+def run_client(client_id, settings):
+    """
+    終了時刻まで「更新実行」とサジェストを繰り返し、所要時間と結果の内訳を返す
+    別プロセスで動かすときは、ジャーナルをプロセスごとのファイルにする
+    """
+    if settings["processes"]:
+        apply_settings(dict(settings, journal=f"{settings['journal']}.{client_id}"))
+
+    rng = random.Random(settings["seed"] * 1000 + client_id)
+    models = model_names(settings["run_id"], settings["keys"])
+    pick = zipf_sampler(len(models), settings["zipf_s"], rng)
+    think = settings["think_ms"] / 1000
+    time.sleep(max(0.0, settings["start_at"] - time.time()))
+
+    stats = {
+        "write": [],
+        "suggest": [],
+        "committed": 0,
+        "journaled": Counter(),
+        "failed": Counter(),
+    }
+    while time.time() < settings["deadline"]:
+        model = models[pick()]
+        if rng.random() < settings["write_ratio"]:
+            input_data = make_input(
+                model, rng.choice(["補充", "使用"]), rng.randint(1, 5), rng.randint(1, 999)
+            )
+            start = time.perf_counter()
+            result = logic.run_main_process_from_ui(input_data)
+            stats["write"].append(time.perf_counter() - start)
+            if not result["success"]:
+                stats["failed"][classify(result["message"])] += 1
+            elif result.get("保留"):
+                stats["journaled"][classify(result["message"], JOURNAL_REASON_KINDS)] += 1
+            else:
+                stats["committed"] += 1
+        else:
+            # 入力途中の型番・製品名で候補を引く（先頭の数文字）
+            column = "型番" if rng.random() < 0.7 else "製品名"
+            value = model if column == "型番" else f"負荷テスト {model[-5:]}"
+            start = time.perf_counter()
+            try:
+                logic.get_autocomplete_suggestions(column, value[: rng.randint(1, len(value))])
+            except Exception as e:
+                stats["failed"][classify(str(e))] += 1
+            stats["suggest"].append(time.perf_counter() - start)
+        if think:
+            time.sleep(rng.expovariate(1 / think))
+
+    stats["journal_left"] = drain_journal()
+    return stats
+
+
+def drain_journal(timeout=JOURNAL_DRAIN_TIMEOUT):
+    """端末に記録した入出庫が送り終わるまで待ち、残った件数を返す"""
+    journal = logic.get_write_journal()
+    deadline = time.monotonic() + timeout
+    while journal.has_pending() and time.monotonic() < deadline:
+        time.sleep(0.2)
+    return journal.pending_count()
+
+
+# ==================================================================================
+# 集計と確認
+# ==================================================================================
+def summarize(latencies, duration):
+    """秒のリストを、スループットと末尾の所要時間（ミリ秒）にまとめる"""
+    values = sorted(latency * 1000 for latency in latencies)
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "per_sec": round(len(values) / duration, 1),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p90_ms": round(percentile(values, 90), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "p999_ms": round(percentile(values, 99.9), 3),
+        "max_ms": round(values[-1], 3),
+    }
+
+
+def server_deadlocks():
+    """PostgreSQLがこれまでに検出したデッドロックの数（SQLiteでは None）"""
+    if logic.DB_ENGINE != "postgresql":
+        return None
+    conn, _ = logic.get_db_connection()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT deadlocks FROM pg_stat_database WHERE datname = current_database()"
+            )
+            return cursor.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def verify(run_id):
+    """
+    型番ごとに「現在数量 = 履歴の数量の合計」かを確かめる
+    一致しない型番は、同時更新で誰かの増減が消えた（ロストアップデート）ことを示す
+    :return: (一致しない型番のリスト, 履歴の件数)
+    """
+    pattern = f"{MODEL_PREFIX}-{run_id}-%"
+    if logic.DB_ENGINE == "sqlite":
+        conn = sqlite3.connect(logic.DB_FILE)
+        try:
+            rows = conn.execute(
+                VERIFY_SQL.format(placeholder="?"), (pattern, pattern)
+            ).fetchall()
+        finally:
+            conn.close()
+    else:
+        conn, _ = logic.get_db_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(VERIFY_SQL.format(placeholder="%s"), (pattern, pattern))
+                rows = cursor.fetchall()
+        finally:
+            conn.close()
+
+    mismatches = [
+        {"型番": model, "現在数量": stock, "履歴の合計": total}
+        for model, stock, total, _ in rows
+        if stock != total
+    ]
+    return mismatches, sum(count for *_, count in rows)
+
+
+def remove_journals(pattern):
+    """負荷テスト用のジャーナルを消す"""
+    for path in glob.glob(pattern):
+        os.remove(path)
+
+
+# ==================================================================================
+# 実行
+# ==================================================================================
+def run_load(settings):
+    """負荷をかけて、結果の要約を返す"""
+    models = model_names(settings["run_id"], settings["keys"])
+    create_models(models)
+    deadlocks_before = server_deadlocks()
+
+    # 別プロセスは起動に時間がかかるので、全員そろってから一斉に始める
+    settings["start_at"] = time.time() + (PROCESS_STARTUP_WAIT if settings["processes"] else 0)
+    settings["deadline"] = settings["start_at"] + settings["duration"]
+    if settings["processes"]:
+        # fork だと親の接続プールやロックを引き継いでしまうので、まっさらなプロセスで始める
+        executor = ProcessPoolExecutor(
+            max_workers=settings["clients"], mp_context=multiprocessing.get_context("spawn")
+        )
+    else:
+        executor = ThreadPoolExecutor(max_workers=settings["clients"])
+    with executor:
+        futures = [
+            executor.submit(run_client, client_id, settings)
+            for client_id in range(settings["clients"])
+        ]
+        client_stats = [future.result() for future in futures]
+    duration = settings["duration"]
+
+    committed = sum(stats["committed"] for stats in client_stats)
+    journaled = sum((stats["journaled"] for stats in client_stats), Counter())
+    failed = sum((stats["failed"] for stats in client_stats), Counter())
+    journal_left = sum(stats["journal_left"] for stats in client_stats)
+
+    time.sleep(1.0)  # 統計情報（デッドロック数）がサーバー側で反映されるのを待つ
+    deadlocks_after = server_deadlocks()
+    mismatches, history_rows = verify(settings["run_id"])
+
+    # 成功した（端末に記録した分も含む）入出庫は、ちょうど1行ずつ履歴にあるはず
+    expected_rows = len(models) + committed + sum(journaled.values()) - journal_left
+    return {
+        "duration_sec": duration,
+        "write": summarize(
+            itertools.chain.from_iterable(s["write"] for s in client_stats), duration
+        ),
+        "suggest": summarize(
+            itertools.chain.from_iterable(s["suggest"] for s in client_stats), duration
+        ),
+        "committed": committed,
+        "journaled": dict(journaled),
+        "journal_left": journal_left,
+        "failed": dict(failed),
+        "server_deadlocks": (
+            None if deadlocks_before is None else deadlocks_after - deadlocks_before
+        ),
+        "history_rows": history_rows,
+        "history_rows_expected": expected_rows,
+        "lost_updates": mismatches,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="複数の端末から同時に「更新実行」とサジェストを行い、スループット・遅延・取りこぼしを調べる"
+    )
+    parser.add_argument("--clients", type=int, default=DEFAULT_CLIENTS, help="同時に動かす端末の数")
+    parser.add_argument(
+        "--processes",
+        action="store_true",
+        help="端末をスレッドではなく別プロセスで動かす（実際の複数PCに近い）",
+    )
+    parser.add_argument("--duration", type=float, default=DEFAULT_DURATION, help="負荷をかける秒数")
+    parser.add_argument("--keys", type=int, default=DEFAULT_KEYS, help="負荷テスト用の型番の数")
+    parser.add_argument(
+        "--zipf-s", type=float, default=DEFAULT_ZIPF_S, help="型番の偏り（0なら均等）"
+    )
+    parser.add_argument(
+        "--write-ratio", type=float, default=DEFAULT_WRITE_RATIO, help="操作のうち更新実行の割合"
+    )
+    parser.add_argument(
+        "--think-ms", type=float, default=DEFAULT_THINK_MS, help="1操作ごとの平均の待ち時間"
+    )
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--engine",
+        choices=("postgresql", "sqlite"),
+        default=logic.DB_ENGINE,
+        help="負荷をかけるストレージエンジン（既定は config.ini の engine）",
+    )
+    parser.add_argument("--path", default=logic.DB_FILE, help="SQLiteのDBファイル")
+    parser.add_argument("--host", default=logic.DB_HOST, help="負荷をかけるDBのホスト")
+    parser.add_argument("--dbname", default=logic.DB_NAME, help="負荷をかけるDB名")
+    parser.add_argument(
+        "--output", default=RESULTS_FILE, help="結果を1行のJSONとして追記するファイル"
+    )
+    args = parser.parse_args(argv)
+
+    run_id = uuid.uuid4().hex[:8]
+    settings = {
+        "run_id": run_id,
+        "clients": args.clients,
+        "processes": args.processes,
+        "duration": args.duration,
+        "keys": args.keys,
+        "zipf_s": args.zipf_s,
+        "write_ratio": args.write_ratio,
+        "think_ms": args.think_ms,
+        "seed": args.seed,
+        "engine": args.engine,
+        "path": args.path,
+        "host": args.host,
+        "dbname": args.dbname,
+        # 普段のジャーナルと混ざらないよう、負荷テスト用のファイルにする
+        "journal": os.path.join(logic.BASE_DIR, f"load_journal_{run_id}.jsonl"),
+    }
+    apply_settings(settings)
+
+    mode = "プロセス" if args.processes else "スレッド"
+    print(
+        f"🚦 {args.clients}台（{mode}）で {args.duration:g}秒間 負荷をかけます... "
+        f"(型番{args.keys}件 / zipf s={args.zipf_s:g} / 更新{args.write_ratio:.0%})"
+    )
+    result = run_load(settings)
+    logic.close_write_journal()
+    if not result["journal_left"]:
+        # 送りきれなかった分があれば、調べられるようにファイルを残しておく
+        remove_journals(settings["journal"] + "*")
+
+    record = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "params": {key: value for key, value in settings.items() if key not in ("start_at", "deadline")},
+        "results": result,
+    }
+    with open(args.output, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    for name in ("write", "suggest"):
+        summary = result[name]
+        if summary["count"]:
+            print(
+                f"{name:8s} {summary['per_sec']:8.1f}件/秒  p50={summary['p50_ms']:.2f}ms "
+                f"p99={summary['p99_ms']:.2f}ms p99.9={summary['p999_ms']:.2f}ms "
+                f"max={summary['max_ms']:.2f}ms"
+            )
+    print(f"反映 {result['committed']}件 / 端末に記録 {result['journaled']} / 失敗 {result['failed']}")
+    if result["server_deadlocks"] is not None:
+        print(f"サーバーが検出したデッドロック: {result['server_deadlocks']}件")
+    print(f"履歴 {result['history_rows']}行（期待値 {result['history_rows_expected']}行）")
+    if result["journal_left"]:
+        print(f"⚠ 送りきれなかった入出庫が {result['journal_left']}件 残っています")
+
+    lost = result["lost_updates"]
+    if lost or result["history_rows"] != result["history_rows_expected"]:
+        print(f"❌ 在庫数と履歴が合いません（{len(lost)}型番）: {lost[:5]}")
+        return 1
+    print("✅ ロストアップデートはありませんでした")
+    print(f"結果を {args.output} に追記しました。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
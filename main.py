@@ -1,18 +1,44 @@
+import time
+
+_STARTED = time.perf_counter()  # 起動時間の内訳は、ここ（プロセスが main.py を読み始めた時点）から測る
+
 import tkinter as tk
 from tkinter import ttk, messagebox
 import backend_logic as logic
 import autocomplete_widget as ac
+import inventory_browser
+import inventory_client
+import suggestion_index
+import write_behind
 import logging
+import queue
+import threading
 
 # ==================================================================================
-# ログ設定 (app.log というファイルにエラーを記録)
+# 起動時間の内訳
 # ==================================================================================
-logging.basicConfig(
-    filename="app.log",
-    level=logging.ERROR,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    encoding="utf-8",
-)
+# app.log はエラーだけを書く設定なので、起動時間の記録は専用のロガーで INFO 以上を通す
+startup_logger = logging.getLogger("startup")
+startup_logger.setLevel(logging.INFO)
+
+startup_times = {}  # 段階名 -> 起動からのミリ秒（記録した順）
+startup_times["import"] = (time.perf_counter() - _STARTED) * 1000
+
+
+def mark_startup(name):
+    """起動してから今までの時間を、段階 name の終わりとして記録する"""
+    startup_times[name] = (time.perf_counter() - _STARTED) * 1000
+
+
+def startup_report():
+    """人が読む形の起動時間の内訳（各段階にかかった時間と、起動からの経過時間）"""
+    lines = ["起動時間の内訳"]
+    previous = 0.0
+    for name, ms in startup_times.items():
+        lines.append(f"    {name:16s} +{ms - previous:7.1f}ms  ({ms:.1f}ms)")
+        previous = ms
+    return "\n".join(lines)
+
 
 # ==================================================================================
 # フォント設定
@@ -20,6 +46,29 @@ logging.basicConfig(
 MAIN_FONT = ("Noto Sans CJK JP", 10)
 BOLD_FONT = ("Noto Sans CJK JP", 12, "bold")
 
+# ==================================================================================
+# サジェスト索引（候補はメモリ上で検索し、差分だけDBから取り込む）
+# ==================================================================================
+suggestions = suggestion_index.SuggestionIndex()
+
+# 読み書きの相手（共有サーバーを使うときは main() でサーバーのクライアントに差し替える）
+# クライアントはサジェストも兼ねるので、そのときは suggestions も同じものになる
+backend = logic
+
+# ==================================================================================
+# 裏での書き込み（「更新実行」で画面を固めない）
+# ==================================================================================
+writer = None  # main() で作る
+WRITE_POLL_MS = 30  # 書き込みが終わったかを確認する間隔（ミリ秒）
+DETAILS_POLL_MS = 20  # 型番詳細の読み込みが終わったかを確認する間隔（ミリ秒）
+details_future = None  # 読み込み中の型番詳細（新しい型番が確定したら古い結果は捨てる）
+RECENT_SUBMISSIONS = 20  # 画面に残しておく最近の入出庫の数
+
+STATUS_PENDING = "⏳ 送信中"
+STATUS_COMMITTED = "✅ 反映済み"
+STATUS_JOURNALED = "📝 端末に記録"
+STATUS_FAILED = "❌ エラー"
+
 # ==================================================================================
 # イベントハンドラ関数
 # ==================================================================================
@@ -42,13 +91,27 @@ def execute_update():
             messagebox.showwarning("入力エラー", "製品名と数量は必須です。")
             return
 
-        result = logic.run_main_process_from_ui(input_values)
+        # 書き込みは裏のスレッドに任せ、結果は after() で待つ（画面は固まらない）
+        try:
+            future = writer.submit(input_values)
+        except queue.Full:
+            messagebox.showwarning(
+                "混雑中", "送信待ちの入出庫が多すぎます。少し待ってから実行してください。"
+            )
+            return
 
-        if result["success"]:
-            messagebox.showinfo("成功", result["message"])
-        else:
-            logging.error(f"更新失敗: {result['message']}")
-            messagebox.showerror("エラー", result["message"])
+        item_id = submission_tree.insert(
+            "",
+            0,
+            values=(
+                STATUS_PENDING,
+                input_values["型番"],
+                f"{input_values['処理種別']} {input_values['数量']}",
+            ),
+        )
+        for old in submission_tree.get_children()[RECENT_SUBMISSIONS:]:
+            submission_tree.delete(old)
+        root.after(WRITE_POLL_MS, poll_submission, future, input_values, item_id)
 
     except Exception as e:
         logging.error("UI操作中に予期せぬエラーが発生", exc_info=True)
@@ -58,6 +121,80 @@ def execute_update():
         )
 
 
+def poll_submission(future, input_values, item_id):
+    """送信した入出庫の書き込みが終わったら、状態と在庫数の表示を更新する"""
+    if not future.done():
+        root.after(WRITE_POLL_MS, poll_submission, future, input_values, item_id)
+        return
+
+    try:
+        result = future.result()
+    except Exception as e:
+        set_submission_status(item_id, STATUS_FAILED)
+        logging.error("書き込み中に予期せぬエラーが発生", exc_info=e)
+        messagebox.showerror(
+            "致命的なエラー",
+            f"予期せぬエラーが発生しました。\nログを確認してください。\n{e}",
+        )
+        return
+
+    if not result["success"]:
+        set_submission_status(item_id, STATUS_FAILED)
+        logging.error(f"更新失敗: {result['message']}")
+        messagebox.showerror("エラー", result["message"])
+        return
+
+    # 新しく登録した型番などを、次の差分取り込みを待たずに候補へ出す
+    suggestions.add_item(input_values)
+    journaled = result.get("保留")
+    set_submission_status(item_id, STATUS_JOURNALED if journaled else STATUS_COMMITTED)
+
+    # 今表示している型番なら、在庫数を書き込み後の値にする
+    if entry_model.get() == input_values["型番"]:
+        if journaled:
+            stock_monitor_label.config(text="現在の在庫数: --- (未送信)")
+        else:
+            stock_monitor_label.config(text=f"現在の在庫数: {result['在庫数量']}")
+
+
+def set_submission_status(item_id, status):
+    if submission_tree.exists(item_id):
+        submission_tree.set(item_id, "状態", status)
+
+
+def warm_up(done=None):
+    """
+    裏のスレッドで、最初の入力より前にDB接続とサジェスト候補を用意しておく
+    （画面は先に出しておき、ここが終わるのを待たない）
+    """
+    try:
+        backend.warm_up()
+        mark_startup("connect")
+        suggestions.refresh(force=True)
+        mark_startup("suggestions")
+        if backend is logic:
+            # 前回DBにつながらずに記録した入出庫が残っていれば、裏で送り始める
+            # （共有サーバーを使うときは、サーバーが自分のジャーナルで同じことをする）
+            logic.get_write_journal()
+            mark_startup("journal")
+    except Exception:
+        # つながらなくても画面は使える（書き込みは端末に記録され、検索は入力時に再試行する）
+        logging.error("起動時の準備に失敗しました", exc_info=True)
+    finally:
+        startup_logger.info(startup_report())
+        if done is not None:
+            done.set()
+
+
+def on_close():
+    """受け付け済みの入出庫を書き終えてから閉じる"""
+    if writer.pending_count():
+        root.title("在庫管理システム（送信中の入出庫を書き込んでいます…）")
+        root.update_idletasks()
+    writer.close()
+    root.destroy()
+
+
 def clear_entries():
     """すべての入力欄を初期状態にリセットする"""
     combo_action.current(0)
@@ -74,9 +211,39 @@ def on_model_selected_action(selected_model):
     """
     ★変更: AutocompleteEntryから呼ばれるコールバック関数
     型番が確定したときに詳細を自動入力する
+    詳細は候補検索と同じワーカースレッドで読み、結果は after() で待つ
+    （共有サーバー経由だと1往復かかるので、サーバーが遅くても画面は固まらない）
     """
-    details = logic.get_item_details_by_model(selected_model)
+    global details_future
+    if details_future is not None:
+        details_future.cancel()  # まだ始まっていなければ読まない
+    details_future = ac.get_lookup_executor().submit(
+        backend.get_item_details_by_model, selected_model
+    )
+    root.after(DETAILS_POLL_MS, poll_item_details, selected_model, details_future)
+
+
+def poll_item_details(selected_model, future):
+    """型番詳細の読み込みが終わっていれば、入力欄に出す（メインスレッドで実行される）"""
+    if future is not details_future or future.cancelled():
+        return  # 新しい型番の読み込みに置き換わった
+    if not future.done():
+        root.after(DETAILS_POLL_MS, poll_item_details, selected_model, future)
+        return
+    if entry_model.get() != selected_model:
+        return  # 待っている間に型番が書き換えられた
+
+    try:
+        details = future.result()
+    except Exception:
+        logging.error("型番詳細の取得に失敗しました", exc_info=True)
+        stock_monitor_label.config(text="現在の在庫数: --- (取得できませんでした)")
+        return
+    show_item_details(details)
+
 
+def show_item_details(details):
+    """型番詳細を入力欄と在庫数の表示に出す（None なら新規登録）"""
     if details:
         # 一旦クリアしてから挿入
         entry_name.delete(0, tk.END)
@@ -92,112 +259,223 @@ def on_model_selected_action(selected_model):
         if details.get("保管場所"):
             entry_location.insert(0, details.get("保管場所"))
 
-        stock_monitor_label.config(
-            text=f"現在の在庫数: {details.get('現在数量','---')}"
-        )
+        stock_text = f"現在の在庫数: {details.get('現在数量','---')}"
+        reorder_point = details.get("発注点")
+        if reorder_point is not None and (details.get("現在数量") or 0) <= reorder_point:
+            stock_text += f" (発注点 {reorder_point} 以下)"
+        stock_monitor_label.config(text=stock_text)
     else:
         stock_monitor_label.config(text="現在の在庫数: --- (新規登録)")
 
 
+def open_inventory_browser():
+    """「在庫一覧」：在庫を一覧で見るウィンドウを開く（行のダブルクリックでその型番を入力欄に出す）"""
+    inventory_browser.InventoryBrowser(
+        root, backend=backend, on_select_callback=select_model_from_browser, font=MAIN_FONT
+    )
+
+
+def select_model_from_browser(model_number):
+    entry_model.delete(0, tk.END)
+    entry_model.insert(0, model_number)
+    on_model_selected_action(model_number)
+
+
+def dump_query_stats(event=None):
+    """
+    隠しキー（Ctrl+Shift+D）：DB処理の所要時間の集計を app.log に書き、画面にも出す
+    特定のPCだけ遅いときに、どこで時間がかかっているか調べる用
+    """
+    stats = logic.get_query_stats()
+    stats.log_dump()
+    messagebox.showinfo("DB処理の所要時間", stats.dump() + "\n\n" + startup_report())
+
+
 # ==================================================================================
 # GUIの構築
 # ==================================================================================
 
-root = tk.Tk()
-root.title("在庫管理システム")
-root.geometry("400x550")
-
-try:
-    icon_img = tk.PhotoImage(file="icon.png")
-    root.iconphoto(False, icon_img)
-except Exception:
-    pass
-
-# 全体のスタイル設定（フォント一括指定）
-style = ttk.Style()
-style.configure(".", font=MAIN_FONT)
-style.configure("TLabel", font=MAIN_FONT)
-style.configure("TButton", font=MAIN_FONT)
-
-form_frame = ttk.Frame(root, padding=20)
-form_frame.pack(fill=tk.BOTH, expand=True)
-
-# ラベル作成
-labels_texts = [
-    "処理種別:",
-    "型番:",
-    "製品名:",
-    "カテゴリ:",
-    "メーカー:",
-    "数量:",
-    "保管場所:",
-]
-
-# ウィジェット作成
-combo_action = ttk.Combobox(form_frame, values=["補充", "使用"], state="readonly")
-combo_action.current(0)
-
-# 型番には on_select_callback を渡して、確定時に自動入力を走らせる
-entry_model = ac.AutocompleteEntry(
-    form_frame,
-    get_suggestions_func=logic.get_autocomplete_suggestions,
-    column_name="型番",
-    on_select_callback=on_model_selected_action,
-    font=MAIN_FONT,
-)
-
-# 他の項目はコールバックなし（単なるサジェストのみ）
-entry_name = ac.AutocompleteEntry(
-    form_frame,
-    get_suggestions_func=logic.get_autocomplete_suggestions,
-    column_name="製品名",
-    font=MAIN_FONT,
-)
-
-entry_category = ac.AutocompleteEntry(
-    form_frame,
-    get_suggestions_func=logic.get_autocomplete_suggestions,
-    column_name="カテゴリ",
-    font=MAIN_FONT,
-)
-
-entry_maker = ac.AutocompleteEntry(
-    form_frame,
-    get_suggestions_func=logic.get_autocomplete_suggestions,
-    column_name="メーカー",
-    font=MAIN_FONT,
-)
-
-entry_quantity = ttk.Entry(form_frame)
-entry_location = ttk.Entry(form_frame)
-
-widgets = [
-    combo_action,
-    entry_model,
-    entry_name,
-    entry_category,
-    entry_maker,
-    entry_quantity,
-    entry_location,
-]
-
-# 配置ループ
-for i, (text, widget) in enumerate(zip(labels_texts, widgets)):
-    label = ttk.Label(form_frame, text=text)
-    label.grid(row=i, column=0, sticky=tk.W, pady=5)
-    widget.grid(row=i, column=1, sticky=tk.EW, padx=5)
-
-# ボタン配置
-execute_button = ttk.Button(form_frame, text="更新実行", command=execute_update)
-execute_button.grid(row=7, column=0, columnspan=2, pady=(20, 5), sticky=tk.EW)
-
-clear_button = ttk.Button(form_frame, text="入力クリア", command=clear_entries)
-clear_button.grid(row=8, column=0, columnspan=2, pady=(0, 15), sticky=tk.EW)
-
-stock_monitor_label = ttk.Label(form_frame, text="現在の在庫数: ---", font=BOLD_FONT)
-stock_monitor_label.grid(row=9, column=0, columnspan=2, pady=10)
-
-form_frame.columnconfigure(1, weight=1)
 
-if __name__ == "__main__":
+def build_ui():
+    """画面を組み立てる（DBには触らない）"""
+    global root, combo_action, entry_model, entry_name, entry_category
+    global entry_maker, entry_quantity, entry_location
+    global stock_monitor_label, submission_tree, icon_img
+
+    root = tk.Tk()
+    root.title("在庫管理システム")
+    root.geometry("400x700")
+
+    try:
+        icon_img = tk.PhotoImage(file="icon.png")
+        root.iconphoto(False, icon_img)
+    except Exception:
+        pass
+
+    # 全体のスタイル設定（フォント一括指定）
+    style = ttk.Style()
+    style.configure(".", font=MAIN_FONT)
+    style.configure("TLabel", font=MAIN_FONT)
+    style.configure("TButton", font=MAIN_FONT)
+
+    form_frame = ttk.Frame(root, padding=20)
+    form_frame.pack(fill=tk.BOTH, expand=True)
+
+    # ラベル作成
+    labels_texts = [
+        "処理種別:",
+        "型番:",
+        "製品名:",
+        "カテゴリ:",
+        "メーカー:",
+        "数量:",
+        "保管場所:",
+    ]
+
+    # ウィジェット作成
+    combo_action = ttk.Combobox(form_frame, values=["補充", "使用"], state="readonly")
+    combo_action.current(0)
+
+    # 型番には on_select_callback を渡して、確定時に自動入力を走らせる
+    entry_model = ac.AutocompleteEntry(
+        form_frame,
+        get_suggestions_func=suggestions.get_suggestions,
+        column_name="型番",
+        on_select_callback=on_model_selected_action,
+        font=MAIN_FONT,
+    )
+
+    # 他の項目はコールバックなし（単なるサジェストのみ）
+    entry_name = ac.AutocompleteEntry(
+        form_frame,
+        get_suggestions_func=suggestions.get_suggestions,
+        column_name="製品名",
+        font=MAIN_FONT,
+    )
+
+    entry_category = ac.AutocompleteEntry(
+        form_frame,
+        get_suggestions_func=suggestions.get_suggestions,
+        column_name="カテゴリ",
+        font=MAIN_FONT,
+    )
+
+    entry_maker = ac.AutocompleteEntry(
+        form_frame,
+        get_suggestions_func=suggestions.get_suggestions,
+        column_name="メーカー",
+        font=MAIN_FONT,
+    )
+
+    entry_quantity = ttk.Entry(form_frame)
+    entry_location = ttk.Entry(form_frame)
+
+    widgets = [
+        combo_action,
+        entry_model,
+        entry_name,
+        entry_category,
+        entry_maker,
+        entry_quantity,
+        entry_location,
+    ]
+
+    # 配置ループ
+    for i, (text, widget) in enumerate(zip(labels_texts, widgets)):
+        label = ttk.Label(form_frame, text=text)
+        label.grid(row=i, column=0, sticky=tk.W, pady=5)
+        widget.grid(row=i, column=1, sticky=tk.EW, padx=5)
+
+    # ボタン配置
+    execute_button = ttk.Button(form_frame, text="更新実行", command=execute_update)
+    execute_button.grid(row=7, column=0, columnspan=2, pady=(20, 5), sticky=tk.EW)
+
+    clear_button = ttk.Button(form_frame, text="入力クリア", command=clear_entries)
+    clear_button.grid(row=8, column=0, columnspan=2, pady=(0, 15), sticky=tk.EW)
+
+    stock_monitor_label = ttk.Label(form_frame, text="現在の在庫数: ---", font=BOLD_FONT)
+    stock_monitor_label.grid(row=9, column=0, columnspan=2, pady=10)
+
+    # 最近の入出庫と、その書き込み状態（送信中 → 反映済み / 端末に記録 / エラー）
+    submission_tree = ttk.Treeview(
+        form_frame, columns=("状態", "型番", "内容"), show="headings", height=5
+    )
+    for column, width in (("状態", 110), ("型番", 130), ("内容", 90)):
+        submission_tree.heading(column, text=column)
+        submission_tree.column(column, width=width, anchor=tk.W)
+    submission_tree.grid(row=10, column=0, columnspan=2, sticky=tk.EW)
+
+    browse_button = ttk.Button(form_frame, text="在庫一覧", command=open_inventory_browser)
+    browse_button.grid(row=11, column=0, columnspan=2, pady=(15, 0), sticky=tk.EW)
+
+    form_frame.columnconfigure(1, weight=1)
+
+    root.bind_all("<Control-Shift-D>", dump_query_stats)
+    root.protocol("WM_DELETE_WINDOW", on_close)
+
+
+# ==================================================================================
+# 起動
+# ==================================================================================
+
+
+def main():
+    """
+    画面を先に出し、DB接続とサジェスト候補の読み込みは裏のスレッドで進める
+    --startup-report を付けると、準備が終わったところで起動時間の内訳を表示して終了する
+    """
+    global writer, backend, suggestions
+    import argparse
+
+    parser = argparse.ArgumentParser(description="在庫管理システム")
+    parser.add_argument(
+        "--startup-report",
+        action="store_true",
+        help="起動時間の内訳を表示して終了する（遅いPCの調査用）",
+    )
+    parser.add_argument(
+        "--server",
+        default=logic.SERVER_URL,
+        help="共有サーバーのURL（指定するとDBには直接つながない。既定は config.ini の [SERVER] url）",
+    )
+    args = parser.parse_args()
+
+    if args.server:
+        backend = suggestions = inventory_client.InventoryClient(args.server)
+
+    # ログ設定 (app.log というファイルにエラーを記録)
+    logging.basicConfig(
+        filename="app.log",
+        level=logging.ERROR,
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        encoding="utf-8",
+    )
+
+    build_ui()
+    mark_startup("build_ui")
+    root.update()  # ここで画面が表示される
+    mark_startup("first_paint")
+
+    writer = write_behind.WriteBehindQueue(backend.run_batch_process)
+
+    warmed_up = threading.Event()
+    threading.Thread(
+        target=warm_up, args=(warmed_up,), name="startup-warm-up", daemon=True
+    ).start()
+
+    if args.startup_report:
+
+        def report_and_quit():
+            if not warmed_up.is_set():
+                root.after(WRITE_POLL_MS, report_and_quit)
+                return
+            print(startup_report())
+            on_close()
+
+        root.after(WRITE_POLL_MS, report_and_quit)
+
     root.mainloop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+SLOW_QUERY_MS = 200.0  # これより時間のかかった処理は app.log に記録する
+WINDOW_SECONDS = 60  # ヒストグラムを1分ごとに区切って持つ
+WINDOW_COUNT = 15  # 直近15分ぶんを集計する（それより古い区切りは捨てる）
+
+# ヒストグラムの区切り（ミリ秒）。最後の区切りより遅いものは「それ以上」にまとめる
+BUCKET_BOUNDS_MS = (
+    0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000,
+)
+
+# 1回の処理の内訳
+#   acquire    : 接続を借りるまで（プールの空き待ち・SQLiteの書き込みロック待ち）
+#   execute    : SQLの実行と結果の受け取り
+#   transaction: 接続を借りてから返すまで（トランザクションの長さ）
+#   total      : 呼び出し全体（キャッシュに当たったときは total だけ）
+PHASES = ("total", "acquire", "execute", "transaction")
+
+# app.log はエラーだけを書く設定なので、遅い処理の記録は専用のロガーで WARNING 以上を通す
+logger = logging.getLogger("query_stats")
+logger.setLevel(logging.WARNING)
+
+# 計測中の処理（入れ子の外から順）。スレッドごと・asyncio のタスクごとに別々になる
+_stack = contextvars.ContextVar("query_stats_stack", default=())
+
+
+# ==================================================================================
+# 直近の所要時間のヒストグラム
+# ==================================================================================
+class RollingHistogram:
+    """
+    直近 WINDOW_SECONDS × WINDOW_COUNT 秒の所要時間の分布
+    1件ごとの値は持たず、区切りごとの件数だけを数えるのでメモリは一定
+    """
+
+    def __init__(self, window_seconds=WINDOW_SECONDS, window_count=WINDOW_COUNT):
+        self.window_seconds = window_seconds
+        self.window_count = window_count
+        # 区切り番号 -> [区切りごとの件数..., 合計ミリ秒, 最大ミリ秒]
+        self._windows = {}
+
+    def add(self, ms, now=None):
+        window = int((time.monotonic() if now is None else now) // self.window_seconds)
+        counts = self._windows.get(window)
+        if counts is None:
+            counts = self._windows[window] = [0] * (len(BUCKET_BOUNDS_MS) + 1) + [0.0, 0.0]
+            for old in [w for w in self._windows if w <= window - self.window_count]:
+                del self._windows[old]
+        counts[bisect.bisect_left(BUCKET_BOUNDS_MS, ms)] += 1
+        counts[-2] += ms
+        counts[-1] = max(counts[-1], ms)
+
+    def summary(self, now=None):
+        """件数・平均・最大と、p50/p90/p99（その値が入った区切りの上限）を返す"""
+        current = int((time.monotonic() if now is None else now) // self.window_seconds)
+        buckets = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+        total_ms = 0.0
+        max_ms = 0.0
+        for window, counts in self._windows.items():
+            if window <= current - self.window_count:
+                continue
+            for i in range(len(buckets)):
+                buckets[i] += counts[i]
+            total_ms += counts[-2]
+            max_ms = max(max_ms, counts[-1])
+
+        count = sum(buckets)
+        if not count:
+            return {"count": 0}
+        result = {
+            "count": count,
+            "mean_ms": round(total_ms / count, 3),
+            "max_ms": round(max_ms, 3),
+        }
+        for p in (50, 90, 99):
+            rank = -(-count * p // 100)  # 切り上げ
+            seen = 0
+            for i, n in enumerate(buckets):
+                seen += n
+                if seen >= rank:
+                    # 区切りの上限が実際の最大値を超えるときは最大値で代用する
+                    bound = BUCKET_BOUNDS_MS[i] if i < len(BUCKET_BOUNDS_MS) else max_ms
+                    result[f"p{p}_ms"] = round(min(bound, max_ms), 3)
+                    break
+        return result
+
+
+# ==================================================================================
+# 処理ごとの計測
+# ==================================================================================
+class _Timer:
+    """track() 1回分の計測値"""
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.rows = 0
+
+
+class QueryStats:
+    """
+    DB処理の所要時間を処理名ごとに集計し、遅いものを app.log に書く
+
+    使い方:
+        with stats.track("item_details"):
+            ...  # この中で phase() / add_rows() を呼ぶと、この処理の内訳として数える
+    """
+
+    def __init__(self, slow_query_ms=SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._histograms = {}  # (処理名, 内訳) -> RollingHistogram
+        self._totals = {}  # 処理名 -> {"calls", "errors", "rows", "slow"}（起動してからの累計）
+
+    @contextmanager
+    def track(self, operation):
+        timer = _Timer(operation)
+        _stack.set(_stack.get() + (timer,))
+        failed = False
+        try:
+            yield timer
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            # ジェネレーターが途中で捨てられた場合など、積んだ順に抜けるとは限らない
+            _stack.set(tuple(other for other in _stack.get() if other is not timer))
+            self.record(timer, time.perf_counter() - timer.started, failed)
+
+    def record(self, timer, elapsed, failed=False):
+        total_ms = elapsed * 1000
+        phases_ms = {name: seconds * 1000 for name, seconds in timer.phases.items()}
+        with self._lock:
+            totals = self._totals.setdefault(
+                timer.operation, {"calls": 0, "errors": 0, "rows": 0, "slow": 0}
+            )
+            totals["calls"] += 1
+            totals["errors"] += failed
+            totals["rows"] += timer.rows
+            slow = total_ms >= self.slow_query_ms
+            totals["slow"] += slow
+            for name, ms in [("total", total_ms)] + list(phases_ms.items()):
+                key = (timer.operation, name)
+                if key not in self._histograms:
+                    self._histograms[key] = RollingHistogram()
+                self._histograms[key].add(ms)
+
+        if slow:
+            breakdown = " ".join(
+                f"{name}={phases_ms[name]:.1f}ms" for name in PHASES if name in phases_ms
+            )
+            logger.warning(
+                f"遅い処理: {timer.operation} {total_ms:.1f}ms "
+                f"({breakdown or '内訳なし'}) rows={timer.rows}{' 失敗' if failed else ''}"
+            )
+
+    def report(self):
+        """{処理名: {"calls", "errors", "rows", "slow", 内訳ごとの要約...}}"""
+        with self._lock:
+            result = {
+                operation: dict(totals) for operation, totals in sorted(self._totals.items())
+            }
+            for (operation, name), histogram in self._histograms.items():
+                result[operation][name] = histogram.summary()
+        return result
+
+    def dump(self):
+        """人が読む形の集計表（app.log に書いたり、画面に出したりする用）"""
+        lines = [
+            f"DB処理の所要時間（直近{WINDOW_SECONDS * WINDOW_COUNT // 60}分 / "
+            f"遅い処理のしきい値 {self.slow_query_ms:g}ms）"
+        ]
+        for operation, values in self.report().items():
+            lines.append(
+                f"[{operation}] 呼び出し{values['calls']}回 失敗{values['errors']}回 "
+                f"遅い{values['slow']}回 行数{values['rows']}"
+            )
+            for name in PHASES:
+                summary = values.get(name)
+                if not summary or not summary["count"]:
+                    continue
+                lines.append(
+                    f"    {name:12s} n={summary['count']:<6d} "
+                    f"p50<={summary['p50_ms']}ms p90<={summary['p90_ms']}ms "
+                    f"p99<={summary['p99_ms']}ms max={summary['max_ms']}ms"
+                )
+        return "\n".join(lines)
+
+    def log_dump(self):
+        """集計表を app.log に書く"""
+        logger.warning("\n" + self.dump())
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._totals.clear()
+
+
+# ==================================================================================
+# 内訳の記録（DBを触るコードから呼ぶ）
+# ==================================================================================
+@contextmanager
+def phase(name):
+    """with文の中の時間を、計測中の処理の内訳 name に足す（計測中でなければ何もしない）"""
+    stack = _stack.get()
+    if not stack:
+        yield
+        return
+    timer = stack[-1]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.phases[name] = timer.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def add_rows(count):
+    """計測中の処理が返した（書いた）行数を足す"""
+    stack = _stack.get()
+    if stack and count and count > 0:
+        stack[-1].rows += count
@@ -0,0 +1,103 @@
+import argparse
+import select
+import sys
+import time
+
+import backend_logic as logic
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+POLL_INTERVAL = 5.0  # --follow でSQLiteのアラートを見に行く間隔（秒）
+
+
+# ==================================================================================
+# 表示
+# ==================================================================================
+def format_alert(alert):
+    return (
+        f"#{alert['id']} {alert['日時']} [{alert['状態']}] {alert['型番']} "
+        f"在庫 {alert['在庫数量']} / 発注点 {alert['発注点']}"
+    )
+
+
+def print_alerts(after_id):
+    """after_id より後のアラートをすべて表示し、最後の id を返す"""
+    while True:
+        alerts = logic.get_stock_alerts(after_id)
+        for alert in alerts:
+            print(format_alert(alert), flush=True)
+            after_id = alert["id"]
+        if len(alerts) < logic.STOCK_ALERT_LIMIT:
+            return after_id
+
+
+def follow_alerts(after_id):
+    """
+    新しいアラートが起きるたびに表示する（Ctrl+C で終了）
+    PostgreSQLは NOTIFY を待ち、SQLiteは POLL_INTERVAL ごとに見に行く
+    """
+    after_id = print_alerts(after_id)
+    if logic.DB_ENGINE != "postgresql":
+        while True:
+            time.sleep(POLL_INTERVAL)
+            after_id = print_alerts(after_id)
+
+    conn, _ = logic.get_db_connection()
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f"LISTEN {logic.STOCK_ALERT_CHANNEL}")
+    try:
+        while True:
+            if select.select([conn], [], [], 60) == ([], [], []):
+                continue
+            conn.poll()
+            if conn.notifies:
+                conn.notifies.clear()
+                # 中身は通知ではなく表から読む（LISTEN する前に起きた分も漏らさない）
+                after_id = print_alerts(after_id)
+    finally:
+        conn.close()
+
+
+# ==================================================================================
+# 実行
+# ==================================================================================
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="発注点の設定とアラートの確認")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    set_parser = commands.add_parser("set", help="型番の発注点を設定する")
+    set_parser.add_argument("model", help="型番")
+    set_parser.add_argument("reorder_point", help="発注点（在庫数がこれ以下になったらアラート）")
+
+    clear_parser = commands.add_parser("clear", help="型番の発注点を解除する")
+    clear_parser.add_argument("model", help="型番")
+
+    list_parser = commands.add_parser("list", help="アラートを古い順に表示する")
+    list_parser.add_argument(
+        "--after", type=int, default=0, help="この id より後のアラートだけを表示する"
+    )
+    list_parser.add_argument(
+        "--follow", action="store_true", help="表示した後も、新しいアラートを待って表示し続ける"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command in ("set", "clear"):
+        reorder_point = args.reorder_point if args.command == "set" else None
+        result = logic.set_reorder_point(args.model, reorder_point)
+        print(result["message"])
+        return 0 if result["success"] else 1
+
+    try:
+        if args.follow:
+            follow_alerts(args.after)
+        else:
+            print_alerts(args.after)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+import argparse
+import csv
+import sys
+from datetime import datetime, timedelta
+
+import backend_logic as logic
+
+
+# ==================================================================================
+# 実行
+# ==================================================================================
+def parse_as_of(text):
+    """日時を読む。日付だけならその日の終わり（23:59:59）時点とする"""
+    value = datetime.fromisoformat(text)
+    if len(text) == 10:
+        value += timedelta(days=1, seconds=-1)
+    return value
+
+
+def write_stock(stock, out):
+    writer = csv.writer(out)
+    writer.writerow(["型番", "在庫数量"])
+    for model in sorted(stock):
+        writer.writerow([model, stock[model]])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="過去のある時点の在庫数を求める（監査用）")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    show_parser = commands.add_parser("show", help="指定した時点の在庫数をCSVで出す")
+    show_parser.add_argument(
+        "at", type=parse_as_of, help="日時（例: 2024-03-31 は 2024-03-31 23:59:59 時点）"
+    )
+    show_parser.add_argument("--model", help="型番（省略時は全型番）")
+    show_parser.add_argument("--output", help="書き出し先のCSV（省略時は画面に表示）")
+    show_parser.add_argument(
+        "--encoding", default="utf-8-sig", help="CSVの文字コード（Excel向けの既定は BOM付きUTF-8）"
+    )
+
+    checkpoint_parser = commands.add_parser(
+        "checkpoint", help="月初めごとのチェックポイントを作る（月に1回実行する）"
+    )
+    checkpoint_parser.add_argument(
+        "--rebuild", action="store_true", help="作ってあるチェックポイントを消して作り直す"
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "checkpoint":
+        print("🔨 チェックポイントを作成中...")
+        created = logic.create_stock_checkpoints(rebuild=args.rebuild)
+        for at in created:
+            print(f"  {at:%Y-%m-%d %H:%M:%S}")
+        print(f"作成完了！ {len(created)}件")
+        return 0
+
+    stock = logic.get_stock_as_of(args.at, args.model)
+    if args.output:
+        with open(args.output, "w", encoding=args.encoding, newline="") as out:
+            write_stock(stock, out)
+        print(f"{args.at:%Y-%m-%d %H:%M:%S} 時点の在庫 {len(stock)}件を {args.output} に書き出しました。")
+    else:
+        write_stock(stock, sys.stdout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1117 @@
+import json
+import math
+import sqlite3
+import string
+import threading
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import query_stats
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+SQLITE_BUSY_TIMEOUT = 10.0  # 他のPC・スレッドが書き込み中のとき待つ秒数
+SQLITE_CACHED_STATEMENTS = 256  # 接続ごとに使い回すプリペアドステートメントの数
+# WALは読み取りと書き込みが互いを待たないので速いが、ネットワーク共有フォルダ上では使えない
+# 共有フォルダにDBファイルを置く場合は config.ini で journal_mode = DELETE にする
+SQLITE_JOURNAL_MODE = "WAL"
+# 反映済みの入出庫IDを覚えておく日数（オフライン分の送り直しはこれより前に終わっている）
+APPLIED_MOVEMENTS_RETENTION_DAYS = 90
+
+# 発注点アラートの状態（在庫数が発注点以下になった / 発注点を上回った）
+STOCK_ALERT_SHORTAGE = "不足"
+STOCK_ALERT_RECOVERED = "回復"
+
+# サジェストの並び順に使う人気度（よく動く型番ほど上に出す）
+# 入出庫1回ごとに1を足し、半減期ごとに半分になる数を、対数で持つ:
+#   人気度 = log( Σ 2^(-(今 - 入出庫の日時) / 半減期) ) + (今の分の定数)
+# 「今の分の定数」はどの型番にも同じだけ掛かるので、日時を固定の基準日からの経過で測れば
+# 古い値を減らして回る必要がなく、入出庫のたびに足すだけ（値は増える一方）で順位が保たれる
+POPULARITY_HALF_LIFE_DAYS = 30.0
+POPULARITY_EPOCH = datetime(2000, 1, 1)
+POPULARITY_BACKFILL_DAYS = 365  # 人気度を初めて作るとき、この日数分の履歴から数える
+# サジェストで人気度の順に並べる候補は、次の2つだけから選ぶ（1回に読む行数をこの2倍までに抑える）
+#   - 前方一致する値を値の順にこの件数（入力が長く、一致する型番が少なければ全部が入るので正確）
+#   - 前方一致がこの件数を超えるときだけ、人気度の高い型番から順にこの件数のうち前方一致するもの
+#     （1〜2文字の入力でも、カタログ全体を人気度で並べ替えない）
+POPULARITY_SCAN_LIMIT = 500
+_POPULARITY_RATE = math.log(2) / POPULARITY_HALF_LIFE_DAYS
+
+# 製品名・メーカーのあいまい検索
+# 全角/半角・カタカナ/ひらがな・大文字/小文字・空白の違いをそろえた検索キーを、元の列と別に持つ
+SEARCH_KEY_COLUMNS = {"製品名": "製品名_検索", "メーカー": "メーカー_検索"}
+FUZZY_THRESHOLD = 0.4  # 入力の3文字ずつの組のうち、この割合以上を含む値を候補にする
+FUZZY_CANDIDATES = 200  # 索引から取り出して似ている順に並べ直す候補の数
+KATAKANA = "".join(chr(code) for code in range(0x30A1, 0x30F7))  # ァ〜ヶ
+HIRAGANA = "".join(chr(code - 0x60) for code in range(0x30A1, 0x30F7))  # ぁ〜ゖ
+_SEARCH_KEY_TABLE = str.maketrans(
+    KATAKANA + string.ascii_uppercase, HIRAGANA + string.ascii_lowercase
+)
+
+# 在庫一覧（inventory_browser.py）
+# ページ送りは「前のページの最後の行より後ろ」を並べ替えの式の索引で LIMIT 件たどる（キーセット方式）
+# 行値の比較は NULL があると成り立たないので、NULL を空文字・0 に読み替えた式で並べ・絞り込む
+INVENTORY_LIST_COLUMNS = ("No.", "型番", "製品名", "カテゴリ", "メーカー", "保管場所", "現在数量", "発注点")
+INVENTORY_FILTER_COLUMNS = ("カテゴリ", "メーカー", "保管場所")
+_INVENTORY_NULL_VALUES = {
+    "型番": "",
+    "製品名": "",
+    "カテゴリ": "",
+    "メーカー": "",
+    "保管場所": 0,
+    "現在数量": 0,
+    "発注点": -1,  # 発注点は0以上なので、未設定の型番は設定済みの型番より前に並ぶ
+}
+INVENTORY_SORT_EXPRESSIONS = {"No.": '"No."'}
+INVENTORY_SORT_EXPRESSIONS.update(
+    (column, f"COALESCE({column}, {value!r})")
+    for column, value in _INVENTORY_NULL_VALUES.items()
+)
+# 並べ替え・絞り込み用の索引（式, "No."）を作る列
+# 現在数量は入出庫のたびに変わるので作らない（PostgreSQLで在庫の更新がHOT更新にならなくなる）
+INVENTORY_INDEXED_COLUMNS = ("型番", "製品名", "カテゴリ", "メーカー", "保管場所", "発注点")
+
+
+# ==================================================================================
+# ストレージエンジンの共通部分
+# ==================================================================================
+class StorageEngine:
+    """
+    backend_logic の公開関数から呼ばれるDB操作のまとまり
+    入力チェックは backend_logic 側で済ませてから、ここには整った値だけを渡す
+
+    movement（1件の入出庫）は次のキーを持つ辞書:
+        movement_id, 日時, 型番, 製品名, カテゴリ, メーカー, 数量, 増減, 保管場所
+
+    movement_id は applied_movements に記録し、同じIDの入出庫は2回目以降は反映しない
+    （オフライン分の送り直しや、タイムアウト後に遅れて届いた書き込みを二重に数えない）
+
+    在庫数が発注点をまたいだときは、DBのトリガーが stock_alerts に1行書く
+    （変わった型番の行だけで判定するので、在庫表全体を見回る必要はない）
+    """
+
+    name = None
+
+    def get_suggestions(self, column_name, search_term, limit):
+        """
+        column_name が search_term で始まる値を、重複なしで limit 件まで返す
+        最近よく動いた型番（の値）を人気度の順に先に、残りを値の順に並べる
+        """
+        raise NotImplementedError
+
+    def get_item_details(self, model_number):
+        """型番のレコードを辞書で返す（なければ None）"""
+        raise NotImplementedError
+
+    def load_item_details(self, model_number):
+        """キャッシュを通さずに型番のレコードを読む（キャッシュの無いエンジンでは同じ）"""
+        return self.get_item_details(model_number)
+
+    def iter_inventory_rows_since(self, last_no):
+        """"No." が last_no より大きい在庫レコード（サジェスト対象の列）を順に返す"""
+        raise NotImplementedError
+
+    def apply_movement(self, movement):
+        """1件の入出庫を反映し、更新後の在庫数を返す（反映済みなら None）"""
+        raise NotImplementedError
+
+    def apply_movements(self, movements):
+        """複数の入出庫を1トランザクションで反映し、それぞれの更新後の在庫数を返す（反映済みの行は None）"""
+        raise NotImplementedError
+
+    def search_fuzzy(self, column_name, search_term, limit):
+        """
+        column_name（SEARCH_KEY_COLUMNS の列）から、search_term を途中に含むか、
+        多少打ち間違えていても似ている値を、似ている順に limit 件まで返す
+        """
+        raise NotImplementedError
+
+    def iter_popularity_since(self, version):
+        """
+        版が version より大きい人気度を、版の順に返す
+        各行は 型番・製品名・カテゴリ・メーカー・人気度・版 を持つ
+        """
+        raise NotImplementedError
+
+    def row_counts(self):
+        """{"inventory": 件数, "history": 件数}"""
+        raise NotImplementedError
+
+    def set_reorder_point(self, model_number, reorder_point):
+        """型番の発注点を設定する（None で解除）。型番があれば True"""
+        raise NotImplementedError
+
+    def get_stock_alerts(self, after_id, limit):
+        """id が after_id より大きい発注点アラートを、古い順に limit 件まで返す"""
+        raise NotImplementedError
+
+    def get_stock_as_of(self, at, model_number=None):
+        """
+        日時 at 時点の在庫数を {型番: 在庫数} で返す（model_number を渡せばその型番だけ）
+        at 以前で一番新しいチェックポイントから、その後 at までの履歴だけを読む
+        """
+        raise NotImplementedError
+
+    def create_stock_checkpoint(self, at):
+        """日時 at 時点の全型番の在庫数をチェックポイントとして保存し、行数を返す（既にあれば None）"""
+        raise NotImplementedError
+
+    def stock_checkpoint_times(self):
+        """保存済みのチェックポイントの日時（古い順）"""
+        raise NotImplementedError
+
+    def count_inventory(self, filters):
+        """filters（{列: 値}。INVENTORY_FILTER_COLUMNS の列）に合う在庫の件数"""
+        raise NotImplementedError
+
+    def get_inventory_page(self, filters, sort_column, descending, after, limit):
+        """
+        filters に合う在庫を sort_column の順に並べ、並べ替えキー after の次から limit 件返す
+        after は前のページの最後の行の inventory_page_key()（最初のページは None）
+        """
+        raise NotImplementedError
+
+    def get_inventory_key_at(self, filters, sort_column, descending, offset):
+        """同じ並びで offset 件目（0から）の行の並べ替えキー（なければ None）。離れた位置へ飛ぶとき用"""
+        raise NotImplementedError
+
+    def clear_stock_checkpoints(self):
+        """チェックポイントをすべて消す（履歴を直したあとに作り直す用）"""
+        raise NotImplementedError
+
+    def first_history_time(self):
+        """一番古い履歴の日時（履歴が無ければ None）"""
+        raise NotImplementedError
+
+    def create_schema(self):
+        """テーブルと索引が無ければ作る（PostgreSQLは create_postgres_tables.py で作る）"""
+
+    def warm_up(self):
+        """接続など、最初の操作の前に済ませておけるものを用意する"""
+        self.create_schema()
+
+    def close(self):
+        pass
+
+
+def plan_batch(movements, stock, created_models):
+    """
+    入力順に1件ずつ足し引きした在庫数を計算する（0未満にはしない）
+
+    :param stock: 型番 → 現在数量。未登録だった型番は、最初の行で登録済みの値を入れておく
+    :param created_models: このバッチで新規登録した型番（最初の行は登録時に反映済み）
+    :return: movements と同じ順の在庫数のリスト（stock は最終値に書き換わる）
+    """
+    seen = set()
+    results = []
+    for movement in movements:
+        model = movement["型番"]
+        if model in created_models and model not in seen:
+            new_stock = stock[model]
+        else:
+            new_stock = max(stock[model] + movement["増減"], 0)
+        seen.add(model)
+        stock[model] = new_stock
+        results.append(new_stock)
+    return results
+
+
+def popularity_score(at, count=1):
+    """日時 at に count 回動いたことを表す人気度"""
+    days = (at - POPULARITY_EPOCH).total_seconds() / 86400
+    return math.log(count) + _POPULARITY_RATE * days
+
+
+def logaddexp(a, b):
+    """log(exp(a) + exp(b))（人気度どうしの足し算。大きい値でも桁あふれしない）"""
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def popularity_increments(movements):
+    """型番ごとに、このバッチの入出庫で足す人気度"""
+    increments = {}
+    for movement in movements:
+        score = popularity_score(movement["日時"])
+        model = movement["型番"]
+        if model in increments:
+            score = logaddexp(increments[model], score)
+        increments[model] = score
+    return increments
+
+
+def search_key(text):
+    """
+    検索キーにする: NFKC で全角英数字・半角カナをそろえ、英字を小文字に、
+    カタカナをひらがなにして、空白を除く（create_postgres_tables.py の search_key() と同じ）
+    """
+    if text is None:
+        return None
+    return "".join(
+        unicodedata.normalize("NFKC", str(text)).translate(_SEARCH_KEY_TABLE).split()
+    )
+
+
+def trigrams(key):
+    """連続する3文字ずつの組"""
+    return {key[i : i + 3] for i in range(len(key) - 2)}
+
+
+def rank_fuzzy(key, candidates, limit):
+    """
+    (値, 検索キー) の候補を、入力 key に似ている順に limit 件の値にする
+    key をそのまま含むものが先、あとは key の3文字組をどれだけ含むか（打ち間違いの分だけ減る）
+    """
+    grams = trigrams(key)
+    scored = {}
+    for value, candidate in candidates:
+        if value is None or candidate is None:
+            continue
+        if key in candidate:
+            score = 1.0
+        elif grams:
+            score = len(grams & trigrams(candidate)) / len(grams)
+        else:
+            continue
+        if score >= FUZZY_THRESHOLD and score > scored.get(value, -1):
+            scored[value] = score
+    return sorted(scored, key=lambda value: (-scored[value], value))[:limit]
+
+
+def _fts_phrase(text):
+    """FTS5 の検索式で、text をそのまま並んだ文字列として探させる"""
+    return '"' + text.replace('"', '""') + '"'
+
+
+def escape_like(text):
+    """LIKEの特殊文字（% _ \\）を普通の文字として扱わせる（ESCAPE '\\' と一緒に使う）"""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def first_movements(movements):
+    """型番ごとの最初の行（未登録なら、この行の内容で登録する）"""
+    first = {}
+    for movement in movements:
+        first.setdefault(movement["型番"], movement)
+    return first
+
+
+def last_locations(movements):
+    """型番ごとの最後の行の保管場所"""
+    return {movement["型番"]: movement["保管場所"] for movement in movements}
+
+
+def merge_suggestions(popular, alphabetical, limit):
+    """人気度の順の候補のあとに、まだ入っていない値の順の候補を続けて limit 件にする"""
+    suggestions = list(popular[:limit])
+    seen = set(suggestions)
+    for value in alphabetical:
+        if len(suggestions) >= limit:
+            break
+        if value not in seen:
+            suggestions.append(value)
+    return suggestions
+
+
+def inventory_page_key(row, sort_column):
+    """行の並べ替えキー（この行の次から読むときに after に渡す。同じ値の行は "No." の順）"""
+    if sort_column == "No.":
+        return [row["No."]]
+    value = row[sort_column]
+    if value is None:
+        value = _INVENTORY_NULL_VALUES[sort_column]
+    return [value, row["No."]]
+
+
+def _inventory_where(filters, placeholder, sort_column=None, descending=False, after=None):
+    conditions = []
+    params = []
+    for column, value in filters.items():
+        conditions.append(f"{INVENTORY_SORT_EXPRESSIONS[column]} = {placeholder}")
+        params.append(value)
+    if after is not None:
+        keys = _inventory_order_keys(sort_column)
+        conditions.append(
+            f"({', '.join(keys)}) {'<' if descending else '>'}"
+            f" ({', '.join([placeholder] * len(keys))})"
+        )
+        params.extend(after)
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+def _inventory_order_keys(sort_column):
+    if sort_column == "No.":
+        return ('"No."',)
+    return (INVENTORY_SORT_EXPRESSIONS[sort_column], '"No."')
+
+
+def _inventory_order_by(sort_column, descending):
+    direction = " DESC" if descending else ""
+    return " ORDER BY " + ", ".join(key + direction for key in _inventory_order_keys(sort_column))
+
+
+def inventory_page_sql(filters, sort_column, descending, after, limit, placeholder):
+    """get_inventory_page の (SQL, パラメーター)。placeholder は SQLite なら ?、PostgreSQL なら %s"""
+    where, params = _inventory_where(filters, placeholder, sort_column, descending, after)
+    columns = ", ".join(f'"{column}"' for column in INVENTORY_LIST_COLUMNS)
+    sql = (
+        f"SELECT {columns} FROM inventory{where}"
+        f"{_inventory_order_by(sort_column, descending)} LIMIT {placeholder}"
+    )
+    return sql, params + [limit]
+
+
+def inventory_key_sql(filters, sort_column, descending, offset, placeholder):
+    """get_inventory_key_at の (SQL, パラメーター)。OFFSET は並べ替えの式の索引だけを数える"""
+    where, params = _inventory_where(filters, placeholder)
+    sql = (
+        f"SELECT {', '.join(_inventory_order_keys(sort_column))} FROM inventory{where}"
+        f"{_inventory_order_by(sort_column, descending)} LIMIT 1 OFFSET {placeholder}"
+    )
+    return sql, params + [offset]
+
+
+def inventory_count_sql(filters, placeholder):
+    where, params = _inventory_where(filters, placeholder)
+    return f"SELECT count(*) FROM inventory{where}", params
+
+
+def align_results(all_movements, applied, results):
+    """反映した行の結果を、元の並びに戻す（反映済みで飛ばした行は None）"""
+    by_id = {movement["movement_id"]: stock for movement, stock in zip(applied, results)}
+    return [by_id.get(movement["movement_id"]) for movement in all_movements]
+
+
+# ==================================================================================
+# SQLiteエンジン（サーバー不要。小さな拠点やテスト用）
+# ==================================================================================
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inventory (
+    "No." INTEGER PRIMARY KEY AUTOINCREMENT,
+    型番 TEXT UNIQUE,
+    製品名 TEXT,
+    カテゴリ TEXT,
+    メーカー TEXT,
+    現在数量 INTEGER,
+    保管場所 INTEGER,
+    発注点 INTEGER,
+    製品名_検索 TEXT,
+    メーカー_検索 TEXT
+);
+CREATE TABLE IF NOT EXISTS history (
+    日時 TIMESTAMP,
+    型番 TEXT,
+    製品名 TEXT,
+    カテゴリ TEXT,
+    メーカー TEXT,
+    数量 INTEGER,
+    在庫数量 INTEGER
+);
+CREATE TABLE IF NOT EXISTS applied_movements (
+    movement_id TEXT PRIMARY KEY,
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS applied_movements_applied_at_idx ON applied_movements (applied_at);
+CREATE TABLE IF NOT EXISTS stock_checkpoints (
+    日時 TIMESTAMP,
+    型番 TEXT,
+    在庫数量 INTEGER,
+    PRIMARY KEY (日時, 型番)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS item_popularity (
+    型番 TEXT PRIMARY KEY,
+    人気度 REAL NOT NULL,
+    版 INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS item_popularity_版_idx ON item_popularity (版);
+CREATE INDEX IF NOT EXISTS item_popularity_人気度_idx ON item_popularity (人気度 DESC);
+CREATE TABLE IF NOT EXISTS stock_alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    日時 TIMESTAMP NOT NULL DEFAULT (datetime('now', 'localtime')),
+    型番 TEXT,
+    在庫数量 INTEGER,
+    発注点 INTEGER,
+    状態 TEXT
+);
+CREATE INDEX IF NOT EXISTS inventory_製品名_idx ON inventory (製品名);
+CREATE INDEX IF NOT EXISTS inventory_カテゴリ_idx ON inventory (カテゴリ);
+CREATE INDEX IF NOT EXISTS inventory_メーカー_idx ON inventory (メーカー);
+CREATE INDEX IF NOT EXISTS history_日時_idx ON history (日時);
+CREATE INDEX IF NOT EXISTS history_型番_日時_idx ON history (型番, 日時);
+"""
+
+# 在庫一覧の並べ替え・絞り込み用（並べ替えと同じ式で作らないと使われない）
+SQLITE_INVENTORY_LIST_INDEXES = "".join(
+    f"CREATE INDEX IF NOT EXISTS inventory_{column}_list_idx"
+    f' ON inventory ({INVENTORY_SORT_EXPRESSIONS[column]}, "No.");\n'
+    for column in INVENTORY_INDEXED_COLUMNS
+)
+
+# 在庫数か発注点が変わった行だけ、発注点をまたいだかを比べる
+# （発注点を新しく設定した時点で既に下回っていれば、それも「不足」として記録する）
+SQLITE_STOCK_ALERT_TRIGGER = f"""
+CREATE TRIGGER IF NOT EXISTS inventory_stock_alert
+AFTER UPDATE OF 現在数量, 発注点 ON inventory
+WHEN NEW.発注点 IS NOT NULL
+ AND COALESCE(OLD.現在数量 <= OLD.発注点, 0) <> (NEW.現在数量 <= NEW.発注点)
+BEGIN
+    INSERT INTO stock_alerts (型番, 在庫数量, 発注点, 状態)
+    VALUES (
+        NEW.型番, NEW.現在数量, NEW.発注点,
+        CASE WHEN NEW.現在数量 <= NEW.発注点
+             THEN '{STOCK_ALERT_SHORTAGE}' ELSE '{STOCK_ALERT_RECOVERED}' END
+    );
+END;
+"""
+
+# あいまい検索の候補にする、製品名・メーカーの値の一覧（同じ値は1行にまとめ、使っている在庫の行数を数える）
+# 同じ製品名の行がいくら多くても候補の枠を埋めないよう、索引は行ではなく値ごとに持つ
+# 検索キーは列ごとに分けて持ち、もう一方の列の検索キーは NULL にする
+SQLITE_SEARCH_VALUES_TABLE = """
+CREATE TABLE IF NOT EXISTS search_values (
+    id INTEGER PRIMARY KEY,
+    列 TEXT NOT NULL,
+    値 TEXT NOT NULL,
+    製品名_検索 TEXT,
+    メーカー_検索 TEXT,
+    件数 INTEGER NOT NULL,
+    UNIQUE (列, 値)
+);
+"""
+
+
+def _search_value_statements(row):
+    """在庫の行 row（NEW / OLD）の製品名・メーカーを、値の一覧に足す文と引く文"""
+    add, remove = [], []
+    for column, key_column in SEARCH_KEY_COLUMNS.items():
+        add.append(
+            f"INSERT INTO search_values (列, 値, {key_column}, 件数)"
+            f" SELECT '{column}', {row}.{column}, {row}.{key_column}, 1"
+            f" WHERE {row}.{column} IS NOT NULL"
+            f" ON CONFLICT (列, 値) DO UPDATE SET 件数 = 件数 + 1, {key_column} = excluded.{key_column};"
+        )
+        remove.append(
+            f"UPDATE search_values SET 件数 = 件数 - 1 WHERE 列 = '{column}' AND 値 = {row}.{column};"
+        )
+        remove.append(
+            f"DELETE FROM search_values WHERE 列 = '{column}' AND 値 = {row}.{column} AND 件数 <= 0;"
+        )
+    return "\n    ".join(add), "\n    ".join(remove)
+
+
+# 値の一覧が無かったときだけ（数える仕掛けを作る前に）今ある在庫から数えて入れる
+SQLITE_SEARCH_VALUES_FILL = "".join(
+    f"INSERT INTO search_values (列, 値, {key_column}, 件数)"
+    f" SELECT '{column}', {column}, max({key_column}), count(*) FROM inventory"
+    f" WHERE {column} IS NOT NULL AND NOT EXISTS"
+    " (SELECT 1 FROM sqlite_master WHERE name = 'inventory_search_values_insert')"
+    f" GROUP BY {column};\n"
+    for column, key_column in SEARCH_KEY_COLUMNS.items()
+)
+
+SQLITE_SEARCH_VALUES_TRIGGERS = """
+CREATE TRIGGER IF NOT EXISTS inventory_search_values_insert AFTER INSERT ON inventory BEGIN
+    {add_new}
+END;
+CREATE TRIGGER IF NOT EXISTS inventory_search_values_delete AFTER DELETE ON inventory BEGIN
+    {remove_old}
+END;
+CREATE TRIGGER IF NOT EXISTS inventory_search_values_update
+AFTER UPDATE OF 製品名, メーカー, 製品名_検索, メーカー_検索 ON inventory
+WHEN OLD.製品名 IS NOT NEW.製品名 OR OLD.メーカー IS NOT NEW.メーカー
+  OR OLD.製品名_検索 IS NOT NEW.製品名_検索 OR OLD.メーカー_検索 IS NOT NEW.メーカー_検索
+BEGIN
+    {remove_old}
+    {add_new}
+END;
+""".format(
+    add_new=_search_value_statements("NEW")[0],
+    remove_old=_search_value_statements("OLD")[1],
+)
+
+# 値の一覧の検索キーの3文字組の索引（FTS5 の trigram。中身は search_values の列を参照する）
+# 部分一致（3文字組の並び）と、3文字組のどれかを含む値の取り出しが索引で引ける
+SQLITE_SEARCH_INDEX = """
+CREATE VIRTUAL TABLE search_values_index USING fts5(
+    製品名_検索, メーカー_検索,
+    content='search_values', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER search_values_index_insert AFTER INSERT ON search_values BEGIN
+    INSERT INTO search_values_index (rowid, 製品名_検索, メーカー_検索)
+    VALUES (NEW.id, NEW.製品名_検索, NEW.メーカー_検索);
+END;
+CREATE TRIGGER search_values_index_delete AFTER DELETE ON search_values BEGIN
+    INSERT INTO search_values_index (search_values_index, rowid, 製品名_検索, メーカー_検索)
+    VALUES ('delete', OLD.id, OLD.製品名_検索, OLD.メーカー_検索);
+END;
+CREATE TRIGGER search_values_index_update AFTER UPDATE OF 製品名_検索, メーカー_検索 ON search_values BEGIN
+    INSERT INTO search_values_index (search_values_index, rowid, 製品名_検索, メーカー_検索)
+    VALUES ('delete', OLD.id, OLD.製品名_検索, OLD.メーカー_検索);
+    INSERT INTO search_values_index (rowid, 製品名_検索, メーカー_検索)
+    VALUES (NEW.id, NEW.製品名_検索, NEW.メーカー_検索);
+END;
+INSERT INTO search_values_index (search_values_index) VALUES ('rebuild');
+"""
+
+# ある時点の在庫数 = その時点以前で一番新しい履歴行の在庫数量
+# 一番新しいチェックポイントの値に、その後の履歴を上書きして求める（同じ日時の行は追記順）
+# {model_filter} には型番の絞り込みを入れる（全型番なら空）
+SQLITE_STOCK_AS_OF_SQL = """
+WITH base AS (
+    SELECT max(日時) AS at FROM stock_checkpoints WHERE 日時 <= :at
+), rows AS (
+    SELECT c.型番, c.在庫数量, c.日時, NULL AS pos
+    FROM stock_checkpoints c, base
+    WHERE c.日時 = base.at {model_filter}
+    UNION ALL
+    SELECT h.型番, h.在庫数量, h.日時, h.rowid
+    FROM history h
+    WHERE h.日時 <= :at
+      AND h.日時 > COALESCE((SELECT at FROM base), '')
+      AND h.型番 IS NOT NULL {model_filter}
+), ranked AS (
+    SELECT 型番, 在庫数量,
+           row_number() OVER (PARTITION BY 型番 ORDER BY 日時 DESC, pos DESC) AS rn
+    FROM rows
+)
+SELECT 型番, 在庫数量 FROM ranked WHERE rn = 1
+"""
+
+# 人気度を足す（版は更新のたびに振り直し、サジェスト索引が変わった分だけ取りに来られるようにする）
+# 書き込みロックを持って実行するので、max(版) + 1 が他と重なることはない
+SQLITE_POPULARITY_SQL = """
+INSERT INTO item_popularity (型番, 人気度, 版)
+VALUES (:型番, :人気度, (SELECT COALESCE(max(版), 0) + 1 FROM item_popularity))
+ON CONFLICT (型番) DO UPDATE
+    SET 人気度 = logaddexp(人気度, excluded.人気度),
+        版 = excluded.版
+"""
+
+# 前方一致する値のうち、人気度のある型番の値を人気度の順に返す
+# （型番以外の列は、その値を持つ型番のうち一番よく動いている型番の人気度で並べる）
+# 読む候補は POPULARITY_SCAN_LIMIT の2通りだけなので、短い入力でもカタログ全体を並べ替えない
+# （人気度の高い型番から探すのは、前方一致が多すぎて全部は見られないときだけ）
+SQLITE_POPULAR_SUGGESTIONS_SQL = """
+WITH prefixed AS (
+    SELECT 型番 AS model, {column} AS value FROM inventory
+    WHERE {column} >= :lower AND {column} < :upper
+    ORDER BY {column} LIMIT :scan
+)
+SELECT value FROM (
+    SELECT i.value, p.人気度 AS score
+    FROM prefixed i JOIN item_popularity p ON p.型番 = i.model
+    UNION ALL
+    SELECT i.{column}, p.人気度
+    FROM (SELECT 型番, 人気度 FROM item_popularity ORDER BY 人気度 DESC LIMIT :scan) p
+    JOIN inventory i ON i.型番 = p.型番
+    WHERE i.{column} >= :lower AND i.{column} < :upper
+      AND (SELECT count(*) FROM prefixed) >= :scan
+)
+GROUP BY value
+ORDER BY max(score) DESC, value
+LIMIT :limit
+"""
+
+SQLITE_CLAIM_SQL = (
+    "INSERT INTO applied_movements (movement_id) VALUES (:movement_id) ON CONFLICT DO NOTHING"
+)
+
+SQLITE_MOVEMENT_SQL = """
+INSERT INTO inventory (型番, 製品名, カテゴリ, メーカー, 現在数量, 保管場所, 製品名_検索, メーカー_検索)
+VALUES (:型番, :製品名, :カテゴリ, :メーカー, MAX(:数量, 0), :保管場所, :製品名_検索, :メーカー_検索)
+ON CONFLICT (型番) DO UPDATE
+    SET 現在数量 = MAX(現在数量 + :増減, 0),
+        保管場所 = excluded.保管場所
+RETURNING 現在数量
+"""
+
+SQLITE_HISTORY_SQL = """
+INSERT INTO history (日時, 型番, 製品名, カテゴリ, メーカー, 数量, 在庫数量)
+VALUES (:日時, :型番, :製品名, :カテゴリ, :メーカー, :増減, :在庫数量)
+"""
+
+
+class SQLiteEngine(StorageEngine):
+    """
+    1つのDBファイルに直接読み書きするエンジン
+    - 接続はスレッドごとに1本を使い回す（sqlite3の接続はスレッド間で共有できない）
+    - WALモード＋busy_timeout で、読み取り中でも書き込みを待たせない
+    - 書き込みは BEGIN IMMEDIATE で最初に書き込みロックを取る（途中でのロック競合を防ぐ）
+    - 初回接続時にテーブルと索引を作るので、ファイルを用意するだけで使える
+    - あいまい検索の3文字組の索引は FTS5 で持つ（FTS5 の無い sqlite3 では検索キーを順に調べる）
+    """
+
+    name = "sqlite"
+
+    def __init__(
+        self,
+        path,
+        busy_timeout=SQLITE_BUSY_TIMEOUT,
+        journal_mode=SQLITE_JOURNAL_MODE,
+    ):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.journal_mode = journal_mode
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self._search_index_ready = False
+
+    # ---------------------------------------------------------
+    # 接続
+    # ---------------------------------------------------------
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            return conn
+
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            isolation_level=None,  # トランザクションは自分で BEGIN する
+            check_same_thread=False,  # close() だけは別スレッドから呼ぶため
+            cached_statements=SQLITE_CACHED_STATEMENTS,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.create_function("logaddexp", 2, logaddexp, deterministic=True)
+        conn.create_function("search_key", 1, search_key, deterministic=True)
+        conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        conn.execute("PRAGMA synchronous = NORMAL")  # WALなら壊れない（電源断で直前のコミットが消えることはある）
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -16000")  # 約16MB
+
+        with self._lock:
+            if not self._schema_ready:
+                conn.executescript(SQLITE_SCHEMA)
+                _add_missing_columns(conn)
+                conn.executescript(SQLITE_STOCK_ALERT_TRIGGER)
+                conn.executescript(SQLITE_INVENTORY_LIST_INDEXES)
+                _create_search_values(conn)
+                self._search_index_ready = _create_search_index(conn)
+                _fill_search_keys(conn)
+                _backfill_popularity(conn)
+                conn.execute(
+                    "DELETE FROM applied_movements WHERE applied_at < datetime('now', ?)",
+                    (f"-{APPLIED_MOVEMENTS_RETENTION_DAYS} days",),
+                )
+                self._schema_ready = True
+            self._connections.append(conn)
+        self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write_transaction(self):
+        # 他の書き込みが終わるまでの待ち時間は「接続待ち」として数える
+        with query_stats.phase("acquire"):
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+        with query_stats.phase("transaction"):
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            with query_stats.phase("execute"):
+                conn.execute("COMMIT")
+
+    def create_schema(self):
+        self._connection()
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    # ---------------------------------------------------------
+    # 読み取り
+    # ---------------------------------------------------------
+    def get_suggestions(self, column_name, search_term, limit):
+        # LIKEは大文字小文字を区別してしまい索引が効かないので、範囲条件で前方一致させる
+        # 重複の多い列でも全行をなめないよう、索引を1件ずつ飛び石に引く
+        upper = search_term[:-1] + chr(ord(search_term[-1]) + 1)
+        params = {
+            "lower": search_term,
+            "upper": upper,
+            "limit": limit,
+            "scan": POPULARITY_SCAN_LIMIT,
+        }
+        query = f"""
+            WITH RECURSIVE candidates(value) AS (
+                SELECT (SELECT {column_name} FROM inventory
+                        WHERE {column_name} >= :lower AND {column_name} < :upper
+                        ORDER BY {column_name} LIMIT 1)
+                UNION ALL
+                SELECT (SELECT {column_name} FROM inventory
+                        WHERE {column_name} > candidates.value AND {column_name} < :upper
+                        ORDER BY {column_name} LIMIT 1)
+                FROM candidates
+                WHERE candidates.value IS NOT NULL
+                LIMIT :limit + 1
+            )
+            SELECT value FROM candidates WHERE value IS NOT NULL LIMIT :limit
+        """
+        with query_stats.phase("execute"):
+            conn = self._connection()
+            popular = [
+                row[0]
+                for row in conn.execute(
+                    SQLITE_POPULAR_SUGGESTIONS_SQL.format(column=column_name), params
+                )
+            ]
+            alphabetical = [row[0] for row in conn.execute(query, params)]
+        suggestions = merge_suggestions(popular, alphabetical, limit)
+        query_stats.add_rows(len(suggestions))
+        return suggestions
+
+    def search_fuzzy(self, column_name, search_term, limit):
+        # 候補は在庫の行ではなく値の一覧から探す（同じ値の行が多くても、他の値が押し出されない）
+        key_column = SEARCH_KEY_COLUMNS[column_name]
+        key = search_key(search_term)
+        conn = self._connection()
+        with query_stats.phase("execute"):
+            if len(key) >= 3 and self._search_index_ready:
+                # 途中に含む値（3文字組が続けて並ぶ値）は似ている度合いが最高なので、値の順に先に取る
+                rows = conn.execute(
+                    f"SELECT 値, {key_column} FROM search_values"
+                    " WHERE id IN (SELECT rowid FROM search_values_index"
+                    "  WHERE search_values_index MATCH ?)"
+                    " ORDER BY 値 LIMIT ?",
+                    (f"{key_column} : {_fts_phrase(key)}", limit),
+                ).fetchall()
+                if len(rows) < limit:
+                    # 足りない分は、3文字組を多く含む順（bm25）に索引から取り出して似ている順に並べ直す
+                    grams = " OR ".join(_fts_phrase(gram) for gram in sorted(trigrams(key)))
+                    rows += conn.execute(
+                        f"SELECT 値, {key_column} FROM search_values"
+                        " WHERE id IN (SELECT rowid FROM search_values_index"
+                        "  WHERE search_values_index MATCH ? ORDER BY rank LIMIT ?)",
+                        (f"{key_column} : ({grams})", FUZZY_CANDIDATES),
+                    ).fetchall()
+            else:
+                # 3文字組の作れない短い入力は、途中に含む値を値の順に探す
+                rows = conn.execute(
+                    f"SELECT 値, {key_column} FROM search_values"
+                    f" WHERE {key_column} LIKE ? ESCAPE '\\' ORDER BY 値 LIMIT ?",
+                    ("%" + escape_like(key) + "%", limit),
+                ).fetchall()
+        query_stats.add_rows(len(rows))
+        return rank_fuzzy(key, rows, limit)
+
+    def get_item_details(self, model_number):
+        with query_stats.phase("execute"):
+            row = (
+                self._connection()
+                .execute("SELECT * FROM inventory WHERE 型番 = ?", (model_number,))
+                .fetchone()
+            )
+        query_stats.add_rows(1 if row else 0)
+        return dict(row) if row else None
+
+    def iter_inventory_rows_since(self, last_no):
+        cursor = self._connection().execute(
+            'SELECT "No.", 型番, 製品名, カテゴリ, メーカー FROM inventory WHERE "No." > ? ORDER BY "No."',
+            (last_no,),
+        )
+        for row in cursor:
+            query_stats.add_rows(1)
+            yield dict(row)
+
+    def iter_popularity_since(self, version):
+        cursor = self._connection().execute(
+            "SELECT p.型番, i.製品名, i.カテゴリ, i.メーカー, p.人気度, p.版"
+            " FROM item_popularity p JOIN inventory i ON i.型番 = p.型番"
+            " WHERE p.版 > ? ORDER BY p.版",
+            (version,),
+        )
+        for row in cursor:
+            query_stats.add_rows(1)
+            yield dict(row)
+
+    def get_stock_alerts(self, after_id, limit):
+        with query_stats.phase("execute"):
+            rows = (
+                self._connection()
+                .execute(
+                    "SELECT * FROM stock_alerts WHERE id > ? ORDER BY id LIMIT ?",
+                    (after_id, limit),
+                )
+                .fetchall()
+            )
+        query_stats.add_rows(len(rows))
+        return [dict(row) for row in rows]
+
+    def get_stock_as_of(self, at, model_number=None):
+        model_filter = "AND 型番 = :model" if model_number is not None else ""
+        with query_stats.phase("execute"):
+            rows = (
+                self._connection()
+                .execute(
+                    SQLITE_STOCK_AS_OF_SQL.format(model_filter=model_filter),
+                    {"at": _sqlite_time(at), "model": model_number},
+                )
+                .fetchall()
+            )
+        query_stats.add_rows(len(rows))
+        return {row[0]: row[1] for row in rows}
+
+    def count_inventory(self, filters):
+        sql, params = inventory_count_sql(filters, "?")
+        with query_stats.phase("execute"):
+            count = self._connection().execute(sql, params).fetchone()[0]
+        return count
+
+    def get_inventory_page(self, filters, sort_column, descending, after, limit):
+        sql, params = inventory_page_sql(filters, sort_column, descending, after, limit, "?")
+        with query_stats.phase("execute"):
+            rows = self._connection().execute(sql, params).fetchall()
+        query_stats.add_rows(len(rows))
+        return [dict(row) for row in rows]
+
+    def get_inventory_key_at(self, filters, sort_column, descending, offset):
+        sql, params = inventory_key_sql(filters, sort_column, descending, offset, "?")
+        with query_stats.phase("execute"):
+            row = self._connection().execute(sql, params).fetchone()
+        return list(row) if row else None
+
+    def stock_checkpoint_times(self):
+        rows = self._connection().execute(
+            "SELECT DISTINCT 日時 FROM stock_checkpoints ORDER BY 日時"
+        )
+        return [datetime.fromisoformat(row[0]) for row in rows]
+
+    def first_history_time(self):
+        value = self._connection().execute("SELECT min(日時) FROM history").fetchone()[0]
+        return datetime.fromisoformat(value) if value else None
+
+    def row_counts(self):
+        conn = self._connection()
+        return {
+            "inventory": conn.execute("SELECT count(*) FROM inventory").fetchone()[0],
+            "history": conn.execute("SELECT count(*) FROM history").fetchone()[0],
+        }
+
+    # ---------------------------------------------------------
+    # 書き込み
+    # ---------------------------------------------------------
+    def apply_movement(self, movement):
+        params = _sqlite_params(movement)
+        with self._write_transaction() as conn, query_stats.phase("execute"):
+            if conn.execute(SQLITE_CLAIM_SQL, params).rowcount == 0:
+                return None  # 反映済み
+            final_stock = conn.execute(SQLITE_MOVEMENT_SQL, params).fetchone()[0]
+            conn.execute(SQLITE_HISTORY_SQL, dict(params, 在庫数量=final_stock))
+            conn.execute(
+                SQLITE_POPULARITY_SQL,
+                {"型番": movement["型番"], "人気度": popularity_score(movement["日時"])},
+            )
+        query_stats.add_rows(1)
+        return final_stock
+
+    def apply_movements(self, movements):
+        all_movements = movements
+
+        # 書き込みロックを持っている間は他から変更されないので、読んでから計算してよい
+        with self._write_transaction() as conn, query_stats.phase("execute"):
+            ids = json.dumps([m["movement_id"] for m in movements])
+            applied_ids = {
+                row[0]
+                for row in conn.execute(
+                    "SELECT movement_id FROM applied_movements"
+                    " WHERE movement_id IN (SELECT value FROM json_each(?))",
+                    (ids,),
+                )
+            }
+            movements = [m for m in movements if m["movement_id"] not in applied_ids]
+            if not movements:
+                return [None] * len(all_movements)
+            conn.executemany(
+                SQLITE_CLAIM_SQL, [{"movement_id": m["movement_id"]} for m in movements]
+            )
+
+            first_by_model = first_movements(movements)
+            models = json.dumps(list(first_by_model), ensure_ascii=False)
+            stock = {
+                row[0]: row[1]
+                for row in conn.execute(
+                    "SELECT 型番, 現在数量 FROM inventory"
+                    " WHERE 型番 IN (SELECT value FROM json_each(?))",
+                    (models,),
+                )
+            }
+
+            # PostgreSQLと同じく型番の順に登録し、"No." の振られ方をハッシュの順に左右させない
+            created_models = [model for model in sorted(first_by_model) if model not in stock]
+            conn.executemany(
+                "INSERT INTO inventory (型番,製品名,カテゴリ,メーカー,現在数量,保管場所,製品名_検索,メーカー_検索)"
+                " VALUES (?,?,?,?,?,?,?,?)",
+                [
+                    (
+                        model,
+                        first_by_model[model]["製品名"],
+                        first_by_model[model]["カテゴリ"],
+                        first_by_model[model]["メーカー"],
+                        max(first_by_model[model]["数量"], 0),
+                        first_by_model[model]["保管場所"],
+                        search_key(first_by_model[model]["製品名"]),
+                        search_key(first_by_model[model]["メーカー"]),
+                    )
+                    for model in created_models
+                ],
+            )
+            for model in created_models:
+                stock[model] = max(first_by_model[model]["数量"], 0)
+
+            results = plan_batch(movements, stock, set(created_models))
+            locations = last_locations(movements)
+
+            conn.executemany(
+                "UPDATE inventory SET 現在数量 = ?, 保管場所 = ? WHERE 型番 = ?",
+                [(stock[model], locations[model], model) for model in first_by_model],
+            )
+            conn.executemany(
+                SQLITE_HISTORY_SQL,
+                [
+                    dict(_sqlite_params(movement), 在庫数量=new_stock)
+                    for movement, new_stock in zip(movements, results)
+                ],
+            )
+            conn.executemany(
+                SQLITE_POPULARITY_SQL,
+                [
+                    {"型番": model, "人気度": score}
+                    for model, score in popularity_increments(movements).items()
+                ],
+            )
+        query_stats.add_rows(len(movements))
+        return align_results(all_movements, movements, results)
+
+    def create_stock_checkpoint(self, at):
+        with self._write_transaction() as conn, query_stats.phase("execute"):
+            params = {"at": _sqlite_time(at)}
+            if conn.execute(
+                "SELECT 1 FROM stock_checkpoints WHERE 日時 = :at LIMIT 1", params
+            ).fetchone():
+                return None
+            count = conn.execute(
+                "INSERT INTO stock_checkpoints (日時, 型番, 在庫数量)"
+                " SELECT :at, 型番, 在庫数量 FROM ("
+                + SQLITE_STOCK_AS_OF_SQL.format(model_filter="")
+                + ")",
+                params,
+            ).rowcount
+        query_stats.add_rows(count)
+        return count
+
+    def clear_stock_checkpoints(self):
+        with self._write_transaction() as conn:
+            conn.execute("DELETE FROM stock_checkpoints")
+
+    def set_reorder_point(self, model_number, reorder_point):
+        with self._write_transaction() as conn, query_stats.phase("execute"):
+            updated = conn.execute(
+                "UPDATE inventory SET 発注点 = ? WHERE 型番 = ?",
+                (reorder_point, model_number),
+            ).rowcount
+        return updated > 0
+
+
+def _add_missing_columns(conn):
+    """前の版で作ったDBファイルに、後から増えた列を足す"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(inventory)")}
+    if "発注点" not in columns:
+        conn.execute("ALTER TABLE inventory ADD COLUMN 発注点 INTEGER")
+    for column in SEARCH_KEY_COLUMNS.values():
+        if column not in columns:
+            conn.execute(f"ALTER TABLE inventory ADD COLUMN {column} TEXT")
+
+
+def _create_search_values(conn):
+    """
+    あいまい検索の候補にする値の一覧が無ければ作る（今ある在庫から数えて入れる）
+    他のPCと同時に作っても二重に数えないよう、書き込みロックを取ってから作る
+    """
+    if conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'inventory_search_values_insert'"
+    ).fetchone():
+        return
+    conn.executescript(
+        "BEGIN IMMEDIATE;"
+        + SQLITE_SEARCH_VALUES_TABLE
+        + SQLITE_SEARCH_VALUES_FILL
+        + SQLITE_SEARCH_VALUES_TRIGGERS
+        + "COMMIT;"
+    )
+
+
+def _create_search_index(conn):
+    """
+    あいまい検索の索引が無ければ作る（作った時点の値もまとめて索引に入れる）
+    FTS5 や trigram の使えない sqlite3 なら False を返す
+    """
+    if conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'search_values_index'"
+    ).fetchone():
+        return True
+    try:
+        conn.executescript("BEGIN;" + SQLITE_SEARCH_INDEX + "COMMIT;")
+    except sqlite3.OperationalError:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        return False
+    return True
+
+
+def _fill_search_keys(conn):
+    """検索キーの無い行（前の版で登録した行など）に検索キーを入れる"""
+    conn.execute(
+        "UPDATE inventory SET 製品名_検索 = search_key(製品名), メーカー_検索 = search_key(メーカー)"
+        " WHERE (製品名_検索 IS NULL AND 製品名 IS NOT NULL)"
+        "    OR (メーカー_検索 IS NULL AND メーカー IS NOT NULL)"
+    )
+
+
+def _backfill_popularity(conn):
+    """人気度がまだ1件も無ければ、最近の履歴から数えて作る（前の版で作ったDBファイル用）"""
+    if conn.execute("SELECT 1 FROM item_popularity LIMIT 1").fetchone():
+        return
+    since = datetime.now() - timedelta(days=POPULARITY_BACKFILL_DAYS)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # 他のPCが先に作っていたら何もしない
+        if not conn.execute("SELECT 1 FROM item_popularity LIMIT 1").fetchone():
+            rows = conn.execute(
+                "SELECT 型番, 日時 FROM history WHERE 日時 >= ? AND 型番 IS NOT NULL",
+                (_sqlite_time(since),),
+            )
+            movements = [
+                {"型番": row[0], "日時": datetime.fromisoformat(row[1])} for row in rows
+            ]
+            conn.executemany(
+                SQLITE_POPULARITY_SQL,
+                [
+                    {"型番": model, "人気度": score}
+                    for model, score in popularity_increments(movements).items()
+                ],
+            )
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _sqlite_params(movement):
+    """日時は文字列にして渡す（sqlite3 の datetime 自動変換は非推奨のため）"""
+    params = dict(movement)
+    params["日時"] = _sqlite_time(movement["日時"])
+    for column, key_column in SEARCH_KEY_COLUMNS.items():
+        params[key_column] = search_key(movement[column])
+    return params
+
+
+def _sqlite_time(value):
+    return value.strftime("%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,314 @@
+import bisect
+import collections
+import heapq
+import itertools
+import sys
+import threading
+import time
+
+import backend_logic as logic
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+# メモリ上に候補を持つ列（DBのサジェスト検索と同じ列）
+INDEXED_COLUMNS = logic.SEARCHABLE_COLUMNS
+# 前方一致の候補が足りないとき、途中に含む値・似ている値をDBのあいまい検索で足す列
+FUZZY_COLUMNS = logic.FUZZY_SEARCH_COLUMNS
+
+SUGGESTION_LIMIT = logic.SUGGESTION_LIMIT  # 1回の検索で返す候補の最大数
+REFRESH_INTERVAL = 5.0  # 差分を取りに行く間隔（秒）
+# "No." や人気度の版はコミットより前に振られるので、番号の小さい行が後からコミットされることがある
+# 差分はこの秒数より前に取り込んだ位置から読み直し、遅れてコミットされた行も拾う（同じ値は二重に入らない）
+RESCAN_WINDOW = 300.0
+MEMORY_BUDGET_BYTES = 64 * 1024 * 1024  # 索引全体で使ってよいメモリの目安
+# 前方一致する値がこれ以下なら、その場で人気度を比べて並べる
+# これより多い（1〜2文字の入力など）ときは、接頭辞ごとに上位の候補を覚えておいて返す
+RANK_SCAN_LIMIT = 2000
+
+# 1件あたりのリストのポインタ分（文字列本体は sys.getsizeof で数える）
+_POINTER_SIZE = 8
+# 人気度の辞書の1件分（キーのポインタ＋float＋辞書の空き）
+_SCORE_ENTRY_SIZE = 100
+# 覚えた接頭辞の上位1つ分の固定部分（辞書の1件＋リスト本体。接頭辞と limit 件のポインタは別に足す）
+_TOP_ENTRY_SIZE = 160
+
+
+# ==================================================================================
+# サジェスト索引
+# ==================================================================================
+class SuggestionIndex:
+    """
+    入力候補を列ごとのソート済み配列としてメモリに持ち、前方一致を二分探索で返す
+    候補は最近よく動いた型番（の値）を人気度の順に先に、残りを値の順に並べる
+
+    - 初回の検索時に inventory と人気度を一度だけ読み込む
+    - 以降は REFRESH_INTERVAL ごとに "No." と人気度の版が増えた分だけを取りに行く
+      （RESCAN_WINDOW 秒前に取り込んだ位置から読み直すので、遅れてコミットされた行も入る）
+    - 前方一致する値が多い接頭辞は、上位 limit 件を覚えておく
+      人気度は増える一方なので、値の人気度が上がったときにその接頭辞の上位だけを直せば正しいまま
+      （1回の検索は前方一致が RANK_SCAN_LIMIT 件以下なら全部、それより多ければ limit 件程度しか見ない）
+    - メモリ予算を超えたら、まず覚えた上位を捨て、それでも超える列は索引を捨てて従来どおりDBに問い合わせる
+    - 製品名・メーカーは、前方一致が limit 件に満たなければあいまい検索の結果を後ろに足す
+    get_suggestions(column_name, search_term) は
+    logic.get_autocomplete_suggestions と同じ形なので、そのまま差し替えられる
+    """
+
+    def __init__(
+        self,
+        iter_rows_func=logic.iter_inventory_rows_since,
+        iter_popularity_func=logic.iter_popularity_since,
+        fallback_func=logic.get_autocomplete_suggestions,
+        fuzzy_func=logic.search_fuzzy,
+        limit=SUGGESTION_LIMIT,
+        refresh_interval=REFRESH_INTERVAL,
+        memory_budget=MEMORY_BUDGET_BYTES,
+    ):
+        """
+        :param iter_rows_func: "No." より後の在庫レコードを返す関数
+        :param iter_popularity_func: 版より後に変わった型番の人気度を返す関数
+        :param fallback_func: 索引を持てない列の検索に使う関数
+        :param fuzzy_func: 製品名・メーカーのあいまい検索の関数
+        :param limit: 返す候補の最大数
+        :param refresh_interval: 差分取得の間隔（秒）
+        :param memory_budget: 索引全体のメモリ上限（バイト）
+        """
+        self.iter_rows_func = iter_rows_func
+        self.iter_popularity_func = iter_popularity_func
+        self.fallback_func = fallback_func
+        self.fuzzy_func = fuzzy_func
+        self.limit = limit
+        self.refresh_interval = refresh_interval
+        self.memory_budget = memory_budget
+
+        self._values = {column: [] for column in INDEXED_COLUMNS}
+        self._bytes = {column: 0 for column in INDEXED_COLUMNS}
+        # 値 → 人気度（その値を持つ型番のうち一番高いもの）。動いたことのない値は持たない
+        self._scores = {column: {} for column in INDEXED_COLUMNS}
+        # 前方一致が多い接頭辞 → 人気度のある値の上位 limit 件（人気度の高い順）
+        self._top = {column: {} for column in INDEXED_COLUMNS}
+        self._top_bytes = {column: 0 for column in INDEXED_COLUMNS}  # _bytes のうち _top の分
+        self._disabled = set()  # メモリ予算を超えてDB検索に戻した列
+        # 取り込みのたびの (時刻, 読んだ "No." の最大, 読んだ版の最大)。先頭は RESCAN_WINDOW 秒前の位置
+        self._watermarks = collections.deque()
+        self._loaded = False
+        self._last_refresh = 0.0
+
+        self._lock = threading.Lock()  # 索引本体の読み書き
+        self._refresh_lock = threading.Lock()  # DBからの取り込みは同時に1つだけ
+
+    # ---------------------------------------------------------
+    # 検索
+    # ---------------------------------------------------------
+    def get_suggestions(self, column_name, search_term):
+        """指定された列から前方一致する候補を返す"""
+        if not search_term:
+            return []
+        if column_name not in INDEXED_COLUMNS:
+            return self.fallback_func(column_name, search_term)
+
+        self.refresh()
+
+        with self._lock:
+            indexed = column_name not in self._disabled
+            if indexed:
+                result = self._prefix_search(column_name, search_term)
+        if not indexed:
+            result = self.fallback_func(column_name, search_term)
+
+        if column_name in FUZZY_COLUMNS and len(result) < self.limit:
+            # 前方一致が足りなければ、途中に含む値・打ち間違えていても似ている値で埋める
+            taken = set(result)
+            for value in self.fuzzy_func(column_name, search_term, self.limit):
+                if len(result) >= self.limit:
+                    break
+                if value not in taken:
+                    result.append(value)
+        return result
+
+    def _prefix_search(self, column, prefix):
+        values = self._values[column]
+        scores = self._scores[column]
+        start = bisect.bisect_left(values, prefix)
+        end = bisect.bisect_left(values, prefix[:-1] + chr(ord(prefix[-1]) + 1), start)
+
+        if end - start <= RANK_SCAN_LIMIT:
+            result = self._rank(itertools.islice(values, start, end), scores)
+        else:
+            top = self._top[column]
+            result = top.get(prefix)
+            if result is None:
+                # この接頭辞で初めて検索されたときだけ全部を比べ、以降は覚えた上位を直しながら使う
+                result = top[prefix] = self._rank(itertools.islice(values, start, end), scores)
+                size = _TOP_ENTRY_SIZE + sys.getsizeof(prefix) + _POINTER_SIZE * self.limit
+                self._bytes[column] += size
+                self._top_bytes[column] += size
+                self._enforce_budget()
+            result = list(result)
+
+        # 残りは、動いたことのない値を値の順に（人気度のある値は上の result に全部入っている）
+        taken = set(result)
+        for value in itertools.islice(values, start, end):
+            if len(result) >= self.limit:
+                break
+            if value not in taken:
+                result.append(value)
+        return result
+
+    def _rank(self, values, scores):
+        """人気度のある値を、人気度の高い順に limit 件まで（同じなら値の順）"""
+        return heapq.nlargest(
+            self.limit, (value for value in values if value in scores), key=scores.get
+        )
+
+    # ---------------------------------------------------------
+    # 取り込み
+    # ---------------------------------------------------------
+    def refresh(self, force=False):
+        """前回の取り込みから時間が経っていれば、増えた分だけを取り込む"""
+        if (
+            not force
+            and self._loaded
+            and time.monotonic() - self._last_refresh < self.refresh_interval
+        ):
+            return
+
+        # 他のスレッドが取り込み中なら、初回以外は今ある索引で答える
+        if not self._refresh_lock.acquire(blocking=not self._loaded):
+            return
+        try:
+            now = time.monotonic()
+            if self._loaded:
+                last_no, version = self._rescan_start(now)
+                for row in self.iter_rows_func(last_no):
+                    last_no = max(last_no, row["No."])
+                    self.add_item(row)
+            else:
+                last_no = self._initial_load()
+                version = 0
+            # 人気度は在庫レコードの後に読む（人気度のある値は、必ず索引に入っている）
+            for row in self.iter_popularity_func(version):
+                version = max(version, row["版"])
+                self.add_popularity(row)
+            if self._watermarks:
+                _, seen_no, seen_version = self._watermarks[-1]
+                last_no, version = max(last_no, seen_no), max(version, seen_version)
+            self._watermarks.append((now, last_no, version))
+            self._last_refresh = now
+        finally:
+            self._refresh_lock.release()
+
+    def _rescan_start(self, now):
+        """RESCAN_WINDOW 秒前（まだ無ければ一番古い取り込み）の時点で読み終えていた "No." と版"""
+        while len(self._watermarks) > 1 and self._watermarks[1][0] <= now - RESCAN_WINDOW:
+            self._watermarks.popleft()
+        _, last_no, version = self._watermarks[0]
+        return last_no, version
+
+    def _initial_load(self):
+        """全件を読み込み、列ごとに重複を除いてソートする（読んだ "No." の最大を返す）"""
+        collected = {column: set() for column in INDEXED_COLUMNS}
+        last_no = 0
+        for row in self.iter_rows_func(last_no):
+            last_no = max(last_no, row["No."])
+            for column in INDEXED_COLUMNS:
+                if row.get(column) is not None:
+                    collected[column].add(str(row[column]))
+
+        with self._lock:
+            for column in INDEXED_COLUMNS:
+                values = sorted(collected.pop(column))
+                self._values[column] = values
+                self._bytes[column] = sum(
+                    sys.getsizeof(value) + _POINTER_SIZE for value in values
+                )
+            self._loaded = True
+            self._enforce_budget()
+        return last_no
+
+    def add_item(self, row):
+        """
+        1件分の値を索引に追加する
+        DBから取り込んだ行のほか、このPCで登録した直後の入力値を渡してもよい
+        （差分をどこから読むかは、DBから取り込んだ行だけで決める）
+        """
+        with self._lock:
+            for column in INDEXED_COLUMNS:
+                if column in self._disabled or row.get(column) in (None, ""):
+                    continue
+                value = str(row[column])
+                values = self._values[column]
+                pos = bisect.bisect_left(values, value)
+                if pos < len(values) and values[pos] == value:
+                    continue
+                values.insert(pos, value)
+                self._bytes[column] += sys.getsizeof(value) + _POINTER_SIZE
+            self._enforce_budget()
+
+    def add_popularity(self, row):
+        """1つの型番の人気度（DBから取り込んだ行）を、その型番の各列の値に反映する"""
+        with self._lock:
+            score = row["人気度"]
+            for column in INDEXED_COLUMNS:
+                if column in self._disabled or row.get(column) in (None, ""):
+                    continue
+                value = str(row[column])
+                scores = self._scores[column]
+                if value in scores and scores[value] >= score:
+                    continue
+                if value not in scores:
+                    self._bytes[column] += _SCORE_ENTRY_SIZE
+                scores[value] = score
+                self._raise_in_top(column, value)
+            self._enforce_budget()
+
+    def _raise_in_top(self, column, value):
+        """value の人気度が上がったので、value で始まりうる接頭辞の上位を直す"""
+        scores = self._scores[column]
+        score = scores[value]
+        top = self._top[column]
+        for end in range(1, len(value) + 1):
+            ranked = top.get(value[:end])
+            if ranked is None:
+                continue
+            if value in ranked:
+                ranked.remove(value)
+            elif len(ranked) >= self.limit and score <= scores[ranked[-1]]:
+                continue  # 上位に届かない（他の値の人気度は下がらないので、この先も入らない）
+            pos = 0
+            while pos < len(ranked) and scores[ranked[pos]] >= score:
+                pos += 1
+            ranked.insert(pos, value)
+            del ranked[self.limit :]
+
+    def _enforce_budget(self):
+        """
+        予算を超えたら、まず覚えた接頭辞の上位を捨てる（必要になればまた作れる）
+        それでも超えるなら、大きい列から索引を捨ててDB検索に切り替える
+        """
+        if sum(self._bytes.values()) > self.memory_budget:
+            for column in INDEXED_COLUMNS:
+                self._top[column] = {}
+                self._bytes[column] -= self._top_bytes[column]
+                self._top_bytes[column] = 0
+        while sum(self._bytes.values()) > self.memory_budget:
+            largest = max(self._bytes, key=self._bytes.get)
+            self._disabled.add(largest)
+            self._values[largest] = []
+            self._scores[largest] = {}
+            self._top[largest] = {}
+            self._bytes[largest] = 0
+            self._top_bytes[largest] = 0
+
+    # ---------------------------------------------------------
+    # 状態確認
+    # ---------------------------------------------------------
+    def memory_usage(self):
+        """列ごとの推定メモリ使用量（バイト）を返す"""
+        with self._lock:
+            return dict(self._bytes)
+
+    def disabled_columns(self):
+        """メモリ予算超過でDB検索に戻している列"""
+        with self._lock:
+            return set(self._disabled)
@@ -0,0 +1,86 @@
+import asyncio
+import os
+
+import pytest
+
+import async_logic
+import backend_logic
+
+# テスト用のDBファイル名
+TEST_DB_FILE = "test_async_inventory.db"
+TEST_JOURNAL_FILE = "test_async_write_journal.jsonl"
+
+
+def remove_test_db():
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(TEST_DB_FILE + suffix):
+            os.remove(TEST_DB_FILE + suffix)
+    for suffix in ("", ".done", ".rejected.jsonl"):
+        if os.path.exists(TEST_JOURNAL_FILE + suffix):
+            os.remove(TEST_JOURNAL_FILE + suffix)
+
+
+# ====================================================================
+# ⚙️ テストの準備と後片付け (フィクスチャ)
+# ====================================================================
+@pytest.fixture(scope="function")
+def setup_db():
+    """テストのたびに新しい空のSQLiteのDBを使う"""
+    backend_logic.close_engine()
+    backend_logic.close_write_journal()
+    remove_test_db()
+    backend_logic.DB_ENGINE = "sqlite"
+    backend_logic.DB_FILE = TEST_DB_FILE
+    backend_logic.JOURNAL_FILE = TEST_JOURNAL_FILE
+
+    yield
+
+    backend_logic.close_engine()
+    backend_logic.close_write_journal()
+    remove_test_db()
+
+
+# ====================================================================
+# ✅ ここからテストケース
+# ====================================================================
+
+
+def test_many_concurrent_lookups_after_an_update(setup_db):
+    """1つのイベントループから更新し、数百件の読み取りを同時に待てるか？"""
+    base = {"製品名": "P", "カテゴリ": "C", "メーカー": "M", "保管場所": "1", "処理種別": "補充"}
+
+    async def scenario():
+        async with async_logic.AsyncInventory() as inventory:
+            results = await asyncio.gather(
+                *(
+                    inventory.run_main_process_from_ui(dict(base, 型番=f"AS-{i}", 数量=str(i)))
+                    for i in range(1, 4)
+                )
+            )
+            assert all(result["success"] for result in results)
+
+            lookups = []
+            for _ in range(100):
+                lookups.append(inventory.get_autocomplete_suggestions("型番", "AS"))
+                lookups.append(inventory.get_item_details_by_model("AS-2"))
+                lookups.append(inventory.get_item_details_by_model("NONE"))
+            return await asyncio.gather(*lookups)
+
+    results = asyncio.run(scenario())
+    assert len(results) == 300
+    assert sorted(results[0]) == ["AS-1", "AS-2", "AS-3"]
+    assert results[1]["現在数量"] == 2
+    assert results[2] is None
+
+
+def test_timeouts_and_invalid_columns_are_raised(setup_db):
+    """タイムアウトを過ぎたら asyncio.TimeoutError、対象外の列は ValueError になるか？"""
+
+    async def scenario():
+        async with async_logic.AsyncInventory() as inventory:
+            with pytest.raises(asyncio.TimeoutError):
+                await inventory.get_autocomplete_suggestions("型番", "A", timeout=0)
+            with pytest.raises(ValueError):
+                await inventory.get_autocomplete_suggestions("保管場所", "1")
+
+    asyncio.run(scenario())
@@ -1,10 +1,27 @@
 import pytest
+import json
 import os
-import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
 import backend_logic  # テスト対象のファイルをインポート
+import storage_engine
+import write_journal
 
 # テスト用のDBファイル名
 TEST_DB_FILE = "test_inventory.db"
+TEST_JOURNAL_FILE = "test_write_journal.jsonl"
+
+
+def remove_test_db():
+    # WALモードでは本体のほかに -wal と -shm のファイルもできる
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(TEST_DB_FILE + suffix):
+            os.remove(TEST_DB_FILE + suffix)
+    for suffix in ("", ".done", ".rejected.jsonl"):
+        if os.path.exists(TEST_JOURNAL_FILE + suffix):
+            os.remove(TEST_JOURNAL_FILE + suffix)
 
 
 # ====================================================================
@@ -17,51 +34,63 @@ def setup_db():
     backend_logicがそのDBを使うように差し替える
     """
     # 1. 本番のDB設定を、テスト用ファイルに書き換える（ここが重要！）
-    #    これでテスト中は test_inventory.db が使われる
+    #    これでテスト中は SQLiteエンジンで test_inventory.db が使われる
+    #    （テーブルはエンジンが最初の接続時に作る）
+    backend_logic.close_engine()
+    backend_logic.close_write_journal()
+    remove_test_db()
+    backend_logic.DB_ENGINE = "sqlite"
     backend_logic.DB_FILE = TEST_DB_FILE
+    backend_logic.JOURNAL_FILE = TEST_JOURNAL_FILE
 
-    # 2. テスト用DBにテーブルを作る（create_dummy_db.pyと同じ構造）
-    conn = sqlite3.connect(TEST_DB_FILE)
-    cursor = conn.cursor()
-
-    # inventoryテーブル作成
-    cursor.execute(
-        """
-    CREATE TABLE IF NOT EXISTS inventory (
-        "No." INTEGER PRIMARY KEY AUTOINCREMENT,
-        型番 TEXT UNIQUE,
-        製品名 TEXT,
-        カテゴリ TEXT,
-        メーカー TEXT,
-        現在数量 INTEGER,
-        保管場所 INTEGER
-    )
-    """
-    )
+    # 2. テスト実行！ (ここでテスト関数が動く)
+    yield
 
-    # historyテーブル作成
-    cursor.execute(
-        """
-    CREATE TABLE IF NOT EXISTS history (
-        日時 TIMESTAMP,
-        型番 TEXT,
-        製品名 TEXT,
-        カテゴリ TEXT,
-        メーカー TEXT,
-        数量 INTEGER,
-        在庫数量 INTEGER
-    )
+    # 3. 後片付け: テストが終わったらDBファイルを消す
+    backend_logic.close_engine()
+    backend_logic.close_write_journal()
+    remove_test_db()
+
+
+@pytest.fixture(scope="function", params=("wide", "compact"))
+def postgres_db(request):
     """
+    環境変数 TEST_POSTGRESQL_DBNAME で指定したテスト専用のPostgreSQLのDBを、
+    履歴の持ち方（wide / compact）ごとに作り直して空にしてから使う（指定が無ければ飛ばす）
+    接続先のサーバーは TEST_POSTGRESQL_HOST（無ければ config.ini の [POSTGRESQL]）
+    """
+    dbname = os.environ.get("TEST_POSTGRESQL_DBNAME")
+    if not dbname:
+        pytest.skip("TEST_POSTGRESQL_DBNAME が無いので、PostgreSQLのテストは飛ばします。")
+    import create_postgres_tables
+
+    saved = (backend_logic.DB_ENGINE, backend_logic.DB_HOST, backend_logic.DB_NAME)
+    backend_logic.close_engine()
+    backend_logic.close_write_journal()
+    remove_test_db()
+    backend_logic.DB_ENGINE = "postgresql"
+    backend_logic.DB_HOST = os.environ.get("TEST_POSTGRESQL_HOST", backend_logic.DB_HOST)
+    backend_logic.DB_NAME = dbname
+    backend_logic.JOURNAL_FILE = TEST_JOURNAL_FILE
+
+    create_postgres_tables.create_tables(history_layout=request.param)
+    history_tables = (
+        ["history"] if request.param == "wide" else list(create_postgres_tables.COMPACT_HISTORY_TABLES)
     )
-    conn.commit()
+    conn, _ = backend_logic.get_db_connection()
+    with conn, conn.cursor() as cursor:
+        cursor.execute(
+            "TRUNCATE inventory, applied_movements, stock_checkpoints, stock_alerts,"
+            f" item_popularity, {', '.join(history_tables)}"
+        )
     conn.close()
 
-    # 3. テスト実行！ (ここでテスト関数が動く)
-    yield
+    yield request.param
 
-    # 4. 後片付け: テストが終わったらDBファイルを消す
-    if os.path.exists(TEST_DB_FILE):
-        os.remove(TEST_DB_FILE)
+    backend_logic.close_engine()
+    backend_logic.close_write_journal()
+    backend_logic.DB_ENGINE, backend_logic.DB_HOST, backend_logic.DB_NAME = saved
+    remove_test_db()
 
 
 # ====================================================================
@@ -69,6 +98,72 @@ def setup_db():
 # ====================================================================
 
 
+class FakePgConnection:
+    """プールの試験用の接続（生存確認の SELECT 1 は、alive が False なら通信断で失敗する）"""
+
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        if not self.alive:
+            raise backend_logic.psycopg2.OperationalError("server closed the connection")
+
+    def get_transaction_status(self):
+        return backend_logic.psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_connection_pool_times_out_and_replaces_broken_connections():
+    """空きが無ければ待ってタイムアウトし、死んだ接続・壊れた接続は捨てて新しく接続するか？"""
+    pytest.importorskip("psycopg2")
+    backend_logic._import_psycopg2()
+    connections = []
+
+    def connect():
+        connections.append(FakePgConnection())
+        return connections[-1]
+
+    pool = backend_logic.ConnectionPool(
+        connect, min_size=1, max_size=1, acquire_timeout=0.05, health_check_interval=0
+    )
+    entry = pool.acquire()
+    started = time.monotonic()
+    with pytest.raises(backend_logic.PoolTimeoutError):
+        pool.acquire()
+    assert time.monotonic() - started >= 0.05
+
+    # 返却を待っている間に返されれば、その接続を借りられる
+    threading.Timer(0.02, pool.release, (entry,)).start()
+    assert pool.acquire(timeout=1.0).conn is connections[0]
+    pool.release(entry)
+
+    # DBが再起動して待機中の接続が死んでいた → 生存確認で気づき、閉じて接続し直す
+    connections[0].alive = False
+    entry = pool.acquire()
+    assert entry.conn is connections[1] and connections[0].closed
+
+    # 使っている途中で壊れた接続は、返却時に捨てて枠を空ける
+    pool.release(entry, broken=True)
+    assert connections[1].closed
+    assert pool.acquire().conn is connections[2]
+    pool.close()
+
+
 def test_sanitization_full_width_numbers(setup_db):
     """全角数字が半角に変換されて登録されるか？"""
     input_data = {
@@ -92,6 +187,16 @@ def test_sanitization_full_width_numbers(setup_db):
     assert details["現在数量"] == 10  # 半角の10になっているはず
 
 
+def test_incomplete_input_returns_an_error_result(setup_db):
+    """入力の項目が足りないときも、例外ではなく success=False の結果が返るか？"""
+    result = backend_logic.run_main_process_from_ui(
+        {"処理種別": "補充", "型番": "TEST-00", "製品名": "テスト製品", "数量": "1"}
+    )
+
+    assert result["success"] is False
+    assert backend_logic.get_item_details_by_model("TEST-00") is None
+
+
 def test_stock_calculation_add(setup_db):
     """在庫の足し算（補充）が正しく動くか？"""
     # まず10個登録
@@ -189,3 +294,417 @@ def test_stock_floor_limit(setup_db):
     # 結果はマイナスではなく0のはず
     details = backend_logic.get_item_details_by_model("TEST-04")
     assert details["現在数量"] == 0
+
+
+def test_batch_same_model_in_order(setup_db):
+    """まとめて実行したとき、同じ型番の行が入力順に計算されるか？"""
+    base = {
+        "型番": "TEST-05",
+        "製品名": "A",
+        "カテゴリ": "C",
+        "メーカー": "M",
+        "保管場所": "100",
+    }
+
+    results = backend_logic.run_batch_process(
+        [
+            dict(base, 処理種別="補充", 数量=5),  # 新規登録 → 5
+            dict(base, 処理種別="使用", 数量=8),  # 0で止まる
+            dict(base, 処理種別="補充", 数量="３"),  # 全角 → 3
+            dict(base, 処理種別="補充", 数量="abc"),  # この行だけエラー
+        ]
+    )
+
+    assert [r["success"] for r in results] == [True, True, True, False]
+    assert [r.get("在庫数量") for r in results[:3]] == [5, 0, 3]
+
+    details = backend_logic.get_item_details_by_model("TEST-05")
+    assert details["現在数量"] == 3
+
+    # 1回のまとめ実行で登録した型番は、入力やハッシュの順に関係なく型番の順に "No." が振られる
+    backend_logic.run_batch_process(
+        [dict(base, 処理種別="補充", 型番=model, 数量=1) for model in ("Z-2", "A-1", "M-3")]
+    )
+    rows = backend_logic.get_inventory_page(limit=10)
+    assert [row["型番"] for row in rows] == ["TEST-05", "A-1", "M-3", "Z-2"]
+
+
+def test_suggestions_are_ranked_by_recent_use(setup_db, monkeypatch):
+    """よく動いている型番がサジェストの先頭に来て、古い入出庫ほど効きが弱くなるか？"""
+    base = {"製品名": "P", "カテゴリ": "C", "メーカー": "M", "保管場所": "1", "数量": "1"}
+    backend_logic.run_batch_process(
+        [dict(base, 型番=model, 処理種別="補充") for model in ("AB-1", "AB-2", "AB-3")]
+    )
+    for _ in range(2):
+        backend_logic.run_main_process_from_ui(dict(base, 型番="AB-3", 処理種別="使用"))
+
+    assert backend_logic.get_autocomplete_suggestions("型番", "AB") == ["AB-3", "AB-1", "AB-2"]
+    assert backend_logic.get_autocomplete_suggestions("型番", "AB", limit=1) == ["AB-3"]
+
+    # 前方一致を値の順に読む件数を超えても、人気度の高い型番から探して先頭に出す
+    monkeypatch.setattr(storage_engine, "POPULARITY_SCAN_LIMIT", 2)
+    assert backend_logic.get_autocomplete_suggestions("型番", "AB") == ["AB-3", "AB-1", "AB-2"]
+
+    # 半減期の2倍前に2回 ＜ 今1回（2 × 1/4 ＜ 1）
+    now = datetime.now()
+    old = now - timedelta(days=2 * storage_engine.POPULARITY_HALF_LIFE_DAYS)
+    assert storage_engine.popularity_score(old, 2) < storage_engine.popularity_score(now)
+
+
+def test_fuzzy_search_ignores_width_and_kana_and_tolerates_typos(setup_db):
+    """全角/半角・カタカナ/ひらがなの違いを無視し、途中一致や1文字の打ち間違いでも見つかるか？"""
+    base = {"カテゴリ": "C", "保管場所": "1", "数量": "1", "処理種別": "補充"}
+    backend_logic.run_batch_process(
+        [
+            dict(base, 型番="FZ-1", 製品名="ステンレス六角ボルト", メーカー="ＡＢＣ工業"),
+            dict(base, 型番="FZ-2", 製品名="平ワッシャー", メーカー="XYZ商事"),
+        ]
+    )
+
+    assert backend_logic.search_fuzzy("製品名", "ｽﾃﾝﾚｽ") == ["ステンレス六角ボルト"]
+    assert backend_logic.search_fuzzy("製品名", "ろっかく") == []  # 漢字の読みまでは見ない
+    assert backend_logic.search_fuzzy("製品名", "六角 ボルト") == ["ステンレス六角ボルト"]
+    assert backend_logic.search_fuzzy("製品名", "ひらわっしゃー") == ["平ワッシャー"]
+    assert backend_logic.search_fuzzy("製品名", "ステンレス六各ボルト") == ["ステンレス六角ボルト"]
+    assert backend_logic.search_fuzzy("メーカー", "abc") == ["ＡＢＣ工業"]
+    assert backend_logic.search_fuzzy("メーカー", "") == []
+    with pytest.raises(ValueError):
+        backend_logic.search_fuzzy("型番", "FZ")
+
+
+def test_fuzzy_search_does_not_lose_matches_to_duplicated_values(setup_db, monkeypatch):
+    """同じ製品名の行がたくさんあっても、途中一致や似ている別の値が候補から押し出されないか？"""
+    monkeypatch.setattr(storage_engine, "FUZZY_CANDIDATES", 2)
+    base = {"カテゴリ": "C", "保管場所": "1", "数量": "1", "処理種別": "補充", "メーカー": "M"}
+    names = ["ボルト 121"] * 20 + ["ボルト 123"] * 20 + ["ボルト 122", "ボルト 130", "ボルト 138"]
+    names += ["ステンレス板"] * 20 + ["ステンレス六角ボルト"]
+    backend_logic.run_batch_process(
+        [dict(base, 型番=f"DUP-{i}", 製品名=name) for i, name in enumerate(names)]
+    )
+
+    # 途中に含む値が先に全部並ぶ（その後ろに、似ている値が続くことはある）
+    assert backend_logic.search_fuzzy("製品名", "ボルト 1")[:5] == [
+        "ボルト 121", "ボルト 122", "ボルト 123", "ボルト 130", "ボルト 138"
+    ]
+    assert backend_logic.search_fuzzy("製品名", "ボルト 1", limit=2) == ["ボルト 121", "ボルト 122"]
+    assert "ステンレス六角ボルト" in backend_logic.search_fuzzy("製品名", "ステンレス六各ボルト")
+
+
+def test_offline_movement_is_journaled_and_replayed_once(setup_db):
+    """DBにつながらないときはジャーナルに記録され、つながったら1回だけ反映されるか？"""
+    base = {
+        "型番": "TEST-06",
+        "製品名": "A",
+        "カテゴリ": "C",
+        "メーカー": "M",
+        "保管場所": "100",
+    }
+    journal = backend_logic.get_write_journal()
+    journal.stop()  # 裏の送信を止めて、送るタイミングをテストで決める
+
+    # 開けないパスにしてDBにつながらない状態を作る
+    backend_logic.DB_FILE = os.path.join("no-such-dir", TEST_DB_FILE)
+    result = backend_logic.run_main_process_from_ui(dict(base, 処理種別="補充", 数量=5))
+    assert result["success"] is True
+    assert result["保留"] is True
+
+    # 未送信が残っている間は、つながっていても後ろに並ぶ
+    backend_logic.close_engine()
+    backend_logic.DB_FILE = TEST_DB_FILE
+    result = backend_logic.run_main_process_from_ui(dict(base, 処理種別="使用", 数量=2))
+    assert result["保留"] is True
+
+    with open(TEST_JOURNAL_FILE, "rb") as f:
+        journaled = f.read()
+    assert journal.replay_once() == 2
+    assert not journal.has_pending()
+    assert backend_logic.get_item_details_by_model("TEST-06")["現在数量"] == 3
+
+    # 送信済みを記録する前に落ちた場合：同じジャーナルから起動し直して送っても数は変わらない
+    backend_logic.close_write_journal()
+    with open(TEST_JOURNAL_FILE, "wb") as f:
+        f.write(journaled)
+    restarted = write_journal.WriteJournal(
+        TEST_JOURNAL_FILE, backend_logic._replay_movements, backend_logic._is_unavailable
+    )
+    assert restarted.replay_once() == 2
+    assert backend_logic.get_item_details_by_model("TEST-06")["現在数量"] == 3
+
+
+def test_psycopg2_is_imported_only_when_postgresql_is_used(setup_db):
+    """起動を遅くしないよう、SQLiteで使うだけなら psycopg2 を読み込まないか？"""
+    import subprocess
+    import sys
+
+    code = (
+        "import sys, backend_logic;"
+        "backend_logic.DB_ENGINE = 'sqlite';"
+        f"backend_logic.DB_FILE = {TEST_DB_FILE!r};"
+        "backend_logic.warm_up();"
+        "print('psycopg2' in sys.modules)"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout
+    assert output.strip() == "False"
+    assert os.path.exists(TEST_DB_FILE)  # warm_up でテーブルまで作ってある
+
+
+def test_stock_alerts_are_recorded_only_when_reorder_point_is_crossed(setup_db):
+    """在庫数が発注点をまたいだときだけ、アラートが1件ずつ記録されるか？"""
+
+    def move(action, quantity):
+        return backend_logic.run_main_process_from_ui(
+            {
+                "処理種別": action,
+                "型番": "ALERT-01",
+                "製品名": "アラート製品",
+                "カテゴリ": "テスト",
+                "メーカー": "テスト社",
+                "数量": quantity,
+                "保管場所": "1",
+            }
+        )
+
+    assert backend_logic.set_reorder_point("NOPE", "5")["success"] is False
+    move("補充", "10")
+    assert backend_logic.set_reorder_point("ALERT-01", "５")["success"] is True
+    assert backend_logic.get_stock_alerts() == []  # 設定しただけでは下回っていない
+
+    move("使用", "3")  # 10 → 7（またがない）
+    move("使用", "2")  # 7 → 5（発注点以下になった）
+    move("使用", "1")  # 5 → 4（下回ったまま）
+    backend_logic.run_batch_process(
+        [
+            {"処理種別": "補充", "型番": "ALERT-01", "製品名": "アラート製品",
+             "カテゴリ": "テスト", "メーカー": "テスト社", "数量": "6", "保管場所": "1"},
+        ]
+    )  # 4 → 10（回復）
+
+    alerts = backend_logic.get_stock_alerts()
+    assert [(a["状態"], a["在庫数量"], a["発注点"]) for a in alerts] == [
+        ("不足", 5, 5),
+        ("回復", 10, 5),
+    ]
+    assert backend_logic.get_stock_alerts(after_id=alerts[0]["id"]) == alerts[1:]
+
+    # 既に下回っている型番に発注点を設定したら、その時点で「不足」になる
+    backend_logic.set_reorder_point("ALERT-01", "20")
+    assert backend_logic.get_stock_alerts(after_id=alerts[-1]["id"])[0]["状態"] == "不足"
+
+
+def test_stock_as_of_uses_checkpoints_and_later_history(setup_db):
+    """過去の時点の在庫数が、チェックポイントの有無にかかわらず同じに求まるか？"""
+
+    def move(model, action, quantity, at):
+        movement = {
+            "movement_id": f"{model}-{at}-{action}-{quantity}",
+            "日時": at,
+            "型番": model,
+            "製品名": "時点テスト",
+            "カテゴリ": "テスト",
+            "メーカー": "テスト社",
+            "数量": quantity,
+            "増減": -quantity if action == "使用" else quantity,
+            "保管場所": 1,
+        }
+        backend_logic.get_engine().apply_movements([movement])
+
+    move("AS-1", "補充", 10, datetime(2024, 1, 10))
+    move("AS-2", "補充", 5, datetime(2024, 1, 20))
+    move("AS-1", "使用", 4, datetime(2024, 2, 5))
+    move("AS-1", "使用", 1, datetime(2024, 2, 5))  # 同じ日時は追記順
+    move("AS-2", "補充", 7, datetime(2024, 3, 1))
+    move("AS-1", "補充", 2, datetime(2024, 3, 15))
+
+    expected = {
+        datetime(2024, 1, 15): {"AS-1": 10},
+        datetime(2024, 2, 5): {"AS-1": 5, "AS-2": 5},
+        datetime(2024, 3, 1): {"AS-1": 5, "AS-2": 12},
+        datetime(2024, 12, 31): {"AS-1": 7, "AS-2": 12},
+    }
+    without_checkpoints = {at: backend_logic.get_stock_as_of(at) for at in expected}
+
+    created = backend_logic.create_stock_checkpoints(until=datetime(2024, 3, 31))
+    assert created == [datetime(2024, 2, 1), datetime(2024, 3, 1)]
+    assert backend_logic.create_stock_checkpoints(until=datetime(2024, 3, 31)) == []
+
+    for at, stock in expected.items():
+        assert without_checkpoints[at] == stock
+        assert backend_logic.get_stock_as_of(at) == stock
+    assert backend_logic.get_stock_as_of(datetime(2024, 3, 1), "AS-2") == {"AS-2": 12}
+
+
+def test_stock_as_of_orders_same_second_movements_by_id_on_postgresql(postgres_db):
+    """PostgreSQLで、同じ日時の履歴が空き領域の再利用で前の場所に入っても、追記順に読むか？"""
+
+    def move(model, action, quantity):
+        movement = {
+            "movement_id": f"{model}-{action}-{quantity}",
+            "日時": datetime(2024, 2, 5, 10, 0, 0),
+            "型番": model,
+            "製品名": "時点テスト",
+            "カテゴリ": "テスト",
+            "メーカー": "テスト社",
+            "数量": quantity,
+            "増減": -quantity if action == "使用" else quantity,
+            "保管場所": 1,
+        }
+        backend_logic.get_engine().apply_movements([movement])
+
+    move("PG-GAP", "補充", 1)
+    move("PG-AS", "補充", 10)
+    move("PG-AS", "使用", 4)  # 10 → 6
+
+    # 先頭の行を消して VACUUM すると、次の行はその空いた場所（ctid の小さい方）に入る
+    conn, _ = backend_logic.get_db_connection()
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        if postgres_db == "wide":
+            cursor.execute("DELETE FROM history WHERE 型番 = 'PG-GAP'")
+            cursor.execute("VACUUM history")
+        else:
+            cursor.execute(
+                "DELETE FROM history_compact"
+                " WHERE item_id IN (SELECT id FROM history_items WHERE 型番 = 'PG-GAP')"
+            )
+            cursor.execute("VACUUM history_compact")
+    conn.close()
+
+    move("PG-AS", "使用", 1)  # 6 → 5（同じ日時）
+    at = datetime(2024, 2, 5, 10, 0, 0)
+    assert backend_logic.get_stock_as_of(at, "PG-AS") == {"PG-AS": 5}
+    assert backend_logic.get_stock_as_of(at) == {"PG-AS": 5}
+
+
+def test_app_creates_missing_future_history_partitions(postgres_db):
+    """先の月の履歴パーティションが無くなっても、アプリが次の入出庫の前に作り直すか？"""
+    parent = "history" if postgres_db == "wide" else "history_compact"
+    conn, _ = backend_logic.get_db_connection()
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT %s || '_' || to_char(now() + make_interval(months => %s), 'YYYYMM')",
+            (parent, backend_logic.HISTORY_MONTHS_AHEAD),
+        )
+        partition = cursor.fetchone()[0]
+        cursor.execute(f"DROP TABLE {partition}")
+
+        result = backend_logic.run_main_process_from_ui(
+            {
+                "処理種別": "補充",
+                "型番": "PART-1",
+                "製品名": "P",
+                "カテゴリ": "C",
+                "メーカー": "M",
+                "数量": "1",
+                "保管場所": "1",
+            }
+        )
+        assert result["success"] is True
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (partition,))
+        assert cursor.fetchone()[0]
+    conn.close()
+
+
+def test_incremental_export_picks_up_late_and_uncommitted_movements(postgres_db, tmp_path):
+    """差分書き出しで、古い日時で後から届いた入出庫・書き出し時にコミット前だった入出庫も抜けないか？"""
+    import export_data
+
+    def move(model, at):
+        backend_logic.get_engine().apply_movements(
+            [
+                {
+                    "movement_id": f"{model}-{at}",
+                    "日時": at,
+                    "型番": model,
+                    "製品名": "書き出しテスト",
+                    "カテゴリ": "テスト",
+                    "メーカー": "テスト社",
+                    "数量": 1,
+                    "増減": 1,
+                    "保管場所": 1,
+                }
+            ]
+        )
+
+    def export():
+        output = tmp_path / "history.jsonl"
+        count = export_data.export_table(
+            "history", str(output), fmt="jsonl", watermark_path=str(tmp_path / "wm")
+        )
+        lines = output.read_text(encoding="utf-8").splitlines() if count else []
+        return sorted(json.loads(line)["型番"] for line in lines)
+
+    move("EX-1", datetime(2024, 5, 2))
+    assert export() == ["EX-1"]
+    assert export() == []
+
+    # 端末のジャーナルから、前回より古い日時の入出庫が後から届いた
+    move("EX-0", datetime(2024, 5, 1))
+    assert export() == ["EX-0"]
+
+    # 書き込み中のトランザクションがある間は、区切りを決めずに見送る
+    conn, _ = backend_logic.get_db_connection()
+    with conn.cursor() as cursor:
+        cursor.execute(
+            "INSERT INTO history (日時, 型番, 数量, 在庫数量) VALUES ('2024-04-30', 'EX-SLOW', 1, 1)"
+        )
+        move("EX-2", datetime(2024, 5, 3))  # 別の接続で後から書いて先にコミットした
+        exporter, _ = backend_logic.get_db_connection()
+        with pytest.raises(ValueError):
+            export_data.committed_history_id(exporter, lock_timeout_ms=100)
+        exporter.close()
+    conn.commit()
+    conn.close()
+    assert export() == ["EX-2", "EX-SLOW"]
+
+
+def test_csv_import_keeps_locations_and_counts_popularity(postgres_db, tmp_path):
+    """CSVに保管場所が無い・空欄でも登録済みの保管場所を消さず、取り込んだ入出庫が人気度に入るか？"""
+    import import_csv
+
+    base = {"製品名": "P", "カテゴリ": "C", "メーカー": "M", "数量": "5", "処理種別": "補充"}
+    backend_logic.run_batch_process(
+        [dict(base, 型番="CSV-1", 保管場所="100"), dict(base, 型番="CSV-2", 保管場所="200")]
+    )
+    without_location = tmp_path / "without_location.csv"
+    without_location.write_text("型番,製品名,数量\nCSV-1,P,1\nCSV-1,P,1\n", encoding="utf-8")
+    blank_location = tmp_path / "blank_location.csv"
+    blank_location.write_text(
+        "型番,製品名,数量,保管場所\nCSV-2,P,1,300\nCSV-2,P,1,\n" + "CSV-3,Q,1,\n" * 4,
+        encoding="utf-8",
+    )
+
+    assert import_csv.import_csv(str(without_location))["imported"] == 2
+    assert import_csv.import_csv(str(blank_location))["imported"] == 6
+
+    assert backend_logic.get_item_details_by_model("CSV-1")["保管場所"] == 100
+    assert backend_logic.get_item_details_by_model("CSV-2")["保管場所"] == 300
+    assert backend_logic.get_item_details_by_model("CSV-3")["保管場所"] is None
+    # CSV-1・CSV-2 は 補充1回＋取り込み2行、CSV-3 は取り込み4行
+    assert backend_logic.get_autocomplete_suggestions("型番", "CSV") == ["CSV-3", "CSV-1", "CSV-2"]
+
+
+def test_concurrent_updates_lose_no_stock(setup_db):
+    """同じ型番に複数の端末から同時に更新実行しても、在庫数と履歴の合計がずれないか？"""
+    import load_test
+
+    result = load_test.run_load(
+        {
+            "run_id": "test",
+            "clients": 4,
+            "processes": False,
+            "duration": 1.0,
+            "keys": 5,
+            "zipf_s": 1.1,
+            "write_ratio": 0.8,
+            "think_ms": 0,
+            "seed": 1,
+        }
+    )
+
+    assert result["committed"] > 0
+    assert result["failed"] == {}
+    assert result["lost_updates"] == []
+    assert result["history_rows"] == result["history_rows_expected"]
@@ -0,0 +1,120 @@
+import os
+import sqlite3
+
+import pytest
+
+import backend_logic
+import inventory_browser
+
+# テスト用のDBファイル名
+TEST_DB_FILE = "test_browser_inventory.db"
+TEST_JOURNAL_FILE = "test_browser_write_journal.jsonl"
+
+
+def remove_test_db():
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(TEST_DB_FILE + suffix):
+            os.remove(TEST_DB_FILE + suffix)
+    for suffix in ("", ".done", ".rejected.jsonl"):
+        if os.path.exists(TEST_JOURNAL_FILE + suffix):
+            os.remove(TEST_JOURNAL_FILE + suffix)
+
+
+# ====================================================================
+# ⚙️ テストの準備と後片付け (フィクスチャ)
+# ====================================================================
+@pytest.fixture(scope="function")
+def catalog():
+    """
+    20品目を登録したSQLiteのDBを使う（カテゴリは3種類、うち2品目はカテゴリが NULL）
+    :return: 登録した行（"No." の順）
+    """
+    backend_logic.close_engine()
+    backend_logic.close_write_journal()
+    remove_test_db()
+    backend_logic.DB_ENGINE = "sqlite"
+    backend_logic.DB_FILE = TEST_DB_FILE
+    backend_logic.JOURNAL_FILE = TEST_JOURNAL_FILE
+
+    backend_logic.run_batch_process(
+        [
+            {
+                "処理種別": "補充",
+                "型番": f"BR-{i:02d}",
+                "製品名": f"製品{i % 7}",
+                "カテゴリ": f"C{i % 3}",
+                "メーカー": "M",
+                "数量": str(i % 5 + 1),
+                "保管場所": str(i % 4),
+            }
+            for i in range(20)
+        ]
+    )
+    conn = sqlite3.connect(TEST_DB_FILE)
+    with conn:
+        conn.execute("UPDATE inventory SET カテゴリ = NULL WHERE 型番 IN ('BR-03', 'BR-11')")
+    conn.close()
+
+    yield [dict(row) for row in backend_logic.get_inventory_page(limit=100)]
+
+    backend_logic.close_engine()
+    backend_logic.close_write_journal()
+    remove_test_db()
+
+
+# ====================================================================
+# ✅ ここからテストケース
+# ====================================================================
+
+
+def test_pages_follow_the_sort_order_and_cache_stays_bounded(catalog):
+    """並べ替え・絞り込みをDBでしたページを、どこから読んでも同じ並びで返し、覚えるページ数は一定か？"""
+    pager = inventory_browser.KeysetPager(
+        backend_logic, {"保管場所": "１"}, "カテゴリ", True, page_size=2, max_pages=2
+    )
+    expected = sorted(
+        (row for row in catalog if row["保管場所"] == 1),
+        key=lambda row: (row["カテゴリ"] or "", row["No."]),
+        reverse=True,
+    )
+    assert pager.total == len(expected) == 5
+
+    # 最後のページへ飛ぶ（OFFSETで直前の行のキーを探す）→ 先頭から順に読む
+    pager.load_page(2)
+    assert pager.rows(4, 5) == expected[4:5]
+    for page in range(3):
+        pager.load_page(page)
+    assert pager.rows(2, 6) == expected[2:5]
+    assert pager.missing_pages(0, 6) == [0]  # 2ページまでしか覚えない
+    assert pager.rows(0, 2) == [None, None]
+
+    # NULL のカテゴリも空文字として並び（同じ値の行は "No." の順）、飛ばされない
+    pager = inventory_browser.KeysetPager(backend_logic, {}, "カテゴリ", False, page_size=3)
+    for page in range(7):
+        pager.load_page(page)
+    expected = sorted(catalog, key=lambda row: (row["カテゴリ"] or "", row["No."]))
+    assert pager.rows(0, 20) == expected
+    assert {row["型番"] for row in expected[:2]} == {"BR-03", "BR-11"}
+
+
+def test_reorder_point_sorts_unset_items_first(catalog):
+    """発注点でも並べ替えでき、発注点の無い型番は設定した型番（0を含む）より前に並ぶか？"""
+    backend_logic.set_reorder_point("BR-05", "0")
+    backend_logic.set_reorder_point("BR-01", "3")
+    pager = inventory_browser.KeysetPager(backend_logic, {}, "発注点", True, page_size=4)
+    for page in range(5):
+        pager.load_page(page)
+    assert [row["型番"] for row in pager.rows(0, 2)] == ["BR-01", "BR-05"]
+    unset = [row for row in catalog if row["型番"] not in ("BR-01", "BR-05")]
+    assert pager.rows(2, 20) == sorted(unset, key=lambda row: row["No."], reverse=True)
+
+
+def test_invalid_filters_and_sort_columns_are_rejected(catalog):
+    """絞り込めない列・数字でない保管場所・並べ替えできない列は ValueError になるか？"""
+    assert backend_logic.count_inventory({"メーカー": " ", "カテゴリ": "C1"}) == 7
+    with pytest.raises(ValueError):
+        backend_logic.count_inventory({"型番": "BR-01"})
+    with pytest.raises(ValueError):
+        backend_logic.count_inventory({"保管場所": "棚A"})
+    with pytest.raises(ValueError):
+        backend_logic.get_inventory_page(sort_column="製品名; DROP TABLE inventory")
@@ -0,0 +1,87 @@
+import os
+import threading
+
+import pytest
+
+import backend_logic
+import inventory_client
+import inventory_server
+
+# テスト用のDBファイル名
+TEST_DB_FILE = "test_server_inventory.db"
+TEST_JOURNAL_FILE = "test_server_write_journal.jsonl"
+
+
+def remove_test_db():
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(TEST_DB_FILE + suffix):
+            os.remove(TEST_DB_FILE + suffix)
+    for suffix in ("", ".done", ".rejected.jsonl"):
+        if os.path.exists(TEST_JOURNAL_FILE + suffix):
+            os.remove(TEST_JOURNAL_FILE + suffix)
+
+
+# ====================================================================
+# ⚙️ テストの準備と後片付け (フィクスチャ)
+# ====================================================================
+@pytest.fixture(scope="function")
+def server_url():
+    """空のSQLiteのDBを使う共有サーバーを localhost の空いているポートで動かす"""
+    backend_logic.close_engine()
+    backend_logic.close_write_journal()
+    remove_test_db()
+    backend_logic.DB_ENGINE = "sqlite"
+    backend_logic.DB_FILE = TEST_DB_FILE
+    backend_logic.JOURNAL_FILE = TEST_JOURNAL_FILE
+
+    server = inventory_server.make_server(port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+
+    server.shutdown()
+    server.server_close()
+    backend_logic.close_engine()
+    backend_logic.close_write_journal()
+    remove_test_db()
+
+
+# ====================================================================
+# ✅ ここからテストケース
+# ====================================================================
+
+
+def test_client_reads_and_writes_through_the_shared_server(server_url):
+    """別の端末の登録が、サーバーの共有索引・DBを通してすぐに見えるか？"""
+    first = inventory_client.InventoryClient(server_url)
+    second = inventory_client.InventoryClient(server_url)
+    first.warm_up()
+
+    base = {"製品名": "ボルト", "カテゴリ": "C", "メーカー": "M", "保管場所": "1"}
+    results = first.run_batch_process(
+        [
+            dict(base, 処理種別="補充", 型番="SV-1", 数量="５"),
+            dict(base, 処理種別="補充", 型番="SV-2", 数量="abc"),
+        ]
+    )
+    assert results[0]["success"] and results[0]["在庫数量"] == 5
+    assert not results[1]["success"]
+
+    assert second.get_suggestions("型番", "SV") == ["SV-1"]
+    assert second.get_item_details_by_model("SV-1")["現在数量"] == 5
+    assert second.get_item_details_by_model("NONE") is None
+    used = second.run_main_process_from_ui(dict(base, 処理種別="使用", 型番="SV-1", 数量="2"))
+    assert used["在庫数量"] == 3
+
+    with pytest.raises(ValueError):
+        second.get_suggestions("保管場所", "1")
+
+
+def test_unreachable_server_fails_writes_without_raising():
+    """サーバーにつながらないときの書き込みは、全件を失敗として返すか？"""
+    client = inventory_client.InventoryClient("http://127.0.0.1:9", timeout=1)
+    results = client.run_batch_process([{"型番": "A"}, {"型番": "B"}])
+    assert [result["success"] for result in results] == [False, False]
+    with pytest.raises(OSError):
+        client.get_item_details_by_model("A")
@@ -0,0 +1,156 @@
+import socket
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import item_cache
+
+
+# ====================================================================
+# ⚙️ テストの準備と後片付け (フィクスチャ)
+# ====================================================================
+class FakeConnection:
+    """
+    LISTEN 用の接続の代わり（psycopg2 の接続のうち ItemDetailCache が使う部分だけ）
+    notify() で送った通知は、select() で読めるようになり、poll() で notifies に入る
+    """
+
+    def __init__(self):
+        self._reader, self._writer = socket.socketpair()
+        self._pending = []
+        self.notifies = []
+        self.autocommit = False
+        self.executed = []
+
+    def fileno(self):
+        return self._reader.fileno()
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql):
+        self.executed.append(sql)
+
+    def notify(self, payload):
+        self._pending.append(SimpleNamespace(payload=payload))
+        self._writer.send(b"!")
+
+    def poll(self):
+        self._reader.setblocking(False)
+        try:
+            self._reader.recv(1024)
+        except BlockingIOError:
+            pass
+        self.notifies.extend(self._pending)
+        self._pending.clear()
+
+    def close(self):
+        self._reader.close()
+        self._writer.close()
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "待ち時間を過ぎました"
+        time.sleep(0.005)
+
+
+@pytest.fixture(scope="function")
+def listening_cache(monkeypatch):
+    """通知を受け取っている状態のキャッシュ（最大2件・TTL 10秒・時計は手で進める）"""
+    monkeypatch.setattr(item_cache, "LISTEN_POLL_INTERVAL", 0.05)
+    clock = FakeClock()
+    monkeypatch.setattr(item_cache, "time", clock)
+    conn = FakeConnection()
+    cache = item_cache.ItemDetailCache(lambda: conn, max_size=2, ttl=10.0)
+    cache.start()
+    wait_until(lambda: cache.stats()["listening"])
+
+    yield cache, conn, clock
+
+    cache.stop()
+
+
+def loader(calls):
+    def load(model_number):
+        calls.append(model_number)
+        return {"型番": model_number, "現在数量": len(calls)}
+
+    return load
+
+
+# ====================================================================
+# ✅ ここからテストケース
+# ====================================================================
+
+
+def test_least_recently_used_item_is_evicted_and_ttl_expires(listening_cache):
+    """最大数を超えたら一番使われていない型番から捨て、TTLを過ぎた型番は読み直すか？"""
+    cache, _, clock = listening_cache
+    calls = []
+    load = loader(calls)
+
+    cache.get("A", load)
+    cache.get("B", load)
+    assert cache.get("A", load) == {"型番": "A", "現在数量": 1}  # ヒット（A が新しくなる）
+    cache.get("C", load)  # B が捨てられる
+    assert cache.stats()["evictions"] == 1
+
+    cache.get("A", load)
+    cache.get("B", load)
+    assert calls == ["A", "B", "C", "B"]
+
+    # 返した辞書を書き換えても、キャッシュの中身は変わらない
+    cache.get("B", load)["現在数量"] = -1
+    assert cache.get("B", load)["現在数量"] == 4
+
+    clock.now += 10.0
+    cache.get("B", load)
+    assert calls[-1] == "B" and len(calls) == 5
+
+
+def test_store_after_invalidation_is_dropped(listening_cache):
+    """読み込み中に変更通知が届いたら、読んだ（古いかもしれない）値を覚えないか？"""
+    cache, conn, _ = listening_cache
+
+    value, generation = cache.lookup("A")
+    assert value is item_cache.MISSING
+    invalidations = cache.stats()["invalidations"]
+    conn.notify("A")  # 他のPCが更新した
+    wait_until(lambda: cache.stats()["invalidations"] > invalidations)
+    cache.store("A", {"型番": "A", "現在数量": 1}, generation)
+    assert cache.lookup("A")[0] is item_cache.MISSING
+
+    # 通知の後に読み直した値は覚える。"*" が届いたら全部捨てる
+    value, generation = cache.lookup("A")
+    cache.store("A", {"型番": "A", "現在数量": 2}, generation)
+    assert cache.lookup("A")[0] == {"型番": "A", "現在数量": 2}
+    conn.notify(item_cache.INVALIDATE_ALL)
+    wait_until(lambda: cache.stats()["size"] == 0)
+    assert conn.executed[0] == f"LISTEN {item_cache.NOTIFY_CHANNEL}"
+
+
+def test_nothing_is_cached_until_listening():
+    """LISTEN できるまでは、毎回DBを読んで何も覚えないか？"""
+    cache = item_cache.ItemDetailCache(FakeConnection)
+    calls = []
+    cache.get("A", loader(calls))
+    cache.get("A", loader(calls))
+    assert calls == ["A", "A"]
+    assert cache.stats()["size"] == 0
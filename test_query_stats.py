@@ -0,0 +1,48 @@
+import logging
+
+import query_stats
+
+
+# ====================================================================
+# ✅ ここからテストケース
+# ====================================================================
+
+
+def test_histogram_percentiles_and_rolling_window():
+    """区切りごとの件数からパーセンタイルが出て、古い区切りは捨てられるか？"""
+    histogram = query_stats.RollingHistogram(window_seconds=60, window_count=2)
+    for _ in range(98):
+        histogram.add(0.3, now=0)
+    histogram.add(40, now=0)
+    histogram.add(700, now=0)
+
+    summary = histogram.summary(now=0)
+    assert summary["count"] == 100
+    assert summary["p50_ms"] == 0.5  # 0.3ms は「0.5ms以下」の区切りに入る
+    assert summary["p99_ms"] == 50
+    assert summary["max_ms"] == 700
+
+    # 2区切り（2分）より前の分は集計から外れる
+    histogram.add(1.5, now=180)
+    assert histogram.summary(now=180)["count"] == 1
+
+
+def test_track_records_phases_rows_and_slow_log(caplog):
+    """内訳・行数が処理ごとに集計され、遅い処理だけログに出るか？"""
+    stats = query_stats.QueryStats(slow_query_ms=0)
+
+    with caplog.at_level(logging.WARNING, logger="query_stats"):
+        with stats.track("item_details"):
+            with query_stats.phase("execute"):
+                query_stats.add_rows(3)
+
+    # 計測中でなければ何もしない
+    with query_stats.phase("execute"):
+        query_stats.add_rows(5)
+
+    report = stats.report()["item_details"]
+    assert report["calls"] == 1
+    assert report["rows"] == 3
+    assert report["slow"] == 1
+    assert report["execute"]["count"] == 1
+    assert "遅い処理: item_details" in caplog.text
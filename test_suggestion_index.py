@@ -0,0 +1,154 @@
+import suggestion_index
+
+
+# ====================================================================
+# ⚙️ テスト用のダミーデータ
+# ====================================================================
+def make_rows():
+    return [
+        {"No.": 1, "型番": "AB-100", "製品名": "ボルト", "カテゴリ": "部品", "メーカー": "A社"},
+        {"No.": 2, "型番": "AB-200", "製品名": "ナット", "カテゴリ": "部品", "メーカー": "B社"},
+        {"No.": 3, "型番": "CD-100", "製品名": "ワッシャ", "カテゴリ": "部品", "メーカー": "A社"},
+    ]
+
+
+def make_index(rows, popularity=(), fuzzy=(), **kwargs):
+    """DBの代わりに rows（と人気度の行 popularity、あいまい検索の結果 fuzzy）を返す索引を作る"""
+    fallback_calls = []
+
+    def iter_rows(last_no):
+        return sorted((row for row in rows if row["No."] > last_no), key=lambda row: row["No."])
+
+    def iter_popularity(version):
+        return [row for row in popularity if row["版"] > version]
+
+    def fallback(column_name, search_term):
+        fallback_calls.append((column_name, search_term))
+        return ["DB"]
+
+    index = suggestion_index.SuggestionIndex(
+        iter_rows_func=iter_rows,
+        iter_popularity_func=iter_popularity,
+        fallback_func=fallback,
+        fuzzy_func=lambda column_name, search_term, limit: list(fuzzy),
+        refresh_interval=0,
+        **kwargs,
+    )
+    return index, fallback_calls
+
+
+# ====================================================================
+# ✅ ここからテストケース
+# ====================================================================
+
+
+def test_prefix_search_is_sorted_and_distinct():
+    """前方一致の候補が重複なし・昇順で返るか？"""
+    index, _ = make_index(make_rows())
+
+    assert index.get_suggestions("型番", "AB") == ["AB-100", "AB-200"]
+    assert index.get_suggestions("メーカー", "A") == ["A社"]
+    assert index.get_suggestions("型番", "ZZ") == []
+
+
+def test_incremental_refresh_picks_up_new_rows():
+    """後から増えた行が差分取り込みで候補に出るか？"""
+    rows = make_rows()
+    index, _ = make_index(rows)
+    assert index.get_suggestions("型番", "EF") == []
+
+    rows.append({"No.": 4, "型番": "EF-1", "製品名": "ピン", "カテゴリ": "部品", "メーカー": "C社"})
+
+    assert index.get_suggestions("型番", "EF") == ["EF-1"]
+
+
+def test_rows_committed_late_with_a_smaller_no_are_picked_up(monkeypatch):
+    """大きい "No." の行を取り込んだ後に、小さい "No." の行がコミットされても候補に出るか？"""
+    clock = [1000.0]
+    monkeypatch.setattr(suggestion_index.time, "monotonic", lambda: clock[0])
+    rows = make_rows()
+    requested = []
+    index, _ = make_index(rows)
+    iter_rows = index.iter_rows_func
+    index.iter_rows_func = lambda last_no: requested.append(last_no) or iter_rows(last_no)
+    index.refresh()
+
+    rows.append({"No.": 5, "型番": "EF-5", "製品名": "ピン", "カテゴリ": "部品", "メーカー": "C社"})
+    assert index.get_suggestions("型番", "EF") == ["EF-5"]
+    # このPCで登録した値（"No." 付き）を入れても、差分の読み始めは変わらない
+    index.add_item({"No.": 9, "型番": "EF-9", "製品名": "ピン", "カテゴリ": "部品", "メーカー": "C社"})
+    rows.append({"No.": 4, "型番": "EF-4", "製品名": "ピン", "カテゴリ": "部品", "メーカー": "C社"})
+    clock[0] += 1.0
+    assert index.get_suggestions("型番", "EF") == ["EF-4", "EF-5", "EF-9"]
+    assert requested == [0, 3, 3]
+
+    # RESCAN_WINDOW を過ぎたら、その時点までに読み終えた位置から読む
+    clock[0] += suggestion_index.RESCAN_WINDOW
+    index.refresh()
+    assert requested[-1] == 5
+
+
+def test_limit():
+    """候補数が上限で打ち切られるか？"""
+    index, _ = make_index(make_rows(), limit=1)
+
+    assert index.get_suggestions("型番", "AB") == ["AB-100"]
+
+
+def test_memory_budget_falls_back_to_db():
+    """メモリ予算を超えたらDB検索に切り替わるか？"""
+    index, fallback_calls = make_index(make_rows(), memory_budget=0)
+
+    assert index.get_suggestions("型番", "AB") == ["DB"]
+    assert fallback_calls == [("型番", "AB")]
+    assert index.disabled_columns() == set(suggestion_index.INDEXED_COLUMNS)
+
+
+def test_cached_top_prefixes_count_towards_memory_budget(monkeypatch):
+    """覚えた接頭辞の上位もメモリ使用量に入り、予算を超えたら列ごと捨てる前に上位を捨てるか？"""
+    monkeypatch.setattr(suggestion_index, "RANK_SCAN_LIMIT", 1)
+    rows = make_rows()
+    popularity = [dict(rows[0], 人気度=1.0, 版=1)]
+    index, _ = make_index(rows, popularity)
+    index.refresh()
+    before = index.memory_usage()["型番"]
+
+    assert index.get_suggestions("型番", "AB") == ["AB-100", "AB-200"]
+    assert index.memory_usage()["型番"] > before
+
+    index.memory_budget = sum(index.memory_usage().values()) - 1
+    assert index.get_suggestions("型番", "A") == ["AB-100", "AB-200"]
+    assert index.memory_usage()["型番"] == before
+    assert index.disabled_columns() == set()
+
+
+def test_popular_values_come_first_and_stay_ranked(monkeypatch):
+    """よく動く型番が先に出て、人気度が上がると覚えておいた上位も並び替わるか？"""
+    # 前方一致が2件を超えたら、接頭辞ごとの上位を覚えて使う
+    monkeypatch.setattr(suggestion_index, "RANK_SCAN_LIMIT", 2)
+    rows = make_rows()
+    popularity = [
+        dict(rows[1], 人気度=1.0, 版=1),  # AB-200（ナット・B社）
+        dict(rows[2], 人気度=2.0, 版=2),  # CD-100（ワッシャ・A社）
+    ]
+    index, _ = make_index(rows, popularity)
+
+    assert index.get_suggestions("型番", "AB") == ["AB-200", "AB-100"]
+    assert index.get_suggestions("カテゴリ", "部") == ["部品"]
+    # 3件が前方一致する接頭辞（覚えた上位を使う）
+    rows.append({"No.": 4, "型番": "A", "製品名": "ナット", "カテゴリ": "部品", "メーカー": "A社"})
+    assert index.get_suggestions("型番", "A") == ["AB-200", "A", "AB-100"]
+
+    popularity.append(dict(rows[0], 人気度=3.0, 版=3))  # AB-100 がよく動くようになった
+    assert index.get_suggestions("型番", "A") == ["AB-100", "AB-200", "A"]
+
+
+def test_fuzzy_matches_fill_up_after_prefix_matches():
+    """製品名は前方一致のあとに、あいまい検索の結果が重複なしで続くか？"""
+    rows = make_rows()
+    rows.append({"No.": 4, "型番": "EF-1", "製品名": "ナット小", "カテゴリ": "部品", "メーカー": "C社"})
+    index, _ = make_index(rows, fuzzy=["ナット小", "六角ナット"], limit=2)
+
+    assert index.get_suggestions("製品名", "ナ") == ["ナット", "ナット小"]
+    assert index.get_suggestions("製品名", "ナット小") == ["ナット小", "六角ナット"]
+    assert index.get_suggestions("型番", "EF") == ["EF-1"]  # 型番はあいまい検索しない
@@ -0,0 +1,53 @@
+import queue
+import threading
+
+import pytest
+
+import write_behind
+
+
+# ====================================================================
+# ✅ ここからテストケース
+# ====================================================================
+
+
+def test_close_together_submissions_are_group_committed_in_order():
+    """続けて送った入出庫が1回にまとめられ、受け付けた順の結果が返るか？"""
+    batches = []
+
+    def apply_batch(inputs):
+        batches.append(list(inputs))
+        return [{"success": True, "在庫数量": value} for value in inputs]
+
+    writer = write_behind.WriteBehindQueue(apply_batch, group_window=0.2)
+    futures = [writer.submit(value) for value in range(5)]
+    writer.close()
+
+    assert batches == [[0, 1, 2, 3, 4]]
+    assert [future.result()["在庫数量"] for future in futures] == [0, 1, 2, 3, 4]
+
+
+def test_queue_is_bounded_and_errors_reach_every_submission():
+    """送信待ちが上限を超えたら断り、書き込みの例外は全件の Future に届くか？"""
+    started = threading.Event()
+    release = threading.Event()
+
+    def apply_batch(inputs):
+        started.set()
+        release.wait()
+        raise RuntimeError("DB error")
+
+    writer = write_behind.WriteBehindQueue(
+        apply_batch, max_pending=2, group_window=0, max_group=1
+    )
+    first = writer.submit("a")
+    started.wait(5)  # 書き込みスレッドが1件目を取り出して止まる
+    queued = [writer.submit("b"), writer.submit("c")]
+    with pytest.raises(queue.Full):
+        writer.submit("d")
+
+    release.set()
+    writer.close()
+    for future in [first] + queued:
+        with pytest.raises(RuntimeError):
+            future.result()
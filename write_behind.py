@@ -0,0 +1,108 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+MAX_PENDING = 100  # 送信待ちにできる入出庫の数（これを超えたら受け付けない）
+GROUP_COMMIT_WINDOW = 0.005  # 最初の1件からこの秒数の間に来たものは1トランザクションにまとめる
+MAX_GROUP_SIZE = 50  # 1トランザクションにまとめる最大件数
+
+_STOP = object()
+
+
+# ==================================================================================
+# 裏での書き込み（ライトビハインド）
+# ==================================================================================
+class WriteBehindQueue:
+    """
+    「更新実行」の入出庫を受け取ってすぐに返し、裏のスレッドで順番にDBへ書く
+
+    - 画面のスレッドはトランザクションの完了を待たない（submit は Future を返すだけ）
+    - 続けて押された分は GROUP_COMMIT_WINDOW 秒待ってまとめ、1トランザクションで書く
+    - 書き込みスレッドは1本なので、受け付けた順に反映される
+    """
+
+    def __init__(
+        self,
+        apply_batch_func,
+        max_pending=MAX_PENDING,
+        group_window=GROUP_COMMIT_WINDOW,
+        max_group=MAX_GROUP_SIZE,
+    ):
+        """
+        :param apply_batch_func: 入力のリストを受け取り、同じ順の結果のリストを返す関数
+            （backend_logic.run_batch_process）
+        """
+        self._apply_batch = apply_batch_func
+        self.group_window = group_window
+        self.max_group = max_group
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._in_flight = 0
+        self._thread = threading.Thread(
+            target=self._run, name="write-behind", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, input_data):
+        """
+        入出庫を送信待ちに並べる。結果（run_main_process_from_ui と同じ形）は Future で受け取る
+        送信待ちがいっぱいなら queue.Full を投げる
+        """
+        future = Future()
+        self._queue.put_nowait((input_data, future))
+        return future
+
+    def pending_count(self):
+        """送信待ち＋書き込み中の件数"""
+        return self._queue.qsize() + self._in_flight
+
+    def close(self, timeout=None):
+        """受け付け済みの分を書き終えてから、書き込みスレッドを止める"""
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    # ---------------------------------------------------------
+    # 書き込みスレッド
+    # ---------------------------------------------------------
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+
+            group = [item]
+            deadline = time.monotonic() + self.group_window
+            while len(group) < self.max_group:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                group.append(item)
+
+            self._commit(group)
+
+    def _commit(self, group):
+        self._in_flight = len(group)
+        futures = [future for _, future in group]
+        for future in futures:
+            future.set_running_or_notify_cancel()
+        try:
+            results = self._apply_batch([input_data for input_data, _ in group])
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+        else:
+            for future, result in zip(futures, results):
+                future.set_result(result)
+        finally:
+            self._in_flight = 0
@@ -0,0 +1,221 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+# ==================================================================================
+# 設定
+# ==================================================================================
+REPLAY_BATCH_SIZE = 200  # 1トランザクションで送る件数
+RETRY_DELAY = 5.0  # DBにつながらないとき、次に送り直すまでの秒数
+
+
+# ==================================================================================
+# 未送信の入出庫の記録（オフライン用ジャーナル）
+# ==================================================================================
+class WriteJournal:
+    """
+    DBに書けなかった入出庫をローカルのファイルに追記しておき、
+    つながったら裏のスレッドで古い順にまとめて送る
+
+    - 1件追記するたびに fsync するので、追記が終わった入出庫は停電でも消えない
+    - どこまで送ったかは <ジャーナル>.done に書く
+      送信後・記録前に落ちると同じ入出庫をもう一度送るが、
+      各入出庫の movement_id をDBが覚えていて2回目は無視するので、反映はちょうど1回になる
+    - 全部送り終わったらファイルを空にする
+    - 何度送ってもDBに拒否される行（値が不正など）は <ジャーナル>.rejected.jsonl に移して先へ進む
+    """
+
+    def __init__(
+        self,
+        path,
+        apply_batch_func,
+        is_unavailable_func,
+        batch_size=REPLAY_BATCH_SIZE,
+        retry_delay=RETRY_DELAY,
+    ):
+        """
+        :param path: ジャーナルのファイル
+        :param apply_batch_func: 入出庫のリストを1トランザクションで反映する関数
+        :param is_unavailable_func: 例外が「DBにつながらない」ものかを返す関数
+            （そうなら後で送り直し、そうでなければその行を諦める）
+        """
+        self.path = path
+        self.done_path = path + ".done"
+        self.rejected_path = path + ".rejected.jsonl"
+        self._apply_batch = apply_batch_func
+        self._is_unavailable = is_unavailable_func
+        self.batch_size = batch_size
+        self.retry_delay = retry_delay
+
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()  # 同じ行を2回送って2回進めないよう、送信は1つずつ
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # 未送信の (入出庫, その行の終わりの位置)
+        self._pending = []
+        self._load()
+
+    # ---------------------------------------------------------
+    # 追記
+    # ---------------------------------------------------------
+    def append(self, movements):
+        """入出庫をファイルに追記し、ディスクに書き終わってから戻る"""
+        lines = "".join(
+            json.dumps(_encode(movement), ensure_ascii=False) + "\n"
+            for movement in movements
+        ).encode("utf-8")
+        with self._lock:
+            with open(self.path, "ab") as f:
+                start = f.tell()
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            for movement, line in zip(movements, lines.splitlines(keepends=True)):
+                start += len(line)
+                self._pending.append((movement, start))
+        self._wakeup.set()
+
+    def has_pending(self):
+        """未送信の入出庫があるか（あれば順番を守るため、新しい入出庫もジャーナルに回す）"""
+        with self._lock:
+            return bool(self._pending)
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    # ---------------------------------------------------------
+    # 送信（裏のスレッド）
+    # ---------------------------------------------------------
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._replay_loop, name="write-journal-replayer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.retry_delay + 1)
+            self._thread = None
+
+    def _replay_loop(self):
+        while not self._stop.is_set():
+            self._wakeup.clear()
+            try:
+                sent = self.replay_once()
+            except Exception:
+                logging.error("未送信の入出庫の送信に失敗しました", exc_info=True)
+                sent = None
+            if sent is None:
+                self._stop.wait(self.retry_delay)  # DBにつながらない
+            elif sent == 0:
+                self._wakeup.wait()  # 送るものが無い（追記されたら起こされる）
+
+    def replay_once(self):
+        """
+        未送信の先頭から batch_size 件を送る
+        :return: 送った（または諦めた）件数。DBにつながらなければ None
+        """
+        with self._replay_lock:
+            return self._replay_batch()
+
+    def _replay_batch(self):
+        with self._lock:
+            batch = self._pending[: self.batch_size]
+        if not batch:
+            return 0
+
+        try:
+            self._apply_batch([movement for movement, _ in batch])
+        except Exception as e:
+            if self._is_unavailable(e):
+                return None
+            # どの行がだめか分からないので、1件ずつ送り直して不正な行だけ外す
+            for movement, _ in batch:
+                try:
+                    self._apply_batch([movement])
+                except Exception as e:
+                    if self._is_unavailable(e):
+                        return None
+                    self._reject(movement, e)
+                # 1件ずつ進めておく（途中でつながらなくなっても、送った分は送り直さない）
+                self._advance(1)
+            return len(batch)
+
+        self._advance(len(batch))
+        return len(batch)
+
+    # ---------------------------------------------------------
+    # 内部処理
+    # ---------------------------------------------------------
+    def _advance(self, count):
+        """先頭の count 件を送信済みにする"""
+        with self._lock:
+            done, self._pending = self._pending[:count], self._pending[count:]
+            if self._pending:
+                _write_atomic(self.done_path, str(done[-1][1]))
+                return
+            # 全部送り終わったら空にする
+            # 先に .done を戻しておけば、間で落ちても全件を送り直すだけ（DB側で無視される）
+            _write_atomic(self.done_path, "0")
+            with open(self.path, "wb") as f:
+                os.fsync(f.fileno())
+
+    def _reject(self, movement, error):
+        logging.error(f"反映できない入出庫を除外しました: {movement.get('型番')} ({error})")
+        with open(self.rejected_path, "a", encoding="utf-8") as f:
+            record = dict(_encode(movement), 理由=str(error))
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _load(self):
+        """前回の起動で送りきれなかった分を読み込む"""
+        if not os.path.exists(self.path):
+            return
+        offset = 0
+        if os.path.exists(self.done_path):
+            with open(self.done_path, encoding="utf-8") as f:
+                offset = int(f.read().strip() or 0)
+
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if offset > len(data):
+            offset = 0  # 空にした直後に落ちた
+
+        position = offset
+        for line in data[offset:].splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break  # 書きかけで落ちた行（追記は完了していないので、受け付けていない）
+            position += len(line)
+            self._pending.append((_decode(json.loads(line)), position))
+
+        if position < len(data):
+            with open(self.path, "r+b") as f:
+                f.truncate(position)
+                os.fsync(f.fileno())
+
+
+def _encode(movement):
+    return dict(movement, 日時=movement["日時"].isoformat(sep=" "))
+
+
+def _decode(record):
+    return dict(record, 日時=datetime.fromisoformat(record["日時"]))
+
+
+def _write_atomic(path, text):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)